@@ -10,16 +10,16 @@ import logging
 from services.config import AppConfig
 from services.app_service import AppService
 
-# 设置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger("VLMApp")
 
 
 def main():
     """主函数，程序入口点"""
+    # 设置日志
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
     parser = argparse.ArgumentParser(
         description="VLM Demo 应用 - 危险行为检测",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -54,6 +54,12 @@ def main():
         default=10, 
         help="危险行为分析间隔(秒) (默认: 10)"
     )
+    parser.add_argument(
+        "--trigger-interval", 
+        type=float, 
+        default=10.0, 
+        help="传感器触发的立即分析之间的最小间隔(秒) (默认: 10)"
+    )
     parser.add_argument(
         "--model", 
         type=str, 
@@ -66,12 +72,24 @@ def main():
         default="0", 
         help="视频源: 0表示默认摄像头，其他数字表示摄像头索引，字符串表示视频文件路径 (默认: 0)"
     )
+    parser.add_argument(
+        "--camera-id", 
+        type=str, 
+        default="default", 
+        help="摄像头标识，保存在分析记录中用于按摄像头查询 (默认: default)"
+    )
     parser.add_argument(
         "--vllm-url", 
         type=str, 
         default="http://localhost:11434/v1/completions", 
         help="vLLM API的URL (默认: http://localhost:11434/v1/completions)"
     )
+    parser.add_argument(
+        "--retention-days", 
+        type=int, 
+        default=30, 
+        help="分析记录保留完整内容的天数，更早的记录合并为摘要，0表示不清理 (默认: 30)"
+    )
     parser.add_argument(
         "--enable-rs485", 
         action="store_true", 
@@ -101,6 +119,17 @@ def main():
         default=0x01, 
         help="灯光控制设备地址 (默认: 0x01)"
     )
+    parser.add_argument(
+        "--rs485-devices", 
+        type=str, 
+        default=None, 
+        help="RS485设备登记表JSON文件（默认只轮询光照传感器）"
+    )
+    parser.add_argument(
+        "--rs485-async", 
+        action="store_true", 
+        help="使用异步Modbus客户端（一个事件循环并发轮询所有设备）"
+    )
     parser.add_argument(
         "--lux-topic", 
         type=str, 
@@ -132,26 +161,35 @@ def main():
     config.port = args.port
     config.host = args.host
     config.description_interval = args.description_interval
+    config.trigger_min_interval = args.trigger_interval
     config.model_name = args.model
     config.video_source = args.video_source
+    config.camera_id = args.camera_id
+    config.retention_days = args.retention_days
     config.vllm_url = args.vllm_url
     config.enable_rs485_direct = args.enable_rs485_direct
     config.rs485_port = args.rs485_port
     config.rs485_baud = args.rs485_baud
     config.lux_sensor_addr = args.lux_sensor_addr
     config.light_control_addr = args.light_control_addr
+    config.rs485_devices_path = args.rs485_devices
+    config.rs485_async = args.rs485_async
     
     # 创建应用服务
     app_service = AppService(config)
     
     try:
         # 初始化组件
+        app_service.initialize_database()
         app_service.initialize_rs485_components()
         app_service.initialize_video_streamer()
         
         # 启动RS485数据发送器
         app_service.start_rs485_data_sender()
         
+        # 启动后台数据保留任务
+        app_service.start_retention_job()
+        
         # 启动视频流传输
         app_service.start_video_streaming()
         
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+分析历史接口延迟测试
+
+在临时数据库中生成大量合成分析记录（默认2000万条，多个摄像头，约2%为危险记录），
+测量 /analyses 分页查询（第一页、深翻页、各种过滤条件）和 /analyses/summary 的延迟。
+数据库写入临时文件，不影响 data/vlm_demo.db
+
+生成数据时暂时去掉全文索引触发器（与本测试无关，且会使生成时间增加数倍），
+组合索引和计数表触发器保持不变
+
+用法:
+  python benchmarks/bench_analysis_history.py --records 20000000 --queries 50
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK = 1000000
+
+
+def generate_records(db_path, count, cameras, interval):
+    """用递归CTE批量生成记录"""
+    start = datetime.now() - timedelta(seconds=count * interval)
+    from models.database import register_sql_functions
+
+    connection = sqlite3.connect(db_path)
+    # 描述去重压缩触发器使用的SQL函数
+    register_sql_functions(connection)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=OFF")
+    for trigger in ('analysis_fts_ai', 'analysis_fts_ad', 'analysis_fts_au'):
+        connection.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+    began = time.perf_counter()
+    for offset in range(0, count, CHUNK):
+        rows = min(CHUNK, count - offset)
+        connection.execute(f"""
+            WITH RECURSIVE seq(n) AS (SELECT {offset} UNION ALL SELECT n + 1 FROM seq WHERE n < {offset + rows - 1})
+            INSERT INTO analysis_records (date, description, danger, camera_id)
+            SELECT strftime('%Y-%m-%d %H:%M:%f000', :start, '+' || (n * {interval}) || ' seconds'),
+                   'Synthetic analysis record ' || (n % 1000),
+                   (abs(random()) % 50) = 0,
+                   'camera-' || (n % {cameras})
+            FROM seq
+        """, {'start': start.strftime('%Y-%m-%d %H:%M:%S')})
+        connection.commit()
+        print(f"  {offset + rows} / {count} ({time.perf_counter() - began:.0f}s)", flush=True)
+    connection.execute("ANALYZE")
+    connection.close()
+    return start, time.perf_counter() - began
+
+
+def measure(fn, queries):
+    """多次调用并返回 (p50, p95) 毫秒"""
+    latencies = []
+    for _ in range(queries):
+        began = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - began) * 1000)
+    latencies.sort()
+    return statistics.median(latencies), latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分析历史接口延迟测试')
+    parser.add_argument('--records', type=int, default=20000000, help='合成记录数量')
+    parser.add_argument('--cameras', type=int, default=4, help='摄像头数量')
+    parser.add_argument('--interval', type=float, default=1.0, help='相邻记录的时间间隔（秒）')
+    parser.add_argument('--queries', type=int, default=50, help='每种查询的次数')
+    parser.add_argument('--pages', type=int, default=200, help='深翻页测试连续翻的页数')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='vlm_history_bench_')
+    os.environ['VLM_DB_PATH'] = os.path.join(tmp_dir, 'bench.db')
+    sys.path.insert(0, REPO_ROOT)
+
+    # 创建表、索引和触发器
+    from models.analysis_history import AnalysisHistory
+    from models.database import init_db
+    init_db()
+
+    print(f"生成 {args.records} 条记录到 {os.environ['VLM_DB_PATH']} ...")
+    start, elapsed = generate_records(os.environ['VLM_DB_PATH'], args.records, args.cameras, args.interval)
+    print(f"生成耗时 {elapsed:.0f}s，数据库大小 {os.path.getsize(os.environ['VLM_DB_PATH']) / 1e9:.2f} GB")
+
+    history = AnalysisHistory()
+    middle = start + timedelta(seconds=args.records * args.interval / 2)
+    cases = [
+        ('第一页（无过滤）', lambda: history.query(limit=50)),
+        ('第一页（危险）', lambda: history.query(danger=True, limit=50)),
+        ('第一页（摄像头）', lambda: history.query(camera_id='camera-1', limit=50)),
+        ('第一页（摄像头+危险）', lambda: history.query(camera_id='camera-1', danger=True, limit=50)),
+        ('时间范围中段（1小时）', lambda: history.query(start=middle, end=middle + timedelta(hours=1), limit=50)),
+        ('时间范围中段（危险，1天）', lambda: history.query(start=middle, end=middle + timedelta(days=1), danger=True, limit=50)),
+        ('统计 /analyses/summary', lambda: history.summary()),
+    ]
+
+    print(f"\n{'查询':<28} {'p50(ms)':>9} {'p95(ms)':>9}")
+    for name, fn in cases:
+        p50, p95 = measure(fn, args.queries)
+        print(f"{name:<28} {p50:>9.2f} {p95:>9.2f}")
+
+    # 深翻页：每页耗时应与翻到第几页无关
+    cursor = None
+    latencies = []
+    for _ in range(args.pages):
+        began = time.perf_counter()
+        page = history.query(cursor=cursor, limit=50)
+        latencies.append((time.perf_counter() - began) * 1000)
+        cursor = page['next_cursor']
+    print(f"{'连续翻页 第1页 / 第' + str(args.pages) + '页':<28} {latencies[0]:>9.2f} {latencies[-1]:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+分析历史检索延迟测试
+
+在临时数据库中生成大量合成分析记录（默认100万条），
+测量FTS5检索（关键词、关键词+时间范围、仅时间范围）的延迟，
+数据库写入临时文件，不影响 data/vlm_demo.db
+
+用法:
+  python benchmarks/bench_analysis_search.py --records 1000000 --queries 200
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SUBJECTS = ['A person', 'Two workers', 'A man in a red jacket', 'A woman', 'A delivery driver', 'A child', 'A group of people']
+ACTIONS = ['is walking past the camera', 'is standing near the door', 'is carrying a box', 'is using a ladder',
+           'is operating a forklift', 'is sitting at a desk', 'is smoking near the entrance', 'is running in the corridor',
+           'is holding a knife', 'has fallen on the floor', 'is climbing the fence', 'is talking on the phone']
+SCENES = ['in the warehouse', 'in the parking lot', 'at the loading dock', 'in the office', 'in the hallway', 'outside the gate']
+DANGEROUS = {'is holding a knife', 'has fallen on the floor', 'is climbing the fence', 'is smoking near the entrance'}
+
+QUESTIONS = [
+    'Was anyone holding a knife?',
+    'Did someone fall in the warehouse?',
+    'Was there a forklift at the loading dock this morning?',
+    'Who was climbing the fence yesterday?',
+    'Any danger in the last 2 hours?',
+    'What happened between 9 and 11am yesterday?',
+    'Was anyone smoking near the entrance last night?',
+    '昨天下午有危险吗',
+    f"What happened on {(datetime.now() - timedelta(days=3)):%Y-%m-%d} in the morning?",
+    'Was anyone holding a knife last Tuesday?',
+]
+
+
+def generate_records(db_path, count, interval):
+    """用sqlite3批量插入合成记录（FTS索引由触发器同步维护）"""
+    random.seed(0)
+    start = datetime.now() - timedelta(seconds=count * interval)
+    from models.database import register_sql_functions
+
+    connection = sqlite3.connect(db_path)
+    # 描述去重压缩触发器使用的SQL函数
+    register_sql_functions(connection)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=OFF")
+
+    def rows():
+        for i in range(count):
+            action = random.choice(ACTIONS)
+            description = f"{random.choice(SUBJECTS)} {action} {random.choice(SCENES)}."
+            date = (start + timedelta(seconds=i * interval)).strftime('%Y-%m-%d %H:%M:%S.%f')
+            yield date, description, action in DANGEROUS
+
+    began = time.perf_counter()
+    connection.executemany("INSERT INTO analysis_records (date, description, danger) VALUES (?, ?, ?)", rows())
+    connection.commit()
+    connection.close()
+    return time.perf_counter() - began
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分析历史检索延迟测试')
+    parser.add_argument('--records', type=int, default=1000000, help='合成记录数量')
+    parser.add_argument('--interval', type=float, default=2.0, help='相邻记录的时间间隔（秒）')
+    parser.add_argument('--queries', type=int, default=200, help='每个问题的查询次数')
+    parser.add_argument('--top-k', type=int, default=5, help='每次返回的记录数量')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='vlm_search_bench_')
+    os.environ['VLM_DB_PATH'] = os.path.join(tmp_dir, 'bench.db')
+    sys.path.insert(0, REPO_ROOT)
+
+    # 创建表和FTS索引
+    from models.analysis_search import AnalysisSearchIndex
+    from models.database import init_db
+    init_db()
+
+    print(f"生成 {args.records} 条记录到 {os.environ['VLM_DB_PATH']} ...")
+    elapsed = generate_records(os.environ['VLM_DB_PATH'], args.records, args.interval)
+    print(f"插入耗时 {elapsed:.1f}s ({args.records / elapsed:.0f} 条/秒)，"
+          f"数据库大小 {os.path.getsize(os.environ['VLM_DB_PATH']) / 1e6:.0f} MB")
+
+    index = AnalysisSearchIndex(top_k=args.top_k)
+    print(f"\n{'问题':<56} {'结果':>4} {'p50(ms)':>9} {'p95(ms)':>9}")
+    for question in QUESTIONS:
+        latencies = []
+        results = []
+        for _ in range(args.queries):
+            began = time.perf_counter()
+            results = index.search(question)
+            latencies.append((time.perf_counter() - began) * 1000)
+        print(f"{question:<56} {len(results):>4} {statistics.median(latencies):>9.2f} {percentile(latencies, 0.95):>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
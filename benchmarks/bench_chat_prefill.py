@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+聊天提示预填充(prefill)测试
+
+模拟"每次提问之间有新的分析结果写入"的真实场景，分别使用旧的提示布局
+（历史窗口每条记录滑动一次，检索结果插在历史之前）和新的布局
+（固定说明 + 按块滚动的历史 + 检索结果 + 问题）连续提问，
+统计Ollama返回的 prompt_eval_count / prompt_eval_duration，即每次实际计算的提示token数和耗时
+
+默认连接本地Ollama；使用 --simulate 时启动一个模拟前缀KV缓存的假Ollama
+（按与上一次提示的公共前缀之外的字符数估算token），不需要GPU
+
+用法:
+  python benchmarks/bench_chat_prefill.py --questions 30 --analyses-between 2
+  python benchmarks/bench_chat_prefill.py --simulate
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DESCRIPTIONS = [
+    'A person is walking past the camera in the hallway.',
+    'Two workers are carrying boxes at the loading dock.',
+    'The parking lot is empty, no people are visible.',
+    'A man in a red jacket is standing near the door and talking on the phone.',
+    'A forklift is moving pallets in the warehouse while a worker watches.',
+    'A woman is sitting at a desk in the office using a laptop.',
+]
+QUESTIONS = [
+    'Was anyone near the door recently?',
+    'Did anything dangerous happen?',
+    'How many people were seen in the warehouse?',
+    'Summarise the last few minutes.',
+    'Was the forklift still moving?',
+]
+
+
+class PrefixCacheOllamaHandler(BaseHTTPRequestHandler):
+    """模拟Ollama：只对与上一次提示的公共前缀之外的部分计算预填充"""
+
+    last_prompt = ''
+    ns_per_token = 1_000_000
+    lock = threading.Lock()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        prompt = json.loads(self.rfile.read(length) or b'{}').get('prompt', '')
+        with self.lock:
+            common = os.path.commonprefix([prompt, PrefixCacheOllamaHandler.last_prompt])
+            PrefixCacheOllamaHandler.last_prompt = prompt
+        tokens = max(1, (len(prompt) - len(common) + 3) // 4)
+        body = json.dumps({
+            "response": "OK.", "done": True,
+            "prompt_eval_count": tokens, "prompt_eval_duration": tokens * self.ns_per_token,
+            "eval_count": 1, "eval_duration": self.ns_per_token,
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def legacy_prompt(window, relevant, question):
+    """旧布局：检索结果在最近记录之前，历史窗口每新增一条记录就滑动一次"""
+    context = "\n".join(window)
+    if relevant:
+        context = f"Relevant earlier records:\n{relevant}\nMost recent records:\n{context}"
+    return f"""You are an intelligent security monitoring assistant. Please provide an answer based on the following historical data and the user's question.
+
+Historical Data:
+{context}
+
+User Question:
+{question}
+
+Please provide an accurate and helpful answer based on the historical data. If the question cannot be answered with the provided data, please state so clearly."""
+
+
+def run(layout, args, chat_service_cls, window_cls):
+    """按指定布局连续提问，返回每次的 (预填充token数, 预填充毫秒)"""
+    random.seed(0)
+    new_window = window_cls(max_records=20)
+    legacy_window = deque(maxlen=20)
+    chat_service = chat_service_cls(ollama_url=args.ollama_url, model_name=args.model,
+                                    context_window=new_window, retrieval_k=0, max_tokens=1)
+    clock = datetime(2025, 1, 1, 8, 0, 0)
+    record_id = 0
+
+    def add_analysis():
+        nonlocal clock, record_id
+        record_id += 1
+        clock += timedelta(seconds=5)
+        description = random.choice(DESCRIPTIONS)
+        danger = random.random() < 0.1
+        new_window.add(record_id, clock, description, danger)
+        legacy_window.append(window_cls.format_record(clock, description, danger))
+
+    for _ in range(20):
+        add_analysis()
+
+    results = []
+    for i in range(args.questions + 1):
+        for _ in range(args.analyses_between):
+            add_analysis()
+        question = QUESTIONS[i % len(QUESTIONS)]
+        relevant = window_cls.format_record(clock - timedelta(hours=1), 'An older related record.', False)
+        if layout == 'legacy':
+            prompt = legacy_prompt(legacy_window, relevant, question)
+        else:
+            prompt = chat_service.build_prompt(question).replace(
+                "\n\nUser Question:", f"\nRelevant earlier records:\n{relevant}\n\nUser Question:")
+        response = requests.post(args.ollama_url, json=chat_service.build_request(prompt), timeout=300).json()
+        if i > 0:  # 第一次请求用于预热
+            results.append((response.get('prompt_eval_count', 0), response.get('prompt_eval_duration', 0) / 1e6))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='聊天提示预填充测试')
+    parser.add_argument('--ollama-url', type=str, default='http://localhost:11434/api/generate', help='Ollama生成接口URL')
+    parser.add_argument('--model', type=str, default='gemma3:4b', help='模型名称')
+    parser.add_argument('--questions', type=int, default=30, help='提问次数')
+    parser.add_argument('--analyses-between', type=int, default=2, help='两次提问之间新增的分析记录数量')
+    parser.add_argument('--simulate', action='store_true', help='使用模拟前缀KV缓存的假Ollama')
+    args = parser.parse_args()
+
+    # 使用临时数据库，不影响 data/vlm_demo.db
+    os.environ['VLM_DB_PATH'] = os.path.join(tempfile.mkdtemp(prefix='vlm_prefill_bench_'), 'bench.db')
+    sys.path.insert(0, REPO_ROOT)
+    from models.chat_context import AnalysisContextWindow
+    from models.database import init_db
+    from services.chat_service import ChatService
+    init_db()
+
+    if args.simulate:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), PrefixCacheOllamaHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        args.ollama_url = f'http://127.0.0.1:{server.server_address[1]}/api/generate'
+
+    print(f"{'布局':<8} {'平均token':>10} {'p50 token':>10} {'平均预填充(ms)':>16} {'p95预填充(ms)':>15}")
+    for layout in ('legacy', 'stable'):
+        results = run(layout, args, ChatService, AnalysisContextWindow)
+        tokens = [r[0] for r in results]
+        durations = sorted(r[1] for r in results)
+        print(f"{layout:<8} {statistics.mean(tokens):>10.0f} {statistics.median(tokens):>10.0f} "
+              f"{statistics.mean(durations):>16.1f} {durations[min(len(durations) - 1, int(len(durations) * 0.95))]:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
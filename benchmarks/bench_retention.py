@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+数据保留清理测试
+
+在临时数据库中生成跨越多天的合成分析记录（默认40天、每小时一条，每13条一条危险记录），
+执行一次保留期清理，然后用 python -m models.rollups --rebuild 重建汇总表，检查：
+- 清理后和重建后的分析天汇总（记录数、危险数）与清理前相同
+- 过期记录已合并为摘要并删除
+- 结束时间早于保留期的事件及其代表帧已删除，剩余事件不再引用已删除的记录
+数据库和时间序列写入临时目录，不影响 data/
+
+用法:
+  python benchmarks/bench_retention.py --days 40 --per-hour 1 --keep-days 30
+"""
+
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def generate_records(db_path, days, per_hour, cameras):
+    """生成从days天前到现在的记录，返回记录数"""
+    from models.database import register_sql_functions
+
+    count = days * 24 * per_hour
+    interval = 3600 / per_hour
+    start = datetime.now() - timedelta(days=days)
+    connection = sqlite3.connect(db_path)
+    # 描述去重压缩触发器使用的SQL函数
+    register_sql_functions(connection)
+    connection.execute(f"""
+        WITH RECURSIVE seq(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {count - 1})
+        INSERT INTO analysis_records (date, description, danger, camera_id)
+        SELECT strftime('%Y-%m-%d %H:%M:%f000', :start, '+' || (n * {interval}) || ' seconds'),
+               'Synthetic analysis record ' || (n % 100),
+               (n % 13) = 0,
+               'camera-' || (n % {cameras})
+        FROM seq
+    """, {'start': start.strftime('%Y-%m-%d %H:%M:%S')})
+    connection.commit()
+    connection.close()
+    return count
+
+
+def generate_incidents(db_path, frame_dir):
+    """每个摄像头每天生成一个事件（覆盖当天的记录），并为每个事件保存一个代表帧，返回事件数"""
+    os.makedirs(frame_dir, exist_ok=True)
+    connection = sqlite3.connect(db_path)
+    rows = connection.execute("""
+        SELECT camera_id, MIN(date), MAX(date), MAX(danger), COUNT(*), MIN(id), MAX(id) FROM analysis_records
+        GROUP BY camera_id, substr(date, 1, 10)
+    """).fetchall()
+    for camera_id, start_date, end_date, danger, count, first_id, last_id in rows:
+        frame = f"{camera_id}_{start_date[:19].replace('-', '').replace(':', '').replace(' ', '_')}.jpg"
+        with open(os.path.join(frame_dir, frame), 'wb') as f:
+            f.write(b'\xff\xd8' + bytes(4096) + b'\xff\xd9')
+        connection.execute(
+            "INSERT INTO incidents (camera_id, start_date, end_date, danger, peak_severity, record_count, "
+            "first_record_id, last_record_id, samples, frame_path) VALUES (?, ?, ?, ?, 0, ?, ?, ?, '[]', ?)",
+            (camera_id, start_date, end_date, danger, count, first_id, last_id, frame))
+    connection.commit()
+    connection.close()
+    return len(rows)
+
+
+def query_one(db_path, sql):
+    """执行查询并返回第一行"""
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute(sql).fetchone()
+    finally:
+        connection.close()
+
+
+def day_rollups(db_path):
+    """分析天汇总的 (记录数, 危险数) 合计"""
+    return tuple(query_one(db_path, "SELECT COALESCE(SUM(total), 0), COALESCE(SUM(danger), 0) "
+                                    "FROM analysis_rollups WHERE bucket = 'day'"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据保留清理测试')
+    parser.add_argument('--days', type=int, default=40, help='生成记录覆盖的天数')
+    parser.add_argument('--per-hour', type=int, default=1, help='每小时的记录数')
+    parser.add_argument('--cameras', type=int, default=2, help='摄像头数量')
+    parser.add_argument('--keep-days', type=int, default=30, help='保留完整记录的天数')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='vlm_retention_bench_')
+    db_path = os.path.join(tmp_dir, 'bench.db')
+    os.environ['VLM_DB_PATH'] = db_path
+    os.environ['VLM_TIMESERIES_PATH'] = os.path.join(tmp_dir, 'timeseries')
+    frame_dir = os.environ['VLM_INCIDENT_FRAMES_PATH'] = os.path.join(tmp_dir, 'incidents')
+    sys.path.insert(0, REPO_ROOT)
+
+    from models.database import init_db
+    from models.retention import RetentionJob
+    init_db()
+
+    count = generate_records(db_path, args.days, args.per_hour, args.cameras)
+    incidents = generate_incidents(db_path, frame_dir)
+    before = day_rollups(db_path)
+    print(f"生成 {count} 条记录和 {incidents} 个事件到 {db_path}，天汇总 (记录数, 危险数) = {before}")
+
+    job = RetentionJob(keep_days=args.keep_days, pause=0)
+    report = job.report()
+    print(f"试运行: 将清理 {report['expired_records']} / {report['total_records']} 条记录，"
+          f"{report['expired_incidents']} 个事件（代表帧 {report['incident_frame_bytes']} 字节）")
+
+    began = time.perf_counter()
+    result = job.run_once()
+    print(f"清理: 删除 {result['removed_records']} 条记录，{result['removed_incidents']} 个事件"
+          f"（代表帧 {result['incident_frame_bytes']} 字节），耗时 {time.perf_counter() - began:.2f}s")
+    remaining, = query_one(db_path, "SELECT COUNT(*) FROM analysis_records")
+    summaries, summarized = query_one(db_path, "SELECT COUNT(*), COALESCE(SUM(record_count), 0) "
+                                               "FROM analysis_summaries")
+    remaining_incidents, dangling = query_one(db_path, (
+        "SELECT COUNT(*), COALESCE(SUM((first_record_id IS NOT NULL AND first_record_id NOT IN "
+        "(SELECT id FROM analysis_records)) OR (last_record_id IS NOT NULL AND last_record_id NOT IN "
+        "(SELECT id FROM analysis_records))), 0) FROM incidents"))
+    frames = len(os.listdir(frame_dir))
+    print(f"  剩余 {remaining_incidents} 个事件（{dangling} 个引用已删除的记录），{frames} 个代表帧")
+    after = day_rollups(db_path)
+    print(f"  剩余 {remaining} 条记录，{summaries} 个摘要（{summarized} 条记录），天汇总 = {after}")
+
+    subprocess.run([sys.executable, '-m', 'models.rollups', '--rebuild'], cwd=REPO_ROOT, env=os.environ,
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    rebuilt = day_rollups(db_path)
+    print(f"重建汇总后: 天汇总 = {rebuilt}")
+
+    failures = []
+    if result['removed_records'] != report['expired_records']:
+        failures.append(f"删除的记录数 {result['removed_records']} 与试运行 {report['expired_records']} 不一致")
+    if remaining + summarized != count:
+        failures.append(f"剩余记录 {remaining} + 摘要记录 {summarized} != 生成的记录 {count}")
+    if result['removed_incidents'] != report['expired_incidents']:
+        failures.append(f"删除的事件数 {result['removed_incidents']} 与试运行 {report['expired_incidents']} 不一致")
+    if remaining_incidents + result['removed_incidents'] != incidents:
+        failures.append(f"剩余事件 {remaining_incidents} + 删除的事件 != 生成的事件 {incidents}")
+    if frames != remaining_incidents:
+        failures.append(f"剩余代表帧 {frames} 与剩余事件 {remaining_incidents} 不一致")
+    if dangling:
+        failures.append(f"{dangling} 个事件仍引用已删除的记录")
+    if after != before:
+        failures.append(f"清理后天汇总 {after} 与清理前 {before} 不一致")
+    if rebuilt != before:
+        failures.append(f"重建后天汇总 {rebuilt} 与清理前 {before} 不一致")
+    for failure in failures:
+        print(f"失败: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
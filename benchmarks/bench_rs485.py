@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+RS485总线吞吐量和报警延迟测试
+
+在本机RS485模拟器（models/rs485_simulator.py）上分别测试同步控制器（RS485Controller）
+和异步控制器（AsyncRS485Controller）：
+- 吞吐量：连续读取光照度，统计每秒完成的事务数
+- 报警到亮灯延迟：后台线程持续轮询传感器占用总线的同时，以危险报警优先级切换灯光颜色，
+  统计从提交命令到模拟器的灯光寄存器变为目标状态的时间
+
+模拟器按波特率模拟帧在总线上的传输时间，9600波特率下每次读取事务约20毫秒
+
+用法:
+  python benchmarks/bench_rs485.py
+  python benchmarks/bench_rs485.py --baud 115200 --latency 0.002 --duration 5
+  python benchmarks/bench_rs485.py --error-rate 0.02 --timeout-rate 0.01
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, fraction):
+    """分位数"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure_throughput(controller, duration):
+    """连续读取光照度，返回 (每秒事务数, 失败次数)"""
+    start_transactions = controller.transactions
+    failures = 0
+    deadline = time.monotonic() + duration
+    start = time.monotonic()
+    while time.monotonic() < deadline:
+        if controller.read_lux() is None:
+            failures += 1
+    elapsed = time.monotonic() - start
+    return (controller.transactions - start_transactions) / elapsed, failures
+
+
+def measure_alert_latency(controller, simulator, alerts, interval, loaders, priority):
+    """后台轮询占用总线时切换灯光，返回每次报警到亮灯的延迟（毫秒）列表和未生效的次数"""
+    running = True
+
+    def load():
+        while running:
+            controller.read_lux()
+
+    threads = [threading.Thread(target=load, daemon=True) for _ in range(loaders)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+
+    latencies = []
+    missed = 0
+    colors = [("yellow", (0, 1, 0)), ("green", (1, 0, 0))]
+    try:
+        for i in range(alerts):
+            color, state = colors[i % 2]
+            submitted = time.monotonic()
+            controller.set_light_async(color, force=True, priority=priority)
+            applied = simulator.wait_for_light(state, submitted, timeout=5.0)
+            if applied is None:
+                missed += 1
+            else:
+                latencies.append((applied - submitted) * 1000)
+            time.sleep(interval)
+    finally:
+        running = False
+        for thread in threads:
+            thread.join(timeout=5)
+    return latencies, missed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RS485总线吞吐量和报警延迟测试')
+    parser.add_argument('--transport', choices=['pty', 'tcp'], default='pty', help='模拟器传输方式')
+    parser.add_argument('--baud', type=int, default=9600, help='模拟的波特率')
+    parser.add_argument('--latency', type=float, default=0.005, help='模拟设备的处理延迟（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟设备返回异常的概率')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='模拟设备不响应的概率')
+    parser.add_argument('--duration', type=float, default=5.0, help='吞吐量测试时长（秒）')
+    parser.add_argument('--alerts', type=int, default=30, help='报警次数')
+    parser.add_argument('--alert-interval', type=float, default=0.2, help='两次报警之间的间隔（秒）')
+    parser.add_argument('--loaders', type=int, default=2, help='报警测试时后台轮询的线程数')
+    parser.add_argument('--modes', type=str, default='sync,async', help='要测试的控制器（sync、async）')
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    from models.rs485_async import AsyncRS485Controller
+    from models.rs485_bus import PRIORITY_ALERT
+    from models.rs485_controller import RS485Controller
+    from models.rs485_simulator import RS485Simulator
+
+    controllers = {'sync': RS485Controller, 'async': AsyncRS485Controller}
+    results = []
+    for mode in args.modes.split(','):
+        simulator = RS485Simulator(transport=args.transport, baud=args.baud, latency=args.latency,
+                                   error_rate=args.error_rate, timeout_rate=args.timeout_rate)
+        port = simulator.start()
+        controller = controllers[mode](serial_port=port, baud=args.baud)
+        try:
+            if not controller.connect():
+                print(f"{mode}: 无法连接到模拟器 {port}")
+                continue
+            throughput, failures = measure_throughput(controller, args.duration)
+            latencies, missed = measure_alert_latency(controller, simulator, args.alerts, args.alert_interval,
+                                                      args.loaders, PRIORITY_ALERT)
+            results.append((mode, throughput, failures, latencies, missed))
+        finally:
+            controller.disconnect()
+            simulator.stop()
+
+    print()
+    print(f"模拟器: {args.transport}，{args.baud} 波特，设备延迟 {args.latency * 1000:.1f} ms，"
+          f"异常率 {args.error_rate}，超时率 {args.timeout_rate}")
+    print(f"{'控制器':<8} {'事务/秒':>8} {'读取失败':>8} {'报警p50(ms)':>12} {'报警p95(ms)':>12} "
+          f"{'报警max(ms)':>12} {'未生效':>6}")
+    for mode, throughput, failures, latencies, missed in results:
+        if latencies:
+            p50, p95, worst = statistics.median(latencies), percentile(latencies, 0.95), max(latencies)
+        else:
+            p50 = p95 = worst = float('nan')
+        print(f"{mode:<8} {throughput:>8.1f} {failures:>8} {p50:>12.1f} {p95:>12.1f} {worst:>12.1f} {missed:>6}")
+
+
+if __name__ == "__main__":
+    main()
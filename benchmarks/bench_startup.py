@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+启动时间预算检查
+
+1. 导入时间：用 python -X importtime 多次导入 app 和 web_ui，取总导入时间的中位数与预算比较，
+   并列出耗时最多的直接导入。同时检查导入没有副作用：
+   - 没有导入 ollama、pymodbus 等只在分析或RS485启用时才需要的依赖
+   - 没有创建数据库文件（建表和迁移由入口程序显式执行）
+2. 首帧时间：用合成的视频文件启动 app.py，统计从启动进程到收到第一个视频帧UDP数据包的时间
+   （看门狗重启后摄像头恢复推流的时间）。VideoStreamer固定发送到5000端口，端口被占用时跳过该项
+
+预算默认值按开发机测得的时间留有余量，在Jetson等较慢的设备上用 --budget-* 参数调整
+
+用法:
+  python benchmarks/bench_startup.py
+  python benchmarks/bench_startup.py --runs 10 --budget-app 800 --budget-web-ui 1000 --budget-first-frame 2000
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 入口模块导入时不应加载的依赖
+FORBIDDEN_IMPORTS = ('ollama', 'pymodbus', 'serial')
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(output):
+    """解析 -X importtime 的输出，返回 [(累计微秒, 缩进层级, 模块名), ...]"""
+    entries = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((int(match.group(2)), len(match.group(3)) // 2, match.group(4)))
+    return entries
+
+
+def module_tree(entries, module):
+    """模块自身及其导入的模块（importtime先输出被导入的模块，最后输出该模块，缩进层级为0）"""
+    end = next(index for index, (_, level, name) in enumerate(entries) if name == module and level == 0)
+    start = end
+    while start > 0 and entries[start - 1][1] > 0:
+        start -= 1
+    return entries[start:end + 1]
+
+
+def measure_imports(module, runs, env):
+    """多次导入模块，返回 (总导入时间中位数ms, 最后一次导入该模块时加载的模块记录)"""
+    totals = []
+    entries = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+        entries = module_tree(parse_importtime(result.stderr), module)
+        totals.append(entries[-1][0] / 1000)
+    return statistics.median(totals), entries
+
+
+def write_test_video(path, frames=90):
+    """生成一段用于启动测试的视频文件"""
+    import cv2
+    import numpy as np
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (320, 240))
+    for i in range(frames):
+        frame = np.full((240, 320, 3), i * 2 % 255, dtype=np.uint8)
+        writer.write(frame)
+    writer.release()
+
+
+def measure_first_frame(env, timeout):
+    """启动app.py直到收到第一个视频帧，返回耗时（ms），端口被占用时返回None"""
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        receiver.bind(('127.0.0.1', 5000))
+    except OSError as e:
+        print(f"首帧时间: 跳过（无法监听5000端口: {e}）")
+        return None
+    receiver.settimeout(0.1)
+    video = os.path.join(tempfile.mkdtemp(prefix='vlm_startup_bench_'), 'startup.avi')
+    write_test_video(video)
+
+    started = time.perf_counter()
+    # 分析请求发往不存在的服务，失败不影响视频推流
+    process = subprocess.Popen([sys.executable, 'app.py', '--host', '127.0.0.1', '--video-source', video,
+                                '--vllm-url', 'http://127.0.0.1:9/v1/completions', '--retention-days', '0'],
+                               cwd=REPO_ROOT, env=dict(env, OLLAMA_HOST='http://127.0.0.1:9'),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                data, _ = receiver.recvfrom(65536)
+            except socket.timeout:
+                continue
+            try:
+                if json.loads(data).get('type') == 'video':
+                    return (time.perf_counter() - started) * 1000
+            except ValueError:
+                continue
+        return float('inf')
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        receiver.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动时间预算检查')
+    parser.add_argument('--runs', type=int, default=5, help='每个模块的导入次数')
+    parser.add_argument('--budget-app', type=float, default=600, help='app导入时间预算（ms）')
+    parser.add_argument('--budget-web-ui', type=float, default=800, help='web_ui导入时间预算（ms）')
+    parser.add_argument('--budget-first-frame', type=float, default=1000, help='app.py首帧时间预算（ms）')
+    parser.add_argument('--top', type=int, default=8, help='列出耗时最多的直接导入数量')
+    parser.add_argument('--skip-first-frame', action='store_true', help='只检查导入时间')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='vlm_startup_bench_')
+    db_path = os.path.join(tmp_dir, 'startup.db')
+    env = dict(os.environ, VLM_DB_PATH=db_path, VLM_TIMESERIES_PATH=os.path.join(tmp_dir, 'timeseries'),
+               PYTHONPATH=REPO_ROOT)
+
+    failures = []
+    for module, budget in (('app', args.budget_app), ('web_ui', args.budget_web_ui)):
+        total, entries = measure_imports(module, args.runs, env)
+        status = 'OK' if total <= budget else 'OVER'
+        print(f"{module}: 导入 {total:.0f} ms（预算 {budget:.0f} ms）{status}")
+        if total > budget:
+            failures.append(f"{module} 导入时间 {total:.0f} ms 超出预算 {budget:.0f} ms")
+        direct = sorted((entry for entry in entries if entry[1] == 1), reverse=True)[:args.top]
+        for cumulative, _, name in direct:
+            print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+        loaded = {name.split('.')[0] for _, _, name in entries}
+        for forbidden in FORBIDDEN_IMPORTS:
+            if forbidden in loaded:
+                failures.append(f"导入 {module} 时加载了 {forbidden}")
+    if os.path.exists(db_path):
+        failures.append("导入模块时创建了数据库文件")
+
+    if not args.skip_first_frame:
+        elapsed = measure_first_frame(env, timeout=max(10.0, args.budget_first_frame / 1000 * 5))
+        if elapsed is not None:
+            status = 'OK' if elapsed <= args.budget_first_frame else 'OVER'
+            print(f"app.py: 首帧 {elapsed:.0f} ms（预算 {args.budget_first_frame:.0f} ms）{status}")
+            if elapsed > args.budget_first_frame:
+                failures.append(f"首帧时间 {elapsed:.0f} ms 超出预算 {args.budget_first_frame:.0f} ms")
+
+    for failure in failures:
+        print(f"失败: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Web UI 负载测试
+
+分别以Flask开发服务器和异步(ASGI)模式启动web_ui.py，
+用大量并发的MJPEG观看者、SSE连接和聊天请求压测，并对比两种模式的结果：
+- 每个观看者实际收到的帧率
+- SSE收到的事件数
+- 聊天请求的延迟和失败数，以及回答缓存的命中/未命中/合并次数（来自/metrics）
+- 服务进程的线程数和内存占用
+
+测试使用模拟的Ollama接口（固定延迟）和合成的UDP视频帧，不需要摄像头和GPU；
+默认每个聊天请求的问题都不同，不会命中回答缓存，测量的是并发的模型调用；
+--same-question 让所有请求发送同一个问题，测量缓存命中时的延迟；
+数据库和光照度时间序列写入临时目录，不影响 data/
+
+用法:
+  python benchmarks/load_test_web_ui.py --viewers 200 --sse 200 --chat 50 --duration 20
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """模拟Ollama生成接口：固定延迟后返回一个简短回答"""
+
+    latency = 2.0
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if request.get('stream'):
+            self._stream_response()
+            return
+
+        time.sleep(self.latency)
+        body = json.dumps({"response": "No danger detected.", "done": True}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_response(self):
+        """按NDJSON逐token返回，总耗时与非流式相同"""
+        tokens = ["No", " danger", " detected", "."]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()
+        try:
+            for token in tokens:
+                time.sleep(self.latency / len(tokens))
+                self.wfile.write(json.dumps({"response": token, "done": False}).encode('utf-8') + b'\n')
+                self.wfile.flush()
+            self.wfile.write(json.dumps({"response": "", "done": True}).encode('utf-8') + b'\n')
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_ollama(port, latency):
+    """在后台线程中启动模拟的Ollama服务"""
+    FakeOllamaHandler.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def send_frames(udp_port, fps, stop_event):
+    """以固定帧率向Web UI发送合成的视频帧"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    index = 0
+    while not stop_event.is_set():
+        frame[:] = (index * 7) % 255
+        cv2.putText(frame, str(index), (50, 240), cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 255), 8)
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 30])
+        packet = json.dumps({"type": "video", "data": base64.b64encode(buffer).decode('utf-8')})
+        sock.sendto(packet.encode('utf-8'), ('127.0.0.1', udp_port))
+        index += 1
+        time.sleep(1.0 / fps)
+    sock.close()
+
+
+def send_sensor_data(udp_port, stop_event):
+    """每秒发送一次光照度数据，用于触发SSE事件"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    lux = 100
+    while not stop_event.is_set():
+        lux = 40 if lux == 100 else 100
+        packet = json.dumps({"type": "sensor_data", "data": {"lux": lux, "unit": "Lux", "timestamp": time.time()}})
+        sock.sendto(packet.encode('utf-8'), ('127.0.0.1', udp_port))
+        time.sleep(1)
+    sock.close()
+
+
+def wait_for_port(port, timeout=30):
+    """等待TCP端口可以连接"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def process_stats(pid):
+    """读取进程的线程数和常驻内存(MB)"""
+    threads, rss_mb = None, None
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+                elif line.startswith('VmRSS:'):
+                    rss_mb = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return threads, rss_mb
+
+
+async def open_stream(port, path):
+    """发送GET请求并读取响应头，返回reader和writer"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nAccept: */*\r\n\r\n".encode())
+    await writer.drain()
+    await reader.readuntil(b'\r\n\r\n')
+    return reader, writer
+
+
+async def mjpeg_viewer(port, duration, results):
+    """模拟一个视频观看者，统计收到的帧数"""
+    frames = 0
+    try:
+        reader, writer = await open_stream(port, '/video_feed')
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            chunk = await asyncio.wait_for(reader.read(65536), timeout=max(0.1, deadline - time.monotonic()))
+            if not chunk:
+                break
+            frames += chunk.count(b'--frame')
+        writer.close()
+    except (asyncio.TimeoutError, OSError, asyncio.IncompleteReadError):
+        pass
+    results['viewer_frames'].append(frames)
+
+
+async def sse_client(port, duration, results):
+    """模拟一个SSE连接，统计收到的事件数"""
+    events = 0
+    try:
+        reader, writer = await open_stream(port, '/events')
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            chunk = await asyncio.wait_for(reader.read(65536), timeout=max(0.1, deadline - time.monotonic()))
+            if not chunk:
+                break
+            events += chunk.count(b'\nevent: ')
+        writer.close()
+    except (asyncio.TimeoutError, OSError, asyncio.IncompleteReadError):
+        pass
+    results['sse_events'].append(events)
+
+
+async def chat_client(port, duration, results, client_id, same_question=False):
+    """模拟一个聊天用户，连续发送问题并记录延迟（same_question为False时每个问题都不同，不会命中回答缓存）"""
+    deadline = time.monotonic() + duration
+    sent = 0
+    while time.monotonic() < deadline:
+        question = "Any danger in the last hour?"
+        if not same_question:
+            question = f"Any danger in the last hour? (user {client_id}, question {sent})"
+        sent += 1
+        body = json.dumps({"message": question}).encode('utf-8')
+        start = time.monotonic()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b"POST /chat HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                         b"Connection: close\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), timeout=60)
+            writer.close()
+            if response.startswith(b'HTTP/1.1 200') or response.startswith(b'HTTP/1.0 200'):
+                results['chat_latencies'].append(time.monotonic() - start)
+            else:
+                results['chat_errors'] += 1
+        except (asyncio.TimeoutError, OSError):
+            results['chat_errors'] += 1
+
+
+async def run_clients(port, args, pid):
+    """并发运行所有客户端，并在中途采样服务进程状态"""
+    results = {'viewer_frames': [], 'sse_events': [], 'chat_latencies': [], 'chat_errors': 0}
+    tasks = [mjpeg_viewer(port, args.duration, results) for _ in range(args.viewers)]
+    tasks += [sse_client(port, args.duration, results) for _ in range(args.sse)]
+    tasks += [chat_client(port, args.duration, results, i, args.same_question) for i in range(args.chat)]
+
+    async def sample():
+        await asyncio.sleep(args.duration / 2)
+        results['threads'], results['rss_mb'] = process_stats(pid)
+
+    await asyncio.gather(sample(), *tasks)
+    return results
+
+
+def chat_cache_counters(port):
+    """读取服务的/metrics，返回聊天回答缓存的命中、未命中和合并次数"""
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=10) as response:
+            counters = json.loads(response.read()).get('counters', {})
+    except (OSError, ValueError):
+        return {}
+    return {name: counters.get(f'chat.cache_{name}', 0) for name in ('hit', 'miss', 'coalesced')}
+
+
+def run_mode(mode, args, ollama_url):
+    """以指定模式启动web_ui.py并压测"""
+    udp_port, web_port, chart_port = args.base_port, args.base_port + 1, args.base_port + 2
+    env = dict(os.environ, VLM_DB_PATH=os.path.join(args.tmpdir, f'load_test_{mode}.db'),
+               VLM_TIMESERIES_PATH=os.path.join(args.tmpdir, f'timeseries_{mode}'))
+    cmd = [sys.executable, os.path.join(REPO_ROOT, 'web_ui.py'), '--server', mode,
+           '--port', str(udp_port), '--web-port', str(web_port), '--chart-port', str(chart_port),
+           '--ollama-url', ollama_url]
+    process = subprocess.Popen(cmd, cwd=args.tmpdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    stop_event = threading.Event()
+    try:
+        if not wait_for_port(web_port):
+            raise RuntimeError(f"{mode} server did not start")
+        threading.Thread(target=send_frames, args=(udp_port, args.fps, stop_event), daemon=True).start()
+        threading.Thread(target=send_sensor_data, args=(udp_port, stop_event), daemon=True).start()
+        time.sleep(1)
+        results = asyncio.run(run_clients(web_port, args, process.pid))
+        results['chat_cache'] = chat_cache_counters(web_port)
+        return results
+    finally:
+        stop_event.set()
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def summarize(mode, results, args):
+    """汇总一次压测的结果"""
+    frames = results['viewer_frames'] or [0]
+    latencies = sorted(results['chat_latencies'])
+    return {
+        'mode': mode,
+        'viewer_fps': statistics.mean(frames) / args.duration,
+        'viewer_fps_min': min(frames) / args.duration,
+        'sse_events': statistics.mean(results['sse_events'] or [0]),
+        'chat_ok': len(latencies),
+        'chat_errors': results['chat_errors'],
+        'chat_p50': latencies[len(latencies) // 2] if latencies else float('nan'),
+        'chat_p95': latencies[int(len(latencies) * 0.95)] if latencies else float('nan'),
+        'cache_hit': results['chat_cache'].get('hit'),
+        'cache_miss': results['chat_cache'].get('miss'),
+        'cache_coalesced': results['chat_cache'].get('coalesced'),
+        'threads': results.get('threads'),
+        'rss_mb': results.get('rss_mb'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Web UI 负载测试（Flask vs 异步模式）")
+    parser.add_argument("--modes", type=str, default="flask,async", help="要测试的模式，逗号分隔 (默认: flask,async)")
+    parser.add_argument("--viewers", type=int, default=200, help="并发MJPEG观看者数量 (默认: 200)")
+    parser.add_argument("--sse", type=int, default=200, help="并发SSE连接数量 (默认: 200)")
+    parser.add_argument("--chat", type=int, default=50, help="并发聊天用户数量 (默认: 50)")
+    parser.add_argument("--duration", type=float, default=20, help="每种模式的测试时长(秒) (默认: 20)")
+    parser.add_argument("--fps", type=float, default=15, help="合成视频帧率 (默认: 15)")
+    parser.add_argument("--vlm-latency", type=float, default=2.0, help="模拟Ollama的响应延迟(秒) (默认: 2.0)")
+    parser.add_argument("--same-question", action="store_true",
+                        help="所有聊天请求发送同一个问题（测量回答缓存命中），默认每个问题都不同")
+    parser.add_argument("--base-port", type=int, default=6100, help="测试使用的起始端口 (默认: 6100)")
+    args = parser.parse_args()
+
+    fake_port = args.base_port + 10
+    fake_server = start_fake_ollama(fake_port, args.vlm_latency)
+    ollama_url = f"http://127.0.0.1:{fake_port}/api/generate"
+
+    summaries = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        args.tmpdir = tmpdir
+        for mode in args.modes.split(','):
+            print(f"Running {mode} server: {args.viewers} viewers, {args.sse} SSE, {args.chat} chat users, "
+                  f"{args.duration}s ...")
+            summaries.append(summarize(mode, run_mode(mode, args, ollama_url), args))
+    fake_server.shutdown()
+
+    header = f"{'mode':<8}{'fps/viewer':>12}{'min fps':>10}{'sse events':>12}{'chat ok':>9}{'errors':>8}" \
+             f"{'p50 s':>8}{'p95 s':>8}{'hit':>6}{'miss':>6}{'coal':>6}{'threads':>9}{'RSS MB':>9}"
+    print()
+    print(header)
+    print('-' * len(header))
+    for s in summaries:
+        print(f"{s['mode']:<8}{s['viewer_fps']:>12.1f}{s['viewer_fps_min']:>10.1f}{s['sse_events']:>12.1f}"
+              f"{s['chat_ok']:>9}{s['chat_errors']:>8}{s['chat_p50']:>8.2f}{s['chat_p95']:>8.2f}"
+              f"{str(s['cache_hit']):>6}{str(s['cache_miss']):>6}{str(s['cache_coalesced']):>6}"
+              f"{str(s['threads']):>9}{(s['rss_mb'] or 0):>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 # models包的初始化文件
 
-# 导入所有模型模块
-from .rs485_controller import RS485Controller
-from .rs485_sensor_data_sender import RS485SensorDataSender
+# RS485模块依赖pymodbus，只在第一次访问时导入，导入models包中的其他模块（例如数据库）不再加载它
+__all__ = ['RS485Controller', 'RS485SensorDataSender']
 
-__all__ = ['RS485Controller', 'RS485SensorDataSender']
\ No newline at end of file
+
+def __getattr__(name):
+    if name == 'RS485Controller':
+        from .rs485_controller import RS485Controller
+        return RS485Controller
+    if name == 'RS485SensorDataSender':
+        from .rs485_sensor_data_sender import RS485SensorDataSender
+        return RS485SensorDataSender
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
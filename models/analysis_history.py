@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+分析历史查询模块
+
+该模块为Web UI提供分析记录的历史浏览接口：
+- 按时间倒序的键集(keyset)分页：游标记录上一页最后一条记录的 (date, id)，
+  翻页代价与页码无关，不使用 OFFSET
+- 可按时间范围、是否危险和摄像头过滤，每种组合都有对应的索引
+- 统计信息直接读取由触发器维护的计数表，不扫描记录表
+"""
+
+import base64
+import json
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+
+from .database import DESCRIPTION_SQL, engine
+
+logger = logging.getLogger("AnalysisHistory")
+
+# SQLAlchemy在SQLite中保存DateTime的字符串格式
+DB_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# 接口接受的时间格式
+INPUT_DATETIME_FORMATS = ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+MAX_PAGE_SIZE = 500
+
+
+def parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    """
+    解析接口参数中的时间
+
+    Args:
+        value (str): 时间字符串，例如 "2025-01-01T08:00" 或 "2025-01-01 08:00:00"
+
+    Returns:
+        datetime: 解析后的时间，参数为空时为None
+
+    Raises:
+        ValueError: 时间格式无效
+    """
+    if not value:
+        return None
+    for fmt in INPUT_DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid datetime: {value}")
+
+
+def parse_danger(value: Optional[str]) -> Optional[bool]:
+    """
+    解析接口参数中的危险过滤条件
+
+    Args:
+        value (str): "true"/"false"/"1"/"0"，为空表示不过滤
+
+    Returns:
+        bool: 过滤条件，不过滤时为None
+
+    Raises:
+        ValueError: 参数无效
+    """
+    if value is None or value == '':
+        return None
+    value = value.lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f"Invalid danger filter: {value}")
+
+
+def encode_cursor(date: str, record_id: int) -> str:
+    """将上一页最后一条记录的 (date, id) 编码为不透明的游标字符串"""
+    return base64.urlsafe_b64encode(json.dumps([date, record_id]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """
+    解码游标字符串
+
+    Raises:
+        ValueError: 游标无效
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date, record_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return str(date), int(record_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class AnalysisHistory:
+    """分析历史查询类"""
+
+    def query(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              danger: Optional[bool] = None, camera_id: Optional[str] = None,
+              cursor: Optional[str] = None, limit: int = 50) -> dict:
+        """
+        按时间倒序分页查询分析记录
+
+        Args:
+            start (datetime): 开始时间（包含）
+            end (datetime): 结束时间（不包含）
+            danger (bool): 只返回危险(True)或非危险(False)的记录，None表示不过滤
+            camera_id (str): 摄像头标识
+            cursor (str): 上一页返回的游标，None表示第一页
+            limit (int): 每页记录数量
+
+        Returns:
+            dict: {"items": [...], "next_cursor": 下一页游标或None}
+
+        Raises:
+            ValueError: 参数无效
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        conditions = []
+        params = {'limit': limit + 1}
+
+        if camera_id:
+            conditions.append("camera_id = :camera_id")
+            params['camera_id'] = camera_id
+        # 危险条件直接写成字面量，才能使用 WHERE danger = 1 的部分索引
+        if danger is True:
+            conditions.append("danger = 1")
+        elif danger is False:
+            conditions.append("danger = 0")
+        if start is not None:
+            conditions.append("date >= :start")
+            params['start'] = start.strftime(DB_DATETIME_FORMAT)
+        if end is not None:
+            conditions.append("date < :end")
+            params['end'] = end.strftime(DB_DATETIME_FORMAT)
+        if cursor:
+            params['cursor_date'], params['cursor_id'] = decode_cursor(cursor)
+            conditions.append("(date, id) < (:cursor_date, :cursor_id)")
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = (f"SELECT id, date, {DESCRIPTION_SQL}, danger, camera_id FROM analysis_records {where} "
+               "ORDER BY date DESC, id DESC LIMIT :limit")
+
+        with engine.connect() as connection:
+            rows = connection.execute(text(sql), params).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(str(rows[-1][1]), rows[-1][0])
+
+        items = [
+            {
+                'id': row[0],
+                'date': str(row[1])[:19],
+                'description': row[2],
+                'danger': bool(row[3]),
+                'camera_id': row[4],
+            }
+            for row in rows
+        ]
+        return {'items': items, 'next_cursor': next_cursor}
+
+    def summary(self, camera_id: Optional[str] = None) -> dict:
+        """
+        获取分析记录统计（读取计数表，不扫描记录表）
+
+        Args:
+            camera_id (str): 摄像头标识，None表示所有摄像头
+
+        Returns:
+            dict: 总数、危险记录数、最早和最新记录时间，以及按摄像头的明细
+        """
+        sql = "SELECT camera_id, danger, count, first_date, last_date FROM analysis_counters"
+        params = {}
+        if camera_id:
+            sql += " WHERE camera_id = :camera_id"
+            params['camera_id'] = camera_id
+
+        with engine.connect() as connection:
+            rows = connection.execute(text(sql), params).all()
+
+        cameras = {}
+        for camera, danger, count, first_date, last_date in rows:
+            entry = cameras.setdefault(camera, {'total': 0, 'danger': 0, 'first_date': None, 'last_date': None})
+            entry['total'] += count
+            if danger:
+                entry['danger'] += count
+            if count > 0:
+                first_date, last_date = str(first_date)[:19], str(last_date)[:19]
+                if entry['first_date'] is None or first_date < entry['first_date']:
+                    entry['first_date'] = first_date
+                if entry['last_date'] is None or last_date > entry['last_date']:
+                    entry['last_date'] = last_date
+
+        dates = [entry for entry in cameras.values() if entry['first_date']]
+        return {
+            'total': sum(entry['total'] for entry in cameras.values()),
+            'danger': sum(entry['danger'] for entry in cameras.values()),
+            'first_date': min((entry['first_date'] for entry in dates), default=None),
+            'last_date': max((entry['last_date'] for entry in dates), default=None),
+            'cameras': cameras,
+        }
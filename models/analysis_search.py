@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+分析历史检索模块
+
+该模块基于SQLite FTS5全文索引(BM25排序)检索历史分析记录，
+并从用户问题中提取时间范围（例如 "this morning"、"last 2 hours"、"昨天下午"、"2025-09-20"、"last Tuesday"），
+聊天时只把最相关的少量记录加入提示，而不是全部历史
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+
+from .database import DESCRIPTION_SQL, engine
+
+logger = logging.getLogger("AnalysisSearch")
+
+# SQLAlchemy在SQLite中保存DateTime的字符串格式
+DB_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# 检索时忽略的常见词（包括时间相关的词，时间范围会单独提取）
+STOPWORDS = {
+    'a', 'about', 'after', 'ago', 'all', 'am', 'an', 'and', 'any', 'anyone', 'anything', 'are', 'at',
+    'be', 'been', 'before', 'between', 'but', 'by', 'can', 'could', 'day', 'days', 'did', 'do', 'does',
+    'during', 'evening', 'ever', 'for', 'from', 'had', 'has', 'have', 'hour', 'hours', 'how', 'i', 'if',
+    'in', 'is', 'it', 'last', 'me', 'minute', 'minutes', 'morning', 'afternoon', 'night', 'tonight',
+    'my', 'near', 'of', 'on', 'or', 'past', 'please', 'see', 'seen', 'since', 'so', 'some', 'someone',
+    'tell', 'than', 'that', 'the', 'there', 'this', 'to', 'today', 'until', 'was', 'were', 'what', 'when',
+    'where', 'which', 'who', 'why', 'with', 'within', 'yesterday', 'you', 'happen', 'happened', 'show', 'pm',
+    'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
+    'january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+    'november', 'december', 'jan', 'feb', 'mar', 'apr', 'jun', 'jul', 'aug', 'sep', 'sept', 'oct', 'nov', 'dec',
+    'st', 'nd', 'rd', 'th',
+}
+
+# 问题中的中文时间表达和虚词，提取关键词前先去掉
+CHINESE_FILLERS = re.compile(r'(?:\d{4}年)?\d{1,2}月\d{1,2}[日号]|(?:上|本|这)?(?:周|星期|礼拜)[一二三四五六日天]|'
+                             r'最近|过去|今天|昨天|昨晚|今晚|上午|早上|中午|下午|晚上|小时|分钟|[0-9一二三四五六七八九十几]+天|'
+                             r'有没有|是否|什么|发生|吗|呢|了|的|有|在|是')
+
+# 表示"危险"的词：不作为全文检索词，而是按danger字段过滤
+DANGER_WORDS = {'danger', 'dangerous', 'unsafe', 'threat', 'threats', 'hazard', 'hazards', '危险'}
+
+# 一天中各时段的起止小时
+DAY_PARTS = {
+    'morning': (5, 12),
+    'afternoon': (12, 18),
+    'evening': (18, 24),
+    'night': (18, 24),
+    '上午': (5, 12),
+    '早上': (5, 12),
+    '中午': (11, 14),
+    '下午': (12, 18),
+    '晚上': (18, 24),
+}
+
+UNIT_SECONDS = {
+    'minute': 60, 'minutes': 60, 'min': 60, 'mins': 60, '分钟': 60,
+    'hour': 3600, 'hours': 3600, '小时': 3600,
+    'day': 86400, 'days': 86400, '天': 86400,
+}
+
+CLOCK = r'(\d{1,2})(?::(\d{2}))?\s*(am|pm)?'
+
+WEEKDAYS = {
+    'monday': 0, 'tuesday': 1, 'wednesday': 2, 'thursday': 3, 'friday': 4, 'saturday': 5, 'sunday': 6,
+}
+CHINESE_WEEKDAYS = {'一': 0, '二': 1, '三': 2, '四': 3, '五': 4, '六': 5, '日': 6, '天': 6}
+
+MONTHS = {
+    'january': 1, 'jan': 1, 'february': 2, 'feb': 2, 'march': 3, 'mar': 3, 'april': 4, 'apr': 4, 'may': 5,
+    'june': 6, 'jun': 6, 'july': 7, 'jul': 7, 'august': 8, 'aug': 8, 'september': 9, 'sept': 9, 'sep': 9,
+    'october': 10, 'oct': 10, 'november': 11, 'nov': 11, 'december': 12, 'dec': 12,
+}
+MONTH = r'(' + '|'.join(sorted(MONTHS, key=len, reverse=True)) + r')\.?'
+ORDINAL = r'(\d{1,2})(?:st|nd|rd|th)?'
+
+# 像日期但无法确定是哪一天的写法（例如 "9/20"），遇到时不按今天过滤
+DATE_LIKE = re.compile(r'\d{4}[-/.]\d{1,2}|\d{1,2}/\d{1,2}|\d{1,2}月')
+
+
+def _clock_to_datetime(day: datetime, hour: str, minute: Optional[str], meridiem: Optional[str]) -> Optional[datetime]:
+    """将 "9:30"、"3pm" 之类的时间转换为指定日期上的时间点"""
+    hour = int(hour)
+    minute = int(minute) if minute else 0
+    if meridiem:
+        meridiem = meridiem.lower()
+        if meridiem == 'pm' and hour < 12:
+            hour += 12
+        elif meridiem == 'am' and hour == 12:
+            hour = 0
+    if hour > 23 or minute > 59:
+        return None
+    return day.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+
+def _make_day(year: Optional[str], month: int, day: str, midnight: datetime) -> Optional[datetime]:
+    """构造日期，没有年份时取不晚于今天的最近一个该日期"""
+    try:
+        result = datetime(int(year) if year else midnight.year, month, int(day))
+    except ValueError:
+        return None
+    if not year and result > midnight:
+        try:
+            result = result.replace(year=result.year - 1)
+        except ValueError:
+            return None
+    return result
+
+
+def _resolve_day(q: str, midnight: datetime) -> Optional[datetime]:
+    """
+    从问题中确定是哪一天
+
+    支持 "2025-09-20"、"2025年9月20日"、"September 20"、"20 Sep 2025"、"last Tuesday"、"上周二"、
+    "yesterday"、"今天" 等写法
+
+    Returns:
+        datetime: 当天零点，没有找到日期时为None
+    """
+    match = re.search(r'(?<!\d)(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?!\d)', q)
+    if match:
+        return _make_day(match.group(1), int(match.group(2)), match.group(3), midnight)
+    match = re.search(r'(?:(\d{4})年)?(\d{1,2})月(\d{1,2})[日号]', q)
+    if match:
+        return _make_day(match.group(1), int(match.group(2)), match.group(3), midnight)
+    match = re.search(r'\b' + MONTH + r'\s+' + ORDINAL + r'\b(?:,?\s+(\d{4})\b)?', q)
+    if match:
+        return _make_day(match.group(3), MONTHS[match.group(1)], match.group(2), midnight)
+    match = re.search(r'\b' + ORDINAL + r'\s+(?:of\s+)?' + MONTH + r'(?:,?\s+(\d{4})\b)?', q)
+    if match:
+        return _make_day(match.group(3), MONTHS[match.group(2)], match.group(1), midnight)
+
+    # 星期："last Tuesday" 是今天之前最近的星期二，"Tuesday"、"this Tuesday" 可以是今天
+    match = re.search(r'\b(?:(last|this|on)\s+)?(' + '|'.join(WEEKDAYS) + r')\b', q)
+    if match:
+        days_ago = (midnight.weekday() - WEEKDAYS[match.group(2)]) % 7
+        if match.group(1) == 'last' and days_ago == 0:
+            days_ago = 7
+        return midnight - timedelta(days=days_ago)
+    # "上周二" 是上一个自然周的星期二，"周二"、"星期二" 是最近的星期二
+    match = re.search(r'(上|本|这)?(?:周|星期|礼拜)([一二三四五六日天])', q)
+    if match:
+        weekday = CHINESE_WEEKDAYS[match.group(2)]
+        if match.group(1) == '上':
+            return midnight - timedelta(days=midnight.weekday() + 7 - weekday)
+        return midnight - timedelta(days=(midnight.weekday() - weekday) % 7)
+
+    if 'yesterday' in q or '昨天' in q or '昨晚' in q or 'last night' in q:
+        return midnight - timedelta(days=1)
+    if 'today' in q or '今天' in q or 'this ' in q or 'tonight' in q or '今晚' in q:
+        return midnight
+    return None
+
+
+def extract_time_range(question: str, now: Optional[datetime] = None) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    从问题中提取时间范围
+
+    Args:
+        question (str): 用户问题
+        now (datetime): 当前时间，默认为datetime.now()
+
+    Returns:
+        tuple: (开始时间, 结束时间)，没有找到时间描述时为 (None, None)
+    """
+    now = now or datetime.now()
+    q = question.lower()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    # 相对时间："last 2 hours"、"past 30 minutes"、"最近3小时"、"过去10分钟"
+    match = re.search(r'(?:last|past|previous|within)\s+(\d+)\s*(minutes?|mins?|hours?|days?)', q) or \
+        re.search(r'(?:最近|过去)\s*(\d+)\s*(分钟|小时|天)', q)
+    if match:
+        return now - timedelta(seconds=int(match.group(1)) * UNIT_SECONDS[match.group(2)]), now
+
+    match = re.search(r'(?:last|past|previous)\s+(minute|hour|day)\b', q) or re.search(r'(?:最近|过去)\s*一?(分钟|小时|天)', q)
+    if match:
+        return now - timedelta(seconds=UNIT_SECONDS[match.group(1)]), now
+
+    # 确定是哪一天；问题提到了无法解析的日期时不要默认按今天过滤
+    day = _resolve_day(q, midnight)
+    if day is None and DATE_LIKE.search(q):
+        return None, None
+
+    # 时间点："since 9:30"、"after 3pm"、"before 10"、"between 9 and 11"、"from 8:00 to 9:00"
+    base_day = day or midnight
+    match = re.search(r'(?:between|from)\s+' + CLOCK + r'\s+(?:and|to|-)\s+' + CLOCK, q)
+    if match:
+        # "between 1 and 2pm"：开始时间没有am/pm时沿用结束时间的
+        start_meridiem = match.group(3) or (match.group(6) if int(match.group(1)) <= int(match.group(4)) else None)
+        start = _clock_to_datetime(base_day, match.group(1), match.group(2), start_meridiem)
+        end = _clock_to_datetime(base_day, *match.group(4, 5, 6))
+        if start and end:
+            return start, end
+    match = re.search(r'(?:since|after)\s+' + CLOCK, q)
+    if match:
+        start = _clock_to_datetime(base_day, *match.group(1, 2, 3))
+        if start:
+            return start, (base_day + timedelta(days=1) if day and day < midnight else now)
+    match = re.search(r'before\s+' + CLOCK, q)
+    if match:
+        end = _clock_to_datetime(base_day, *match.group(1, 2, 3))
+        if end:
+            return base_day, end
+
+    # 一天中的时段："this morning"、"yesterday afternoon"、"昨晚"、"今天下午"
+    if 'last night' in q or '昨晚' in q:
+        return midnight - timedelta(hours=6), midnight + timedelta(hours=6)
+    for part, (start_hour, end_hour) in DAY_PARTS.items():
+        if part in q or (part == 'evening' and ('tonight' in q or '今晚' in q)):
+            part_day = day or midnight
+            return part_day + timedelta(hours=start_hour), min(part_day + timedelta(hours=end_hour), max(now, part_day))
+
+    if day is not None:
+        return day, min(day + timedelta(days=1), now)
+
+    return None, None
+
+
+def extract_keywords(question: str) -> List[str]:
+    """
+    从问题中提取检索关键词（去掉常见词、时间表达式和数字）
+
+    Args:
+        question (str): 用户问题
+
+    Returns:
+        list: 关键词列表（保持原有顺序，去重）
+    """
+    keywords = []
+    question = CHINESE_FILLERS.sub(' ', question.lower())
+    for token in re.findall(r'[a-z][a-z\-]+|[一-鿿]+', question):
+        token = token.strip('-')
+        if len(token) < 2 or token in STOPWORDS or token in keywords:
+            continue
+        keywords.append(token)
+    return keywords
+
+
+class AnalysisSearchIndex:
+    """分析历史检索类"""
+
+    def __init__(self, top_k: int = 5):
+        """
+        初始化检索器
+
+        Args:
+            top_k (int): 默认返回的记录数量
+        """
+        self.top_k = top_k
+
+    @staticmethod
+    def _id_range(connection, start: Optional[datetime], end: Optional[datetime]) -> Tuple[Optional[int], Optional[int]]:
+        """
+        通过时间索引把时间范围换算为记录ID范围
+
+        记录ID随时间单调递增，按ID范围过滤可以直接使用主键，避免对全部匹配结果比较时间
+        """
+        low = high = None
+        if start is not None:
+            low = connection.execute(text(
+                "SELECT id FROM analysis_records WHERE date >= :start ORDER BY date LIMIT 1"
+            ), {'start': start.strftime(DB_DATETIME_FORMAT)}).scalar()
+            if low is None:
+                return 0, -1
+        if end is not None:
+            high = connection.execute(text(
+                "SELECT id FROM analysis_records WHERE date < :end ORDER BY date DESC LIMIT 1"
+            ), {'end': end.strftime(DB_DATETIME_FORMAT)}).scalar()
+            if high is None:
+                return 0, -1
+        return low, high
+
+    def search(self, question: str, k: Optional[int] = None, now: Optional[datetime] = None) -> List[dict]:
+        """
+        检索与问题最相关的分析记录
+
+        有关键词时按BM25相关度排序；只有时间范围时返回该范围内的危险记录和最近记录
+
+        Args:
+            question (str): 用户问题
+            k (int): 返回的记录数量
+            now (datetime): 当前时间（用于解析相对时间）
+
+        Returns:
+            list: 记录字典列表，每个包含 id、date、description、danger、camera_id，按时间顺序排列
+        """
+        k = k or self.top_k
+        start, end = extract_time_range(question, now)
+        keywords = extract_keywords(question)
+        danger_only = any(keyword in DANGER_WORDS for keyword in keywords)
+        keywords = [keyword for keyword in keywords if keyword not in DANGER_WORDS]
+        if not keywords and start is None and not danger_only:
+            return []
+
+        try:
+            with engine.connect() as connection:
+                low, high = self._id_range(connection, start, end)
+                params = {'k': k}
+                conditions = []
+                if low is not None:
+                    conditions.append("{rowid} >= :low")
+                    params['low'] = low
+                if high is not None:
+                    conditions.append("{rowid} <= :high")
+                    params['high'] = high
+                if danger_only:
+                    conditions.append("{danger} = 1")
+
+                if keywords:
+                    params['query'] = ' OR '.join('"' + keyword.replace('"', '') + '"' for keyword in keywords)
+                    # 全文索引建立在去重后的描述上，相同描述的记录相关度相同，较新的记录优先
+                    where = ' AND '.join(["analysis_fts MATCH :query"] +
+                                         [c.format(rowid='r.id', danger='r.danger') for c in conditions])
+                    sql = ("SELECT r.id, r.date, r.danger, r.camera_id, r.description_id FROM analysis_fts "
+                           "JOIN analysis_records r ON r.description_id = analysis_fts.rowid "
+                           f"WHERE {where} ORDER BY rank, r.id DESC LIMIT :k")
+                else:
+                    where = ' AND '.join(c.format(rowid='id', danger='danger') for c in conditions)
+                    sql = ("SELECT id, date, danger, camera_id, description_id FROM analysis_records "
+                           f"WHERE {where} ORDER BY danger DESC, id DESC LIMIT :k")
+
+                # 排序后只为返回的记录解压描述
+                rows = connection.execute(text(
+                    f"SELECT id, date, {DESCRIPTION_SQL}, danger, camera_id FROM ({sql})"), params).all()
+        except Exception as e:
+            logger.error(f"检索分析历史时出错: {e}")
+            return []
+
+        records = [
+            {'id': row[0], 'date': str(row[1])[:19], 'description': row[2], 'danger': bool(row[3]),
+             'camera_id': row[4]}
+            for row in rows
+        ]
+        records.sort(key=lambda record: record['id'])
+        return records
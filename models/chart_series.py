@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+图表数据序列模块
+
+数据可视化接收器原来只保留最新一个数据包，图表历史要由浏览器轮询后自己拼接。该模块为每个序列保存最近的读数：
+- 固定容量的环形缓冲区，时间戳和数值保存在预先分配的numpy数组中，写满后覆盖最旧的读数，内存占用不随运行时间增长
+- 只保留最近window秒的读数（查询时过滤），时间戳严格递增，查询按时间二分查找
+- 支持增量查询（只返回since之后的读数），浏览器只需取新增的点
+- Largest-Triangle-Three-Buckets（LTTB）降采样到指定点数：每个桶保留与前后点构成三角形面积最大的点，
+  保留峰谷形状，24小时的曲线一次请求几百个点即可
+"""
+
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def lttb(timestamps: np.ndarray, values: np.ndarray, threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Largest-Triangle-Three-Buckets降采样
+
+    第一个和最后一个点保留，其余点平均分为threshold-2个桶，每个桶选出与上一个选中点、
+    下一个桶的平均点构成的三角形面积最大的点
+
+    Args:
+        timestamps (np.ndarray): 按时间排序的时间戳
+        values (np.ndarray): 对应的数值
+        threshold (int): 降采样后的点数
+
+    Returns:
+        tuple: (时间戳数组, 数值数组)，点数不超过threshold时原样返回
+    """
+    count = len(timestamps)
+    if threshold >= count or count <= 2:
+        return timestamps, values
+    if threshold <= 2:
+        index = np.array([0, count - 1])
+        return timestamps[index], values[index]
+
+    # 桶边界：第一个和最后一个点单独成桶
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = count - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # 下一个桶的平均点（最后一个桶的下一个点是最后一个点）
+        next_start, next_end = end, edges[bucket + 2] if bucket + 2 < len(edges) else count
+        next_t = timestamps[next_start:next_end].mean()
+        next_v = values[next_start:next_end].mean()
+        # 三角形面积（省略1/2）
+        t, v = timestamps[start:end], values[start:end]
+        areas = np.abs((timestamps[previous] - next_t) * (v - values[previous])
+                       - (timestamps[previous] - t) * (next_v - values[previous]))
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return timestamps[selected], values[selected]
+
+
+class ChartSeries:
+    """单个图表序列的环形缓冲区"""
+
+    def __init__(self, name: str, capacity: int = 86400, window: float = 86400.0):
+        """
+        初始化图表序列
+
+        Args:
+            name (str): 序列名称
+            capacity (int): 最多保存的读数数量
+            window (float): 保留的时间范围（秒），更早的读数不再返回
+        """
+        self.name = name
+        self.capacity = capacity
+        self.window = window
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float64)
+        # 下一个写入位置和当前读数数量
+        self.head = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def append(self, timestamp: float, value: float) -> None:
+        """
+        追加一个读数
+
+        Args:
+            timestamp (float): Unix时间戳，不晚于上一个读数时记为紧接其后的时刻（保持严格递增，增量查询不会漏点）
+            value (float): 数值
+        """
+        with self.lock:
+            if self.size:
+                last = self.timestamps[(self.head - 1) % self.capacity]
+                if timestamp <= last:
+                    timestamp = float(np.nextafter(last, np.inf))
+            self.timestamps[self.head] = timestamp
+            self.values[self.head] = value
+            self.head = (self.head + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+
+    def _ordered(self) -> Tuple[np.ndarray, np.ndarray]:
+        """按时间顺序返回所有读数的副本（调用方持有锁）"""
+        if self.size < self.capacity:
+            return self.timestamps[:self.size].copy(), self.values[:self.size].copy()
+        return (np.concatenate((self.timestamps[self.head:], self.timestamps[:self.head])),
+                np.concatenate((self.values[self.head:], self.values[:self.head])))
+
+    def query(self, since: Optional[float] = None, start: Optional[float] = None,
+              end: Optional[float] = None, points: Optional[int] = None) -> dict:
+        """
+        查询读数
+
+        Args:
+            since (float): 只返回时间戳大于since的读数（增量查询）
+            start (float): 开始时间（包含），为None时为最近window秒
+            end (float): 结束时间（包含）
+            points (int): 读数超过该数量时用LTTB降采样
+
+        Returns:
+            dict: {"series", "t": [...], "v": [...], "last": 最新读数的时间戳, "count": 降采样前的读数数量,
+                   "downsampled": 是否降采样}
+        """
+        with self.lock:
+            # 在锁内复制有序视图，之后的查找和降采样不阻塞写入
+            timestamps, values = self._ordered()
+        oldest = time.time() - self.window
+        lower = max(oldest, start) if start is not None else oldest
+        left = int(np.searchsorted(timestamps, lower, side='left'))
+        if since is not None:
+            left = max(left, int(np.searchsorted(timestamps, since, side='right')))
+        right = len(timestamps) if end is None else int(np.searchsorted(timestamps, end, side='right'))
+        timestamps, values = timestamps[left:right], values[left:right]
+
+        count = len(timestamps)
+        if points is not None and count > points:
+            timestamps, values = lttb(timestamps, values, points)
+        return {
+            'series': self.name,
+            't': [float(t) for t in timestamps],
+            'v': [round(float(v), 4) for v in values],
+            'last': float(timestamps[-1]) if count else since,
+            'count': count,
+            'downsampled': len(timestamps) < count,
+        }
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+聊天上下文窗口模块
+
+该模块在内存中维护最近N个事件（连续、结论相同的分析记录合并而成）的格式化文本，
+每保存或收到一条新的分析结果就增量更新一次，
+构造聊天提示时直接取用，不再每次查询SQLite
+
+当前事件仍在延续时只替换末尾一项的文本，一次打架不会占满整个窗口
+
+窗口按块淘汰旧记录：新记录只追加在文本末尾，攒满一块后才一次性移除最旧的一块，
+这样相邻两次提问的上下文拥有相同的前缀，后端可以复用已计算的KV缓存
+"""
+
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Optional, Tuple, Union
+
+from .incidents import IncidentStore
+
+logger = logging.getLogger("ChatContext")
+
+# 没有历史数据时的默认上下文
+EMPTY_CONTEXT = "No previous analysis data available."
+
+
+class AnalysisContextWindow:
+    """分析记录上下文窗口类
+
+    只保存已格式化的文本，写入时拼接一次，读取时为常数时间；
+    每次变化版本号加1，调用方可以据此判断上下文是否变化
+
+    窗口中的每一项是一个事件或一条单独的分析记录：
+    (键, 文本, 摄像头标识, 第一条记录ID, 最后一条记录ID)
+    """
+
+    def __init__(self, max_records: int = 20, block_size: int = 10):
+        """
+        初始化上下文窗口
+
+        Args:
+            max_records (int): 窗口中至少保留的事件（或分析记录）数量
+            block_size (int): 每次淘汰的数量，窗口最多保留 max_records + block_size - 1 项
+        """
+        self.max_records = max_records
+        self.block_size = max(1, block_size)
+        self.entries: deque = deque()
+        self.version = 0
+        self.newest_record_id: Optional[int] = None
+        self.text = EMPTY_CONTEXT
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def format_record(date: Union[datetime, str], description: str, danger: bool) -> str:
+        """
+        将一条分析记录格式化为上下文文本
+
+        Args:
+            date (datetime or str): 分析时间
+            description (str): 分析描述
+            danger (bool): 是否危险
+
+        Returns:
+            str: 格式化后的文本
+        """
+        if isinstance(date, datetime):
+            date = date.strftime('%Y-%m-%d %H:%M:%S')
+        return (f"**time**: {date}\n"
+                f"**danger**: {'yes' if danger else 'no'}\n"
+                f"**description**: {description}\n")
+
+    @staticmethod
+    def format_incident(incident: dict) -> str:
+        """
+        将一个事件格式化为上下文文本
+
+        Args:
+            incident (dict): 事件字典（见 models.incidents.incident_to_dict）
+
+        Returns:
+            str: 格式化后的文本
+        """
+        if incident['record_count'] <= 1:
+            time_range = incident['start_date']
+        else:
+            time_range = f"{incident['start_date']} - {incident['end_date']} ({incident['record_count']} analyses)"
+        danger = f"yes (severity {incident['peak_severity']})" if incident['danger'] else 'no'
+        descriptions = "\n".join(f"- {sample}" for sample in incident['samples'])
+        return (f"**time**: {time_range}\n"
+                f"**camera**: {incident['camera_id']}\n"
+                f"**danger**: {danger}\n"
+                f"**description**:\n{descriptions}\n")
+
+    def _append(self, entry: tuple) -> None:
+        """追加一项，攒满一块后整块淘汰最旧的项（调用方持有锁）"""
+        self.entries.append(entry)
+        if len(self.entries) >= self.max_records + self.block_size:
+            # 整块淘汰最旧的项，前缀只在这时变化
+            for _ in range(self.block_size):
+                self.entries.popleft()
+            self.text = "\n".join(item[1] for item in self.entries)
+        elif len(self.entries) == 1:
+            self.text = entry[1]
+        else:
+            # 只在末尾追加，保持已有文本不变
+            self.text = self.text + "\n" + entry[1]
+
+    def add(self, record_id: Optional[int], date: Union[datetime, str], description: str, danger: bool) -> int:
+        """
+        向窗口追加一条分析记录
+
+        Args:
+            record_id (int): 数据库记录ID，未知时为None
+            date (datetime or str): 分析时间
+            description (str): 分析描述
+            danger (bool): 是否危险
+
+        Returns:
+            int: 更新后的版本号
+        """
+        entry = self.format_record(date, description, danger)
+        with self.lock:
+            # 启动时加载的记录可能与随后收到的UDP消息重复
+            if record_id is not None and any(item[0] == ('record', record_id) for item in self.entries):
+                return self.version
+
+            self._append((('record', record_id), entry, None, record_id, record_id))
+            if record_id is not None:
+                self.newest_record_id = max(self.newest_record_id or 0, record_id)
+            self.version += 1
+            return self.version
+
+    def update_incident(self, incident: dict) -> int:
+        """
+        加入或更新一个事件：已在窗口中的事件就地替换文本，否则追加
+
+        当前事件通常是窗口的最后一项，替换时已有前缀保持不变
+
+        Args:
+            incident (dict): 事件字典（见 models.incidents.incident_to_dict）
+
+        Returns:
+            int: 更新后的版本号
+        """
+        key = ('incident', incident['camera_id'], incident['start_date'])
+        entry = (key, self.format_incident(incident), incident['camera_id'],
+                 incident['first_record_id'], incident['last_record_id'])
+        with self.lock:
+            position = next((i for i, item in enumerate(self.entries) if item[0] == key), None)
+            if position is None:
+                self._append(entry)
+            elif self.entries[position][1] == entry[1]:
+                # 启动时加载的事件可能与随后收到的UDP消息重复
+                return self.version
+            else:
+                self.entries[position] = entry
+                self.text = "\n".join(item[1] for item in self.entries)
+            if incident['last_record_id'] is not None:
+                self.newest_record_id = max(self.newest_record_id or 0, incident['last_record_id'])
+            self.version += 1
+            return self.version
+
+    def contains(self, record_id: int, camera_id: Optional[str] = None) -> bool:
+        """
+        判断记录是否已在窗口中（单独的记录，或属于窗口中的某个事件）
+
+        Args:
+            record_id (int): 数据库记录ID
+            camera_id (str): 记录的摄像头标识，None表示不检查摄像头
+
+        Returns:
+            bool: 是否在窗口中
+        """
+        with self.lock:
+            for _, _, camera, first_id, last_id in self.entries:
+                if first_id is None or last_id is None:
+                    continue
+                if first_id <= record_id <= last_id and (camera is None or camera_id is None or camera == camera_id):
+                    return True
+            return False
+
+    def snapshot(self) -> Tuple[int, str, Optional[int]]:
+        """
+        获取当前上下文
+
+        Returns:
+            tuple: (版本号, 上下文文本, 最新记录ID)
+        """
+        with self.lock:
+            return self.version, self.text, self.newest_record_id
+
+    def load_from_db(self) -> None:
+        """启动时从数据库加载最近的事件，之后只做增量更新"""
+        try:
+            incidents = IncidentStore().recent(self.max_records)
+            for incident in incidents:  # 按时间顺序排列
+                self.update_incident(incident)
+
+            logger.info(f"已从数据库加载 {len(incidents)} 个事件到上下文窗口")
+        except Exception as e:
+            logger.error(f"从数据库加载上下文窗口时出错: {e}")
@@ -3,31 +3,40 @@
 数据可视化接收器模块
 
 该模块实现了接收和处理可视化数据的功能
+
+除最新数据包外，每个数据包中的数值字段按序列保存在环形缓冲区中（见chart_series.py），
+图表可以一次取回历史曲线（LTTB降采样）并增量获取新增的点：
+- 数据包（或其中的data对象）为 {"series": 名称, "value": 数值, "timestamp": 时间戳} 时记录为一个序列的读数
+- 否则除timestamp外的每个数值字段各为一个序列，时间戳取timestamp字段，没有时为接收时间
 """
 
 import socket
 import threading
 import json
 import logging
+import time
+from typing import Dict, List, Optional
+
+from .chart_series import ChartSeries
 
-# 设置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger("DataVisualizerReceiver")
 
 
 class DataVisualizerReceiver:
     """数据可视化接收器类"""
     
-    def __init__(self, port=5002, host='localhost'):
+    def __init__(self, port=5002, host='localhost', on_data=None, capacity=86400, window=86400.0,
+                 max_series=32):
         """
         初始化数据可视化接收器
         
         Args:
             port (int): 接收数据的UDP端口
             host (str): 主机地址
+            on_data (callable): 收到新数据时的回调函数，参数为数据包
+            capacity (int): 每个序列最多保存的读数数量
+            window (float): 每个序列保留的时间范围（秒）
+            max_series (int): 最多记录的序列数量，超出后新序列被忽略
         """
         self.port = port
         self.host = host
@@ -35,6 +44,14 @@ class DataVisualizerReceiver:
         self.running = False
         self.latest_data = None
         self.data_lock = threading.Lock()
+        self.on_data = on_data
+        
+        # 图表序列（序列名称 -> 环形缓冲区）
+        self.capacity = capacity
+        self.window = window
+        self.max_series = max_series
+        self.series: Dict[str, ChartSeries] = {}
+        self.series_lock = threading.Lock()
         
         logger.info(f"初始化数据可视化接收器，端口: {port}")
     
@@ -66,6 +83,11 @@ class DataVisualizerReceiver:
                 # 更新最新数据
                 with self.data_lock:
                     self.latest_data = packet
+                self._record(packet)
+                
+                # 通知订阅者有新数据
+                if self.on_data:
+                    self.on_data(packet)
                     
                 logger.debug(f"接收到来自 {addr} 的数据: {packet}")
                 
@@ -74,6 +96,68 @@ class DataVisualizerReceiver:
             except Exception as e:
                 logger.error(f"接收数据时出错: {e}")
     
+    def _record(self, packet) -> None:
+        """
+        把数据包中的数值记录到对应的序列
+        
+        Args:
+            packet: 数据包
+        """
+        if not isinstance(packet, dict):
+            return
+        data = packet.get('data') if isinstance(packet.get('data'), dict) else packet
+        timestamp = data.get('timestamp')
+        if not _is_number(timestamp):
+            timestamp = time.time()
+        if 'series' in data and 'value' in data:
+            samples = {str(data['series']): data['value']}
+        else:
+            samples = {key: value for key, value in data.items() if key != 'timestamp'}
+        for name, value in samples.items():
+            if not _is_number(value):
+                continue
+            series = self._get_series(name)
+            if series is not None:
+                series.append(float(timestamp), float(value))
+    
+    def _get_series(self, name: str) -> Optional[ChartSeries]:
+        """获取序列，不存在时创建（超出最大序列数量时返回None）"""
+        with self.series_lock:
+            series = self.series.get(name)
+            if series is None:
+                if len(self.series) >= self.max_series:
+                    return None
+                series = ChartSeries(name, self.capacity, self.window)
+                self.series[name] = series
+                logger.info(f"新的图表序列: {name}")
+            return series
+    
+    def series_names(self) -> List[str]:
+        """已记录的序列名称"""
+        with self.series_lock:
+            return sorted(self.series)
+    
+    def query_series(self, names: Optional[List[str]] = None, since: Optional[float] = None,
+                     start: Optional[float] = None, end: Optional[float] = None,
+                     points: Optional[int] = None) -> Dict[str, dict]:
+        """
+        查询序列的读数
+        
+        Args:
+            names (list): 序列名称，为None时查询所有序列（不存在的序列被忽略）
+            since (float): 只返回时间戳大于since的读数（增量查询）
+            start (float): 开始时间（Unix时间戳）
+            end (float): 结束时间（Unix时间戳）
+            points (int): 每个序列最多返回的点数（LTTB降采样）
+        
+        Returns:
+            dict: 序列名称 -> {"series", "t", "v", "last", "count", "downsampled"}
+        """
+        with self.series_lock:
+            selected = [self.series[name] for name in (names or sorted(self.series)) if name in self.series]
+        return {series.name: series.query(since=since, start=start, end=end, points=points)
+                for series in selected}
+    
     def get_latest_data(self):
         """获取最新数据"""
         with self.data_lock:
@@ -84,4 +168,9 @@ class DataVisualizerReceiver:
         self.running = False
         if self.socket:
             self.socket.close()
-        logger.info("数据可视化接收器已停止")
\ No newline at end of file
+        logger.info("数据可视化接收器已停止")
+
+
+def _is_number(value) -> bool:
+    """是否为数值（bool除外）"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
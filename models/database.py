@@ -3,21 +3,85 @@
 数据库模型和初始化代码
 
 该模块实现了SQLite数据库的初始化和ORM模型定义
+
+导入该模块不会访问数据库：引擎在第一次使用时才建立连接，建表和迁移由入口程序显式调用init_db()执行
 """
 
+import hashlib
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean
+import threading
+from sqlalchemy import (create_engine, event, text, Column, Integer, String, Text, DateTime, Boolean, Float, Index,
+                        LargeBinary)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
-# 数据库文件路径
-DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'vlm_demo.db')
+from .description_store import (MIN_TRAINING_SAMPLES, TRAINING_SAMPLES, DescriptionCodec, dictionary_transaction,
+                                store_dictionary)
+
+# 数据库文件路径（可通过环境变量VLM_DB_PATH指定，例如测试时使用临时数据库）
+DB_PATH = os.environ.get('VLM_DB_PATH') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'vlm_demo.db')
 DB_URL = f'sqlite:///{DB_PATH}'
 
+# SQLite同步级别：NORMAL在WAL模式下不会因应用崩溃丢失已提交的事务，断电时可能丢失最后几个事务；
+# FULL每次提交都等待落盘
+DB_SYNCHRONOUS = os.environ.get('VLM_DB_SYNCHRONOUS', 'NORMAL').upper()
+
 # 创建数据库引擎
 engine = create_engine(DB_URL, echo=False)
 
+# 分析描述压缩（zlib预置字典），注册为SQLite函数
+description_codec = DescriptionCodec(DB_PATH)
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """每个新连接设置SQLite参数：增量回收空间、WAL日志（读写互不阻塞）、同步级别、忙等待和缓存"""
+    cursor = dbapi_connection.cursor()
+    # 只对新建的数据库立即生效；已有数据库需执行一次VACUUM（见retention.py --vacuum）
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS if DB_SYNCHRONOUS in ('OFF', 'NORMAL', 'FULL', 'EXTRA') else 'NORMAL'}")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA cache_size=-16000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+    register_sql_functions(dbapi_connection)
+
+
+def register_sql_functions(dbapi_connection):
+    """
+    注册描述存储使用的SQLite函数（直接用sqlite3连接写入分析记录时也需要调用）
+
+    - description_hash(text): 描述的内容地址
+    - description_compress(text): 使用当前字典压缩描述
+    - description_text(data): 解压描述
+    """
+    dbapi_connection.create_function("description_hash", 1, description_hash, deterministic=True)
+    dbapi_connection.create_function("description_compress", 1, description_codec.compress)
+    dbapi_connection.create_function("description_text", 1, description_codec.decompress, deterministic=True)
+
+
+def description_hash(description):
+    """
+    描述的内容地址：规范化（忽略大小写和空白差异）后SHA-1的前8字节
+
+    哈希只用于查找，相同哈希下仍按原文比较，只有原文完全相同的描述才共用一行，查询结果不变
+
+    Args:
+        description (str): 分析描述
+
+    Returns:
+        int: 64位有符号整数哈希，描述为None时为None
+    """
+    if description is None:
+        return None
+    normalized = ' '.join(str(description).split()).lower()
+    return int.from_bytes(hashlib.sha1(normalized.encode('utf-8')).digest()[:8], 'big', signed=True)
+
+# 查询分析记录描述的SQL表达式（描述去重压缩保存在analysis_descriptions中，只在FROM analysis_records的查询中使用）
+DESCRIPTION_SQL = "(SELECT description_text(data) FROM analysis_descriptions d WHERE d.id = description_id)"
+
 # 创建基类
 Base = declarative_base()
 
@@ -30,11 +94,41 @@ class AnalysisRecord(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     date = Column(DateTime, default=datetime.utcnow)
+    # 写入时的描述：插入后由触发器移到analysis_descriptions并置为NULL，读取时使用DESCRIPTION_SQL
     description = Column(Text)
     danger = Column(Boolean, default=False)
+    camera_id = Column(String(64), default="default", server_default="default")
+    description_id = Column(Integer)
+    
+    def __repr__(self):
+        return f"<AnalysisRecord(id={self.id}, date={self.date}, danger={self.danger}, camera_id={self.camera_id})>"
+
+class AnalysisDescription(Base):
+    """分析描述模型（按内容去重，静止场景下大量分析记录共用同一条描述）"""
+    __tablename__ = "analysis_descriptions"
+    __table_args__ = (
+        Index('ix_analysis_descriptions_hash', 'hash'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    hash = Column(Integer, nullable=False)  # description_hash(描述)
+    data = Column(LargeBinary, nullable=False)  # description_compress(描述)，用description_text(data)读取
+    
+    def __repr__(self):
+        return f"<AnalysisDescription(id={self.id}, hash={self.hash})>"
+
+class DescriptionDictionary(Base):
+    """描述压缩字典模型"""
+    __tablename__ = "description_dictionaries"
+    # 字典ID不重复使用：回滚或删除的字典ID如果被新字典复用，用旧ID压缩的描述会用错字典解压
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f"<AnalysisRecord(id={self.id}, date={self.date}, danger={self.danger})>"
+        return f"<DescriptionDictionary(id={self.id}, size={len(self.data or b'')})>"
 
 class ChatRecord(Base):
     """聊天记录模型"""
@@ -42,21 +136,377 @@ class ChatRecord(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
+    session_id = Column(String(64), index=True)
     user_message = Column(Text)
     assistant_response = Column(Text)
     
     def __repr__(self):
-        return f"<ChatRecord(id={self.id}, timestamp={self.timestamp})>"
+        return f"<ChatRecord(id={self.id}, timestamp={self.timestamp}, session_id={self.session_id})>"
 
-def init_db():
-    """初始化数据库"""
-    # 创建数据目录（如果不存在）
-    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
+class ChatSummary(Base):
+    """聊天会话摘要模型（较早的对话被压缩为滚动摘要）"""
+    __tablename__ = "chat_summaries"
+    
+    session_id = Column(String(64), primary_key=True)
+    summary = Column(Text)
+    last_record_id = Column(Integer)  # 摘要已包含的最后一条聊天记录ID
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<ChatSummary(session_id={self.session_id}, last_record_id={self.last_record_id})>"
+
+class LuxRollup(Base):
+    """光照度汇总模型（按小时/天聚合，由Web UI收到传感器数据时增量更新）"""
+    __tablename__ = "lux_rollups"
+    
+    bucket = Column(String(8), primary_key=True)  # "hour" 或 "day"
+    period_start = Column(DateTime, primary_key=True)
+    count = Column(Integer, default=0)
+    total = Column(Float, default=0.0)
+    minimum = Column(Float)
+    maximum = Column(Float)
+    
+    def __repr__(self):
+        return f"<LuxRollup(bucket={self.bucket}, period_start={self.period_start}, count={self.count})>"
+
+class AnalysisSummary(Base):
+    """分析摘要模型（超过保留期的分析记录按连续的危险/安全时段合并为一行）"""
+    __tablename__ = "analysis_summaries"
+    __table_args__ = (Index('ix_analysis_summaries_camera_end', 'camera_id', 'end_date'),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    camera_id = Column(String(64), default="default")
+    start_date = Column(DateTime)
+    end_date = Column(DateTime)
+    danger = Column(Boolean, default=False)
+    record_count = Column(Integer, default=0)
+    description = Column(Text)  # 时段内第一条记录的描述
     
-    # 创建所有表
-    Base.metadata.create_all(bind=engine)
+    def __repr__(self):
+        return (f"<AnalysisSummary(id={self.id}, camera_id={self.camera_id}, start_date={self.start_date}, "
+                f"end_date={self.end_date}, danger={self.danger}, record_count={self.record_count})>")
+
+class Incident(Base):
+    """事件模型（同一摄像头连续、结论相同的分析记录合并为一个事件）"""
+    __tablename__ = "incidents"
+    __table_args__ = (
+        Index('ix_incidents_start', 'start_date'),
+        Index('ix_incidents_camera_start', 'camera_id', 'start_date'),
+        Index('ix_incidents_danger_start', 'danger', 'start_date'),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    camera_id = Column(String(64), default="default")
+    start_date = Column(DateTime)
+    end_date = Column(DateTime)
+    danger = Column(Boolean, default=False)
+    peak_severity = Column(Integer, default=0)  # 单次分析命中的危险类别数的最大值
+    record_count = Column(Integer, default=0)
+    first_record_id = Column(Integer)
+    last_record_id = Column(Integer)
+    samples = Column(Text)  # 代表性描述（JSON数组）
+    frame_path = Column(String(255))  # 代表帧（严重程度最高的一次分析）
+    
+    def __repr__(self):
+        return (f"<Incident(id={self.id}, camera_id={self.camera_id}, start_date={self.start_date}, "
+                f"end_date={self.end_date}, danger={self.danger}, record_count={self.record_count})>")
+
+# 相邻两次分析间隔超过该时间（秒）时开始新的事件
+DEFAULT_INCIDENT_GAP = 300
+
+# 汇总粒度及对应的时间截断格式（与SQLAlchemy保存DateTime的字符串格式一致）
+ROLLUP_BUCKETS = {
+    'hour': '%Y-%m-%d %H:00:00.000000',
+    'day': '%Y-%m-%d 00:00:00.000000',
+}
+
+def _migration_search_index(connection):
+    """迁移1：分析描述的FTS5全文索引（由触发器随插入/删除自动维护）和时间索引"""
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS analysis_fts USING fts5("
+        "description, content='analysis_records', content_rowid='id', tokenize='porter unicode61')"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS analysis_fts_ai AFTER INSERT ON analysis_records BEGIN "
+        "INSERT INTO analysis_fts(rowid, description) VALUES (new.id, new.description); END"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS analysis_fts_ad AFTER DELETE ON analysis_records BEGIN "
+        "INSERT INTO analysis_fts(analysis_fts, rowid, description) VALUES ('delete', old.id, old.description); END"
+    ))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS analysis_fts_au AFTER UPDATE OF description ON analysis_records BEGIN "
+        "INSERT INTO analysis_fts(analysis_fts, rowid, description) VALUES ('delete', old.id, old.description); "
+        "INSERT INTO analysis_fts(rowid, description) VALUES (new.id, new.description); END"
+    ))
+    # 为已有数据建立索引
+    connection.execute(text("INSERT INTO analysis_fts(analysis_fts) VALUES ('rebuild')"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_analysis_records_date ON analysis_records (date)"))
+
+
+def _migration_chat_sessions(connection):
+    """迁移2：聊天记录增加会话ID（新建的数据库已由create_all创建该列）"""
+    columns = [row[1] for row in connection.execute(text("PRAGMA table_info(chat_records)"))]
+    if 'session_id' not in columns:
+        connection.execute(text("ALTER TABLE chat_records ADD COLUMN session_id VARCHAR(64)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_records_session_id ON chat_records (session_id)"))
+
+
+def _migration_analysis_history(connection):
+    """迁移3：分析记录增加摄像头标识，历史查询用的组合索引，以及由触发器维护的计数表"""
+    columns = [row[1] for row in connection.execute(text("PRAGMA table_info(analysis_records)"))]
+    if 'camera_id' not in columns:
+        connection.execute(text("ALTER TABLE analysis_records ADD COLUMN camera_id VARCHAR(64) DEFAULT 'default'"))
+    connection.execute(text("UPDATE analysis_records SET camera_id = 'default' WHERE camera_id IS NULL"))
+
+    # 按时间倒序分页（索引隐含rowid，可直接满足 ORDER BY date DESC, id DESC）；
+    # 危险记录较少，使用部分索引
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_analysis_records_camera_date ON analysis_records (camera_id, date)"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_analysis_records_danger_date ON analysis_records (date) WHERE danger = 1"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_analysis_records_camera_danger_date "
+        "ON analysis_records (camera_id, date) WHERE danger = 1"))
+
+    # 计数表：统计接口直接读取，不扫描记录表
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS analysis_counters ("
+        "camera_id VARCHAR(64) NOT NULL, danger BOOLEAN NOT NULL, count INTEGER NOT NULL DEFAULT 0, "
+        "first_date DATETIME, last_date DATETIME, PRIMARY KEY (camera_id, danger))"))
+    connection.execute(text("DELETE FROM analysis_counters"))
+    connection.execute(text(
+        "INSERT INTO analysis_counters (camera_id, danger, count, first_date, last_date) "
+        "SELECT camera_id, danger, COUNT(*), MIN(date), MAX(date) FROM analysis_records GROUP BY camera_id, danger"))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS analysis_counters_ai AFTER INSERT ON analysis_records BEGIN "
+        "INSERT INTO analysis_counters (camera_id, danger, count, first_date, last_date) "
+        "VALUES (COALESCE(new.camera_id, 'default'), COALESCE(new.danger, 0), 1, new.date, new.date) "
+        "ON CONFLICT (camera_id, danger) DO UPDATE SET count = count + 1, "
+        "first_date = MIN(first_date, excluded.first_date), last_date = MAX(last_date, excluded.last_date); END"))
+    connection.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS analysis_counters_ad AFTER DELETE ON analysis_records BEGIN "
+        "UPDATE analysis_counters SET count = count - 1 "
+        "WHERE camera_id = COALESCE(old.camera_id, 'default') AND danger = COALESCE(old.danger, 0); END"))
+
+
+def rebuild_analysis_rollups(connection, start: str = None, end: str = None):
+    """
+    根据分析记录重新计算分析汇总表
+
+    Args:
+        connection: 数据库连接（调用方负责事务）
+        start (str): 重算范围的开始时间（包含，需对齐到天），为None时不限
+        end (str): 重算范围的结束时间（不包含，需对齐到天），为None时不限
+    """
+    params = {}
+    record_range = ["1"]
+    rollup_range = ["1"]
+    if start is not None:
+        params['start'] = start
+        record_range.append("date >= :start")
+        rollup_range.append("period_start >= :start")
+    if end is not None:
+        params['end'] = end
+        record_range.append("date < :end")
+        rollup_range.append("period_start < :end")
+
+    for bucket, fmt in ROLLUP_BUCKETS.items():
+        connection.execute(text(
+            f"DELETE FROM analysis_rollups WHERE bucket = '{bucket}' AND {' AND '.join(rollup_range)}"), params)
+        connection.execute(text(
+            "INSERT INTO analysis_rollups (bucket, period_start, camera_id, total, danger) "
+            f"SELECT '{bucket}', strftime('{fmt}', date), COALESCE(camera_id, 'default'), COUNT(*), "
+            f"SUM(COALESCE(danger, 0)) FROM analysis_records WHERE {' AND '.join(record_range)} GROUP BY 2, 3"),
+            params)
+
+
+def _migration_rollups(connection):
+    """迁移4：按小时/天、按摄像头的分析汇总表（由触发器随插入/删除增量维护）"""
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS analysis_rollups ("
+        "bucket VARCHAR(8) NOT NULL, period_start DATETIME NOT NULL, camera_id VARCHAR(64) NOT NULL, "
+        "total INTEGER NOT NULL DEFAULT 0, danger INTEGER NOT NULL DEFAULT 0, "
+        "PRIMARY KEY (bucket, period_start, camera_id))"))
+    for bucket, fmt in ROLLUP_BUCKETS.items():
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS analysis_rollups_{bucket}_ai AFTER INSERT ON analysis_records BEGIN "
+            "INSERT INTO analysis_rollups (bucket, period_start, camera_id, total, danger) "
+            f"VALUES ('{bucket}', strftime('{fmt}', new.date), COALESCE(new.camera_id, 'default'), 1, "
+            "COALESCE(new.danger, 0)) "
+            "ON CONFLICT (bucket, period_start, camera_id) DO UPDATE SET "
+            "total = total + 1, danger = danger + excluded.danger; END"))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS analysis_rollups_{bucket}_ad AFTER DELETE ON analysis_records BEGIN "
+            "UPDATE analysis_rollups SET total = total - 1, danger = danger - COALESCE(old.danger, 0) "
+            f"WHERE bucket = '{bucket}' AND period_start = strftime('{fmt}', old.date) "
+            "AND camera_id = COALESCE(old.camera_id, 'default'); END"))
+    # 为已有数据计算汇总
+    rebuild_analysis_rollups(connection)
+
+
+def _migration_retention(connection):
+    """迁移5：保留期清理时删除的记录不从汇总表中扣除（维护标志存在时跳过汇总表的删除触发器）"""
+    connection.execute(text("CREATE TABLE IF NOT EXISTS maintenance_flags (name VARCHAR(32) PRIMARY KEY)"))
+    for bucket, fmt in ROLLUP_BUCKETS.items():
+        connection.execute(text(f"DROP TRIGGER IF EXISTS analysis_rollups_{bucket}_ad"))
+        connection.execute(text(
+            f"CREATE TRIGGER analysis_rollups_{bucket}_ad AFTER DELETE ON analysis_records "
+            "WHEN NOT EXISTS (SELECT 1 FROM maintenance_flags WHERE name = 'retention') BEGIN "
+            "UPDATE analysis_rollups SET total = total - 1, danger = danger - COALESCE(old.danger, 0) "
+            f"WHERE bucket = '{bucket}' AND period_start = strftime('{fmt}', old.date) "
+            "AND camera_id = COALESCE(old.camera_id, 'default'); END"))
+
+
+def _migration_incidents(connection):
+    """迁移6：根据已有分析记录生成事件（连续、结论相同且间隔不超过DEFAULT_INCIDENT_GAP的记录为一个事件）"""
+    connection.execute(text("DELETE FROM incidents"))
+    connection.execute(text(f"""
+        WITH ordered AS (
+            SELECT id, camera_id, date, danger,
+                   LAG(danger) OVER w AS previous_danger, LAG(date) OVER w AS previous_date
+            FROM analysis_records WINDOW w AS (PARTITION BY camera_id ORDER BY date, id)
+        ), runs AS (
+            SELECT id, camera_id, date, danger,
+                   SUM(CASE WHEN previous_danger IS NULL OR previous_danger != danger
+                            OR (julianday(date) - julianday(previous_date)) * 86400 > {DEFAULT_INCIDENT_GAP}
+                            THEN 1 ELSE 0 END) OVER (PARTITION BY camera_id ORDER BY date, id) AS run
+            FROM ordered
+        ), grouped AS (
+            SELECT camera_id, MIN(date) AS start_date, MAX(date) AS end_date, danger, COUNT(*) AS record_count,
+                   MIN(id) AS first_record_id, MAX(id) AS last_record_id
+            FROM runs GROUP BY camera_id, run
+        )
+        INSERT INTO incidents (camera_id, start_date, end_date, danger, peak_severity, record_count,
+                               first_record_id, last_record_id, samples)
+        SELECT camera_id, start_date, end_date, danger, danger, record_count, first_record_id, last_record_id,
+               json_array((SELECT description FROM analysis_records WHERE id = first_record_id))
+        FROM grouped ORDER BY start_date
+    """))
+
+
+def _migration_description_store(connection):
+    """迁移7：分析描述按内容去重、用训练的字典压缩后保存到analysis_descriptions，全文索引改为建立在去重后的描述上"""
+    columns = [row[1] for row in connection.execute(text("PRAGMA table_info(analysis_records)"))]
+    if 'description_id' not in columns:
+        connection.execute(text("ALTER TABLE analysis_records ADD COLUMN description_id INTEGER"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_analysis_records_description ON analysis_records (description_id)"))
+
+    # 全文索引改为以解压后的描述（视图）为外部内容表
+    for trigger in ('analysis_fts_ai', 'analysis_fts_ad', 'analysis_fts_au'):
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+    connection.execute(text("DROP TABLE IF EXISTS analysis_fts"))
+    connection.execute(text(
+        "CREATE VIEW IF NOT EXISTS analysis_description_texts AS "
+        "SELECT id, description_text(data) AS text FROM analysis_descriptions"))
+    connection.execute(text(
+        "CREATE VIRTUAL TABLE analysis_fts USING fts5("
+        "text, content='analysis_description_texts', content_rowid='id', tokenize='porter unicode61')"))
+    connection.execute(text(
+        "CREATE TRIGGER analysis_fts_ai AFTER INSERT ON analysis_descriptions BEGIN "
+        "INSERT INTO analysis_fts(rowid, text) VALUES (new.id, description_text(new.data)); END"))
+    connection.execute(text(
+        "CREATE TRIGGER analysis_fts_ad AFTER DELETE ON analysis_descriptions BEGIN "
+        "INSERT INTO analysis_fts(analysis_fts, rowid, text) VALUES ('delete', old.id, description_text(old.data)); END"))
+
+    # 已有描述足够多时先训练字典
+    samples = [row[0] for row in connection.execute(text(
+        "SELECT description FROM analysis_records WHERE description IS NOT NULL "
+        "GROUP BY description ORDER BY MAX(id) DESC LIMIT :limit"), {'limit': TRAINING_SAMPLES})]
+    if len(samples) >= MIN_TRAINING_SAMPLES:
+        store_dictionary(connection, description_codec, samples)
+
+    # 已有记录的描述去重（按首次出现的顺序）
+    connection.execute(text(
+        "INSERT INTO analysis_descriptions (hash, data) "
+        "SELECT description_hash(description), description_compress(description) FROM analysis_records "
+        "WHERE description IS NOT NULL GROUP BY description ORDER BY MIN(id)"))
+    connection.execute(text(
+        "UPDATE analysis_records SET description_id = (SELECT d.id FROM analysis_descriptions d "
+        "WHERE d.hash = description_hash(analysis_records.description) "
+        "AND description_text(d.data) = analysis_records.description), "
+        "description = NULL WHERE description IS NOT NULL"))
+
+    # 新记录：插入后把描述移到描述表（已有相同描述时直接引用）
+    match = ("hash = description_hash(new.description) AND description_text(data) = new.description")
+    connection.execute(text(
+        "CREATE TRIGGER analysis_descriptions_ai AFTER INSERT ON analysis_records "
+        "WHEN new.description IS NOT NULL BEGIN "
+        "INSERT INTO analysis_descriptions (hash, data) "
+        "SELECT description_hash(new.description), description_compress(new.description) "
+        f"WHERE NOT EXISTS (SELECT 1 FROM analysis_descriptions WHERE {match}); "
+        "UPDATE analysis_records SET description = NULL, "
+        f"description_id = (SELECT id FROM analysis_descriptions WHERE {match}) WHERE id = new.id; END"))
+    # 删除记录后清理不再被引用的描述
+    connection.execute(text(
+        "CREATE TRIGGER analysis_descriptions_ad AFTER DELETE ON analysis_records "
+        "WHEN old.description_id IS NOT NULL BEGIN "
+        "DELETE FROM analysis_descriptions WHERE id = old.description_id "
+        "AND NOT EXISTS (SELECT 1 FROM analysis_records WHERE description_id = old.description_id); END"))
+
+
+def _migration_dictionary_autoincrement(connection):
+    """迁移8：描述字典表的ID改为AUTOINCREMENT，ID不再重复使用"""
+    sql = connection.execute(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'description_dictionaries'")).scalar()
+    if sql is None or 'AUTOINCREMENT' in sql.upper():
+        return
+    connection.execute(text(
+        "CREATE TABLE description_dictionaries_new ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, data BLOB NOT NULL, created_at DATETIME)"))
+    connection.execute(text(
+        "INSERT INTO description_dictionaries_new (id, data, created_at) "
+        "SELECT id, data, created_at FROM description_dictionaries"))
+    connection.execute(text("DROP TABLE description_dictionaries"))
+    connection.execute(text("ALTER TABLE description_dictionaries_new RENAME TO description_dictionaries"))
+
+
+# 数据库迁移列表，按顺序执行，已执行的版本记录在 PRAGMA user_version 中
+MIGRATIONS = [
+    _migration_search_index,
+    _migration_chat_sessions,
+    _migration_analysis_history,
+    _migration_rollups,
+    _migration_retention,
+    _migration_incidents,
+    _migration_description_store,
+    _migration_dictionary_autoincrement,
+]
+
+
+# init_db只执行一次
+_initialized = False
+_init_lock = threading.Lock()
+
+
+def run_migrations():
+    """执行尚未应用的数据库迁移（迁移7会训练描述字典，迁移失败时撤销登记的字典）"""
+    with dictionary_transaction(description_codec) as connection:
+        version = connection.execute(text("PRAGMA user_version")).scalar()
+        for index, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(connection)
+            connection.execute(text(f"PRAGMA user_version = {index}"))
+
+
+def init_db():
+    """初始化数据库（创建表并执行迁移，进程内只执行一次，入口程序在使用数据库前调用）"""
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        
+        # 创建数据目录（如果不存在）
+        data_dir = os.path.dirname(DB_PATH)
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        
+        # 创建所有表
+        Base.metadata.create_all(bind=engine)
+        
+        # 执行数据库迁移
+        run_migrations()
+        _initialized = True
 
 def get_db():
     """获取数据库会话"""
@@ -64,7 +514,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
-
-# 初始化数据库
-init_db()
\ No newline at end of file
+        db.close()
\ No newline at end of file
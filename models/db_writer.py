@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+数据库写入队列模块
+
+分析线程和聊天请求不再各自创建会话、提交一行、刷新再关闭，
+而是把记录放入队列后立即返回；由唯一的写入线程批量提交：
+- 队列中已积压的记录合并为一个事务提交（组提交），空闲时单条记录也会立即提交
+- 提交完成后通过Future返回新记录的ID
+- 进程退出或调用stop()时先写完队列中的所有记录
+
+持久性：数据库使用WAL模式，synchronous默认为NORMAL（见database.py），
+应用崩溃不会丢失已提交的记录；断电时可能丢失最后几个事务。
+需要更强保证时设置环境变量 VLM_DB_SYNCHRONOUS=FULL
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+from services.metrics import metrics
+
+from .database import SessionLocal
+
+logger = logging.getLogger("DatabaseWriter")
+
+
+class _Flush:
+    """队列中的刷新标记：之前的记录全部提交后触发"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class DatabaseWriter:
+    """数据库写入线程类"""
+
+    def __init__(self, batch_size: int = 200, session_factory=SessionLocal):
+        """
+        初始化写入队列
+
+        Args:
+            batch_size (int): 单个事务最多提交的记录数量
+            session_factory: 创建数据库会话的工厂
+        """
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self.queue: queue.Queue = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.stopped = False
+
+    def start(self) -> None:
+        """启动写入线程（首次提交记录时自动调用）"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.stopped = False
+            self.thread = threading.Thread(target=self._run, name="DatabaseWriter", daemon=True)
+            self.thread.start()
+            atexit.register(self.stop)
+        logger.info("数据库写入线程已启动")
+
+    def submit(self, record, merge: bool = False) -> Future:
+        """
+        把ORM记录放入写入队列
+
+        Args:
+            record: ORM模型实例
+            merge (bool): 是否按主键合并（更新已存在的行），否则作为新行插入
+
+        Returns:
+            Future: 提交完成后结果为记录的主键，提交失败时为异常
+        """
+        future: Future = Future()
+        if self.stopped:
+            future.set_exception(RuntimeError("数据库写入线程已停止"))
+            return future
+        if self.thread is None or not self.thread.is_alive():
+            self.start()
+        self.queue.put((record, merge, future))
+        metrics.set_gauge('db.queue_depth', self.queue.qsize())
+        return future
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待此前放入队列的记录全部提交
+
+        Args:
+            timeout (float): 最长等待时间（秒）
+
+        Returns:
+            bool: 是否在超时前完成
+        """
+        if self.thread is None or not self.thread.is_alive():
+            return self.queue.empty()
+        marker = _Flush()
+        self.queue.put(marker)
+        return marker.done.wait(timeout)
+
+    def stop(self, timeout: float = 10) -> None:
+        """
+        写完队列中的记录并停止写入线程
+
+        Args:
+            timeout (float): 最长等待时间（秒）
+        """
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            thread = self.thread
+        if thread is not None and thread.is_alive():
+            self.queue.put(None)
+            thread.join(timeout)
+            logger.info("数据库写入线程已停止，队列已写完")
+
+    def _run(self) -> None:
+        """写入线程主循环"""
+        while True:
+            item = self.queue.get()
+            batch = []
+            markers = []
+            stop = False
+            # 取出当前已积压的所有记录，合并为一个事务
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, _Flush):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._commit_batch(batch)
+            metrics.set_gauge('db.queue_depth', self.queue.qsize())
+            for marker in markers:
+                marker.done.set()
+            if stop:
+                # stop()之后仍可能有记录入队，写完后再退出
+                remaining = []
+                while not self.queue.empty():
+                    item = self.queue.get_nowait()
+                    if isinstance(item, _Flush):
+                        item.done.set()
+                    elif item is not None:
+                        remaining.append(item)
+                if remaining:
+                    self._commit_batch(remaining)
+                return
+
+    def _commit_batch(self, batch) -> None:
+        """在一个事务中提交一批记录，失败时逐条重试以隔离出错的记录"""
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            try:
+                instances = [self._merge(db, record) if merge else self._add(db, record) for record, merge, _ in batch]
+                db.flush()
+                ids = [self._primary_key(instance) for instance in instances]
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                if len(batch) == 1:
+                    logger.error(f"写入数据库时出错: {e}")
+                    batch[0][2].set_exception(e)
+                    return
+                logger.warning(f"批量写入失败，逐条重试: {e}")
+                for item in batch:
+                    self._commit_batch([item])
+                return
+        finally:
+            db.close()
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        metrics.observe('db.commit_ms', elapsed_ms)
+        metrics.observe('db.batch_size', len(batch))
+        for (_, _, future), record_id in zip(batch, ids):
+            future.set_result(record_id)
+
+    @staticmethod
+    def _add(db, record):
+        """作为新行加入会话"""
+        db.add(record)
+        return record
+
+    @staticmethod
+    def _merge(db, record):
+        """按主键合并到会话；立即刷新，同一批中相同主键的后续合并才能找到这一行"""
+        instance = db.merge(record)
+        db.flush()
+        return instance
+
+    @staticmethod
+    def _primary_key(instance):
+        """获取实例的主键（单列主键返回该值）"""
+        identity = instance.__mapper__.primary_key_from_instance(instance)
+        return identity[0] if len(identity) == 1 else tuple(identity)
+
+
+# 进程内共享的写入队列
+db_writer = DatabaseWriter()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+分析描述压缩存储模块
+
+模型每次输出的描述都不完全相同，但大量使用相同的句式和词组
+（"Here's a detailed description of the image..."、"The overall scene suggests..."），
+单独压缩每条几百字节的描述效果很差。该模块：
+- 从已有描述中统计高频词组，训练zlib预置字典（最多32KB）
+- 描述表中每条描述保存为：2字节字典ID + 使用该字典的raw deflate数据（字典ID为0表示不使用字典）
+- 字典保存在description_dictionaries表中，训练新字典后新描述使用新字典，旧描述仍可用原字典解压
+  （字典ID自增且不重复使用；训练事务失败时撤销进程内登记的新字典，见dictionary_transaction）
+- 压缩和解压注册为SQLite函数（见database.py），触发器、全文索引和查询都通过SQL调用
+
+用法:
+  python -m models.description_store --stats              # 描述数量、原始大小和压缩后大小
+  python -m models.description_store --train              # 训练新字典
+  python -m models.description_store --train --recompress # 训练新字典并用它重新压缩已有描述
+"""
+
+import argparse
+import logging
+import sqlite3
+import struct
+import threading
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger("DescriptionStore")
+
+# 压缩数据头：字典ID（大端无符号16位）
+HEADER = struct.Struct('>H')
+
+# zlib预置字典的最大长度
+MAX_DICTIONARY_SIZE = 32768
+
+# 训练字典至少需要的描述数量，以及训练时使用的最近描述数量
+MIN_TRAINING_SAMPLES = 200
+TRAINING_SAMPLES = 5000
+
+# 训练时统计的词组长度（单词数）
+MIN_PHRASE_WORDS = 2
+MAX_PHRASE_WORDS = 8
+
+
+def train_dictionary(samples: Iterable[str], size: int = MAX_DICTIONARY_SIZE) -> bytes:
+    """
+    根据样本描述训练zlib预置字典
+
+    统计出现不止一次的词组，按 出现次数 × 长度 选取最有价值的词组；
+    deflate回溯距离越近编码越短，最有价值的词组放在字典末尾
+
+    Args:
+        samples (iterable): 样本描述
+        size (int): 字典最大字节数
+
+    Returns:
+        bytes: 字典数据
+    """
+    counts: Counter = Counter()
+    for sample in samples:
+        words = sample.split()
+        for n in range(MIN_PHRASE_WORDS, MAX_PHRASE_WORDS + 1):
+            for i in range(len(words) - n + 1):
+                counts[' '.join(words[i:i + n])] += 1
+
+    phrases = []
+    total = 0
+    for phrase, count in sorted(counts.items(), key=lambda item: item[1] * len(item[0]), reverse=True):
+        if count < 2:
+            continue
+        length = len(phrase.encode('utf-8')) + 1
+        if total + length > size:
+            break
+        phrases.append(phrase)
+        total += length
+    return ' '.join(reversed(phrases)).encode('utf-8')
+
+
+class DescriptionCodec:
+    """描述压缩/解压类（每个进程一个实例，由SQLite函数调用）"""
+
+    def __init__(self, db_path: str):
+        """
+        初始化描述压缩
+
+        Args:
+            db_path (str): 数据库文件路径（解压时遇到未知字典从该数据库加载）
+        """
+        self.db_path = db_path
+        self.dictionaries: Dict[int, bytes] = {}
+        self.current_id = 0
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def _load(self) -> None:
+        """用单独的连接加载已保存的字典（正在执行的SQL语句所在连接不能再执行查询）"""
+        try:
+            connection = sqlite3.connect(self.db_path)
+            try:
+                rows = connection.execute("SELECT id, data FROM description_dictionaries ORDER BY id").fetchall()
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            # 数据库还没有字典表
+            rows = []
+        with self.lock:
+            for dictionary_id, data in rows:
+                self.dictionaries[dictionary_id] = bytes(data)
+                self.current_id = max(self.current_id, dictionary_id)
+            self.loaded = True
+
+    def add_dictionary(self, dictionary_id: int, data: bytes) -> None:
+        """
+        登记新训练的字典，之后的描述使用该字典压缩
+
+        Args:
+            dictionary_id (int): 字典ID
+            data (bytes): 字典数据
+        """
+        with self.lock:
+            self.dictionaries[dictionary_id] = bytes(data)
+            self.current_id = max(self.current_id, dictionary_id)
+
+    def snapshot(self) -> Tuple[Dict[int, bytes], int]:
+        """
+        保存当前登记的字典（训练事务失败时用restore撤销）
+
+        Returns:
+            tuple: (字典副本, 当前字典ID)
+        """
+        with self.lock:
+            return dict(self.dictionaries), self.current_id
+
+    def restore(self, state: Tuple[Dict[int, bytes], int]) -> None:
+        """
+        恢复snapshot保存的字典，撤销之后登记但没有提交的字典
+
+        Args:
+            state (tuple): snapshot的结果
+        """
+        dictionaries, current_id = state
+        with self.lock:
+            self.dictionaries = dict(dictionaries)
+            self.current_id = current_id
+
+    def compress(self, description: Optional[str]) -> Optional[bytes]:
+        """
+        使用当前字典压缩描述
+
+        Args:
+            description (str): 分析描述
+
+        Returns:
+            bytes: 字典ID头 + raw deflate数据，描述为None时为None
+        """
+        if description is None:
+            return None
+        if not self.loaded:
+            self._load()
+        with self.lock:
+            dictionary_id = self.current_id
+            dictionary = self.dictionaries.get(dictionary_id)
+        if dictionary:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, dictionary)
+        else:
+            dictionary_id = 0
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -15, 9)
+        return HEADER.pack(dictionary_id) + compressor.compress(str(description).encode('utf-8')) + compressor.flush()
+
+    def decompress(self, data: Optional[bytes]) -> Optional[str]:
+        """
+        解压描述
+
+        Args:
+            data (bytes): compress的结果
+
+        Returns:
+            str: 分析描述，数据为None时为None
+        """
+        if data is None:
+            return None
+        dictionary_id, = HEADER.unpack_from(data)
+        dictionary = None
+        if dictionary_id:
+            dictionary = self.dictionaries.get(dictionary_id)
+            if dictionary is None:
+                # 其他进程训练的新字典
+                self._load()
+                dictionary = self.dictionaries[dictionary_id]
+        decompressor = zlib.decompressobj(-15, dictionary) if dictionary else zlib.decompressobj(-15)
+        return (decompressor.decompress(bytes(data[HEADER.size:])) + decompressor.flush()).decode('utf-8')
+
+
+@contextmanager
+def dictionary_transaction(codec: DescriptionCodec):
+    """
+    开启训练字典的事务：事务失败时撤销进程内登记的新字典，
+    否则之后的描述会用一个没有保存的字典压缩，其他进程无法解压
+
+    事务内出错时先撤销再回滚，回滚释放写锁后其他写入不会再用到未提交的字典
+
+    Args:
+        codec (DescriptionCodec): 当前进程的描述压缩实例
+
+    Yields:
+        数据库连接（退出时提交）
+    """
+    from .database import engine
+
+    state = codec.snapshot()
+    try:
+        with engine.begin() as connection:
+            try:
+                yield connection
+            except BaseException:
+                codec.restore(state)
+                raise
+    except BaseException:
+        # 提交失败（事务内出错时已经撤销，再恢复一次没有影响）
+        codec.restore(state)
+        raise
+
+
+def store_dictionary(connection, codec: DescriptionCodec, samples: Iterable[str]) -> int:
+    """
+    训练新字典并保存，之后新描述使用该字典
+
+    Args:
+        connection: 数据库连接（调用方负责事务，并用dictionary_transaction在事务失败时撤销登记的字典）
+        codec (DescriptionCodec): 当前进程的描述压缩实例
+        samples (iterable): 样本描述
+
+    Returns:
+        int: 新字典ID
+    """
+    samples = list(samples)
+    dictionary = train_dictionary(samples)
+    dictionary_id = connection.execute(text(
+        "INSERT INTO description_dictionaries (data, created_at) VALUES (:data, CURRENT_TIMESTAMP)"),
+        {'data': dictionary}).lastrowid
+    codec.add_dictionary(dictionary_id, dictionary)
+    logger.info(f"已训练描述字典 {dictionary_id}（{len(dictionary)} 字节，{len(samples)} 条样本）")
+    return dictionary_id
+
+
+def train_and_store(connection, codec: DescriptionCodec, recompress: bool = False,
+                    min_samples: int = MIN_TRAINING_SAMPLES) -> Optional[int]:
+    """
+    用最近的描述训练新字典
+
+    Args:
+        connection: 数据库连接（调用方负责事务）
+        codec (DescriptionCodec): 当前进程的描述压缩实例
+        recompress (bool): 是否用新字典重新压缩已有描述
+        min_samples (int): 描述少于该数量时不训练
+
+    Returns:
+        int: 新字典ID，描述太少时为None
+    """
+    samples = [row[0] for row in connection.execute(text(
+        "SELECT description_text(data) FROM analysis_descriptions ORDER BY id DESC LIMIT :limit"),
+        {'limit': TRAINING_SAMPLES})]
+    if len(samples) < min_samples:
+        return None
+
+    dictionary_id = store_dictionary(connection, codec, samples)
+    if recompress:
+        # 内容不变，哈希和全文索引都不需要更新
+        count = connection.execute(text(
+            "UPDATE analysis_descriptions SET data = description_compress(description_text(data))")).rowcount
+        logger.info(f"已用新字典重新压缩 {count} 条描述")
+    return dictionary_id
+
+
+def ensure_dictionary() -> Optional[int]:
+    """
+    还没有字典且描述足够多时训练第一个字典，并重新压缩已有描述（由保留期清理任务定期调用）
+
+    Returns:
+        int: 新字典ID，不需要训练时为None
+    """
+    from .database import description_codec
+
+    with dictionary_transaction(description_codec) as connection:
+        if connection.execute(text("SELECT 1 FROM description_dictionaries LIMIT 1")).first() is not None:
+            return None
+        return train_and_store(connection, description_codec, recompress=True)
+
+
+def stats() -> dict:
+    """
+    描述存储统计
+
+    Returns:
+        dict: 记录数、不同描述数、原始字节数、保存的字节数和各字典的描述数
+    """
+    from .database import engine
+
+    with engine.connect() as connection:
+        records = connection.execute(text("SELECT COUNT(*) FROM analysis_records")).scalar()
+        descriptions, raw_bytes, stored_bytes = connection.execute(text(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(description_text(data) AS BLOB))), 0), "
+            "COALESCE(SUM(LENGTH(data)), 0) FROM analysis_descriptions")).one()
+        referenced_bytes = connection.execute(text(
+            "SELECT COALESCE(SUM(LENGTH(CAST(description_text(d.data) AS BLOB))), 0) "
+            "FROM analysis_records r JOIN analysis_descriptions d ON d.id = r.description_id")).scalar()
+        dictionaries = {}
+        for data, count in connection.execute(text(
+                "SELECT substr(data, 1, 2), COUNT(*) FROM analysis_descriptions GROUP BY 1")):
+            dictionaries[HEADER.unpack(bytes(data))[0]] = count
+    return {
+        'records': records,
+        'descriptions': descriptions,
+        'record_text_bytes': referenced_bytes,
+        'unique_text_bytes': raw_bytes,
+        'stored_bytes': stored_bytes,
+        'ratio': round(stored_bytes / referenced_bytes, 3) if referenced_bytes else None,
+        'descriptions_by_dictionary': dictionaries,
+    }
+
+
+def main():
+    """命令行入口"""
+    # 设置日志
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description='分析描述压缩存储')
+    parser.add_argument('--stats', action='store_true', help='显示描述存储统计')
+    parser.add_argument('--train', action='store_true', help='用最近的描述训练新字典')
+    parser.add_argument('--recompress', action='store_true', help='训练后用新字典重新压缩已有描述')
+    args = parser.parse_args()
+
+    from .database import description_codec, init_db
+
+    init_db()
+    if args.train:
+        with dictionary_transaction(description_codec) as connection:
+            dictionary_id = train_and_store(connection, description_codec, recompress=args.recompress)
+        if dictionary_id is None:
+            print(f"描述少于 {MIN_TRAINING_SAMPLES} 条，未训练字典")
+        else:
+            print(f"新字典ID: {dictionary_id}")
+    if args.stats or not args.train:
+        for key, value in stats().items():
+            print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
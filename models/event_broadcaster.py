@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+事件广播器模块
+
+该模块实现了面向Server-Sent Events(SSE)的事件广播功能：
+接收端在收到新的分析结果、传感器数据或图表数据时发布事件，
+每个浏览器连接只在有新事件时才被唤醒，并支持通过Last-Event-ID断点续传
+"""
+
+import json
+import logging
+import threading
+from collections import deque
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger("EventBroadcaster")
+
+
+class EventBroadcaster:
+    """事件广播器类
+
+    事件按单调递增的ID保存在固定长度的环形缓冲区中，
+    客户端重连时带上最后收到的事件ID即可补齐期间错过的事件
+    """
+
+    def __init__(self, history_size: int = 256):
+        """
+        初始化事件广播器
+
+        Args:
+            history_size (int): 保留的历史事件数量，用于断点续传
+        """
+        self.history: deque = deque(maxlen=history_size)
+        self.last_event_id = 0
+        self.condition = threading.Condition()
+        # 每种事件类型的最新一条，用于新连接的初始快照
+        self.latest_by_type = {}
+        # 发布事件后调用的监听函数（例如唤醒异步服务器的事件循环）
+        self.listeners = []
+
+        logger.info(f"初始化事件广播器，历史事件容量: {history_size}")
+
+    def publish(self, event_type: str, data: Any) -> int:
+        """
+        发布一个事件并唤醒所有等待中的连接
+
+        Args:
+            event_type (str): 事件类型，例如 "analysis"、"lux"、"chart"
+            data: 可JSON序列化的事件数据
+
+        Returns:
+            int: 分配给该事件的ID
+        """
+        # 在锁外完成序列化，避免阻塞其他发布者和订阅者
+        payload = json.dumps(data)
+        with self.condition:
+            self.last_event_id += 1
+            event = (self.last_event_id, event_type, payload)
+            self.history.append(event)
+            self.latest_by_type[event_type] = event
+            self.condition.notify_all()
+            event_id = self.last_event_id
+
+        for listener in self.listeners:
+            try:
+                listener(event_id)
+            except Exception as e:
+                logger.error(f"调用事件监听函数时出错: {e}")
+        return event_id
+
+    def add_listener(self, listener) -> None:
+        """
+        注册事件发布监听函数
+
+        Args:
+            listener (callable): 参数为新事件ID的函数，在发布线程中调用，应尽快返回
+        """
+        self.listeners.append(listener)
+
+    def get_snapshot(self) -> List[Tuple[int, str, str]]:
+        """
+        获取每种事件类型的最新事件，按事件ID排序
+
+        Returns:
+            list: (事件ID, 事件类型, JSON数据) 列表
+        """
+        with self.condition:
+            return sorted(self.latest_by_type.values())
+
+    def get_events_since(self, last_event_id: Optional[int]) -> Tuple[List[Tuple[int, str, str]], int]:
+        """
+        获取指定ID之后的事件
+
+        如果客户端没有提供ID，或者请求的ID已经不在历史缓冲区中，
+        则返回每种事件类型的最新快照，让页面直接恢复到当前状态
+
+        Args:
+            last_event_id (int): 客户端最后收到的事件ID
+
+        Returns:
+            tuple: ((事件ID, 事件类型, JSON数据) 列表, 下次继续读取的事件ID)
+        """
+        with self.condition:
+            return self._events_since_locked(last_event_id)
+
+    def wait_for_events(self, last_event_id: int, timeout: float) -> Tuple[List[Tuple[int, str, str]], int]:
+        """
+        阻塞等待指定ID之后的新事件
+
+        Args:
+            last_event_id (int): 客户端最后收到的事件ID
+            timeout (float): 最长等待时间（秒）
+
+        Returns:
+            tuple: (新事件列表，超时则为空列表, 下次继续读取的事件ID)
+        """
+        with self.condition:
+            if last_event_id == self.last_event_id:
+                self.condition.wait_for(
+                    lambda: self.last_event_id != last_event_id,
+                    timeout=timeout
+                )
+            return self._events_since_locked(last_event_id)
+
+    def _events_since_locked(self, last_event_id: Optional[int]) -> Tuple[List[Tuple[int, str, str]], int]:
+        """在持有锁的情况下计算需要补发的事件"""
+        if last_event_id is None or last_event_id > self.last_event_id:
+            # 新连接，或服务重启后客户端带来了更大的ID
+            return sorted(self.latest_by_type.values()), self.last_event_id
+
+        if last_event_id == self.last_event_id:
+            return [], self.last_event_id
+
+        oldest_id = self.history[0][0] if self.history else self.last_event_id + 1
+        if last_event_id < oldest_id - 1:
+            # 错过的事件已被覆盖，退化为快照
+            return sorted(self.latest_by_type.values()), self.last_event_id
+
+        return [event for event in self.history if event[0] > last_event_id], self.last_event_id
+
+    @staticmethod
+    def format_sse(events: List[Tuple[int, str, str]], cursor: int) -> str:
+        """
+        将事件格式化为SSE文本帧
+
+        快照只包含每种类型的最新事件，其最后一个ID可能小于当前游标，
+        此时额外发送一个只含ID的帧，使浏览器的Last-Event-ID指向游标
+
+        Args:
+            events (list): (事件ID, 事件类型, JSON数据) 列表
+            cursor (int): 下次继续读取的事件ID
+
+        Returns:
+            str: SSE格式的文本
+        """
+        chunks = [f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+                  for event_id, event_type, payload in events]
+        if not events or events[-1][0] != cursor:
+            chunks.append(f"id: {cursor}\n\n")
+        return ''.join(chunks)
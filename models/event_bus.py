@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+进程内事件总线模块
+
+组件之间通过主题发布和订阅事件，发布方不需要持有订阅方的引用，例如：
+- 传感器处理（RS485SensorDataSender）检测到灯突然熄灭、门磁触发时发布 ANALYSIS_REQUEST，
+  视频流传输器（VideoStreamer）订阅后对当前帧立即进行一次计划外的VLM分析
+
+处理函数在发布方的线程中同步执行，应只做记录状态等轻量操作；处理函数抛出的异常被记录，不影响发布方和其他订阅者
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, List
+
+from services.metrics import metrics
+
+logger = logging.getLogger("EventBus")
+
+# 请求立即分析当前帧，事件内容: {"source": 来源, "reason": 原因, "timestamp": 时间戳}
+ANALYSIS_REQUEST = "analysis.request"
+
+
+class EventBus:
+    """事件总线类"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, List[Callable[[dict], None]]] = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, topic: str, handler: Callable[[dict], None]) -> None:
+        """
+        订阅主题
+
+        Args:
+            topic (str): 主题
+            handler (callable): 处理函数，参数为事件内容
+        """
+        with self.lock:
+            handlers = self.subscribers.setdefault(topic, [])
+            if handler not in handlers:
+                handlers.append(handler)
+
+    def unsubscribe(self, topic: str, handler: Callable[[dict], None]) -> None:
+        """
+        取消订阅
+
+        Args:
+            topic (str): 主题
+            handler (callable): 订阅时的处理函数
+        """
+        with self.lock:
+            handlers = self.subscribers.get(topic, [])
+            if handler in handlers:
+                handlers.remove(handler)
+
+    def publish(self, topic: str, source: str, reason: str, **data) -> int:
+        """
+        发布事件
+
+        Args:
+            topic (str): 主题
+            source (str): 事件来源（例如设备名称）
+            reason (str): 事件原因（用于日志和界面显示）
+            **data: 其他事件内容
+
+        Returns:
+            int: 收到事件的订阅者数量
+        """
+        event = {"source": source, "reason": reason, "timestamp": time.time()}
+        event.update(data)
+        with self.lock:
+            handlers = list(self.subscribers.get(topic, []))
+        metrics.increment(f'events.{topic}')
+        for handler in handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"处理事件 {topic} 时出错: {e}")
+        return len(handlers)
+
+
+# 进程内共享的事件总线
+event_bus = EventBus()
+
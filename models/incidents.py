@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+事件聚合模块
+
+一次打架会产生一串几乎相同的分析记录，该模块把同一摄像头连续、结论相同的分析合并为一个事件：
+- 事件记录开始/结束时间、最高严重程度、分析次数、代表帧和几条代表性描述
+- IncidentTracker在分析结果保存后在线更新当前事件（通过写入队列保存）
+- IncidentStore供Web UI分页查询事件，聊天上下文也以事件为单位
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import text
+
+from .analysis_history import DB_DATETIME_FORMAT, MAX_PAGE_SIZE, decode_cursor, encode_cursor
+from .database import DEFAULT_INCIDENT_GAP, Incident, engine, get_db
+from .db_writer import db_writer
+
+logger = logging.getLogger("Incidents")
+
+# 事件代表帧的保存目录（可通过环境变量VLM_INCIDENT_FRAMES_PATH指定）
+INCIDENT_FRAME_DIR = os.environ.get('VLM_INCIDENT_FRAMES_PATH') or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'data', 'incidents')
+
+
+def _format_date(value) -> Optional[str]:
+    """把时间格式化为接口使用的字符串"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value)[:19]
+
+
+def incident_to_dict(incident: Incident) -> dict:
+    """
+    把事件转换为可JSON序列化的字典（用于接口、UDP消息和聊天上下文）
+
+    Args:
+        incident (Incident): 事件
+
+    Returns:
+        dict: 事件字典
+    """
+    try:
+        samples = json.loads(incident.samples) if incident.samples else []
+    except ValueError:
+        samples = []
+    return {
+        'id': incident.id,
+        'camera_id': incident.camera_id,
+        'start_date': _format_date(incident.start_date),
+        'end_date': _format_date(incident.end_date),
+        'danger': bool(incident.danger),
+        'peak_severity': incident.peak_severity or 0,
+        'record_count': incident.record_count or 0,
+        'first_record_id': incident.first_record_id,
+        'last_record_id': incident.last_record_id,
+        'samples': samples,
+        'has_frame': bool(incident.frame_path),
+    }
+
+
+class IncidentTracker:
+    """单个摄像头的在线事件聚合类"""
+
+    def __init__(self, camera_id: str = "default", incident_gap: float = DEFAULT_INCIDENT_GAP,
+                 max_samples: int = 3, frame_dir: Optional[str] = None, id_timeout: float = 2.0):
+        """
+        初始化事件聚合
+
+        Args:
+            camera_id (str): 摄像头标识
+            incident_gap (float): 相邻两次分析的最大间隔（秒），超过时开始新的事件
+            max_samples (int): 每个事件保留的代表性描述数量（第一条和最近几条不同的描述）
+            frame_dir (str): 代表帧保存目录，为None时使用INCIDENT_FRAME_DIR
+            id_timeout (float): 等待新事件ID的最长时间（秒）
+        """
+        self.camera_id = camera_id
+        self.incident_gap = incident_gap
+        self.max_samples = max(1, max_samples)
+        self.frame_dir = frame_dir or INCIDENT_FRAME_DIR
+        self.id_timeout = id_timeout
+        self.current: Optional[Incident] = None
+        self.pending_id = None  # 新事件插入的Future（ID尚未返回时使用）
+        self.lock = threading.Lock()
+        self._load_current()
+
+    def _load_current(self) -> None:
+        """启动时加载该摄像头最新的事件，重启后仍可继续合并"""
+        try:
+            # 获取数据库会话
+            db_gen = get_db()
+            db = next(db_gen)
+
+            latest = (db.query(Incident).filter(Incident.camera_id == self.camera_id)
+                      .order_by(Incident.start_date.desc()).first())
+            if latest is not None:
+                db.expunge(latest)
+                self.current = latest
+
+            # 关闭数据库会话
+            try:
+                next(db_gen)
+            except StopIteration:
+                pass
+        except Exception as e:
+            logger.error(f"加载最新事件时出错: {e}")
+
+    def _continues(self, date: datetime, danger: bool) -> bool:
+        """判断分析结果是否属于当前事件"""
+        current = self.current
+        return (current is not None and bool(current.danger) == danger
+                and current.end_date is not None and current.end_date <= date
+                and (date - current.end_date).total_seconds() <= self.incident_gap)
+
+    def _save_frame(self, incident: Incident, frame_jpeg: bytes) -> None:
+        """保存事件的代表帧"""
+        filename = f"{self.camera_id}_{incident.start_date.strftime('%Y%m%d_%H%M%S')}.jpg"
+        try:
+            os.makedirs(self.frame_dir, exist_ok=True)
+            with open(os.path.join(self.frame_dir, filename), 'wb') as f:
+                f.write(frame_jpeg)
+            incident.frame_path = filename
+        except Exception as e:
+            logger.error(f"保存事件代表帧时出错: {e}")
+
+    def _add_sample(self, incident: Incident, description: str) -> None:
+        """加入代表性描述：保留第一条，其余位置滚动保存最近的不同描述"""
+        samples = json.loads(incident.samples) if incident.samples else []
+        if description in samples:
+            return
+        if len(samples) < self.max_samples:
+            samples.append(description)
+        else:
+            samples = samples[:1] + samples[2:] + [description]
+        incident.samples = json.dumps(samples, ensure_ascii=False)
+
+    def observe(self, record_id: Optional[int], date: datetime, description: str, danger: bool,
+                severity: int = 0, frame_jpeg: Optional[bytes] = None) -> dict:
+        """
+        加入一次分析结果，合并到当前事件或开始新的事件
+
+        Args:
+            record_id (int): 分析记录ID，未知时为None
+            date (datetime): 分析时间
+            description (str): 分析描述
+            danger (bool): 是否危险
+            severity (int): 严重程度（命中的危险类别数）
+            frame_jpeg (bytes): 分析所用帧的JPEG数据，新事件或严重程度创新高时保存为代表帧
+
+        Returns:
+            dict: 更新后的事件字典，"opened"表示是否为新事件
+        """
+        danger = bool(danger)
+        with self.lock:
+            opened = not self._continues(date, danger)
+            if opened:
+                incident = Incident(
+                    camera_id=self.camera_id,
+                    start_date=date,
+                    end_date=date,
+                    danger=danger,
+                    peak_severity=severity,
+                    record_count=1,
+                    first_record_id=record_id,
+                    last_record_id=record_id,
+                    samples=json.dumps([description], ensure_ascii=False)
+                )
+                if frame_jpeg:
+                    self._save_frame(incident, frame_jpeg)
+                self.current = incident
+                self.pending_id = db_writer.submit(Incident(**self._columns(incident)))
+            else:
+                incident = self.current
+                incident.end_date = date
+                incident.record_count = (incident.record_count or 0) + 1
+                if record_id is not None:
+                    incident.last_record_id = record_id
+                    if incident.first_record_id is None:
+                        incident.first_record_id = record_id
+                self._add_sample(incident, description)
+                if severity > (incident.peak_severity or 0):
+                    incident.peak_severity = severity
+                    if frame_jpeg:
+                        self._save_frame(incident, frame_jpeg)
+
+            # 新事件等待写入线程返回ID，后续更新按ID合并
+            if incident.id is None and self.pending_id is not None:
+                try:
+                    incident.id = self.pending_id.result(timeout=self.id_timeout)
+                    self.pending_id = None
+                except Exception as e:
+                    logger.error(f"等待事件ID时出错: {e}")
+            if not opened and incident.id is not None:
+                db_writer.submit(Incident(id=incident.id, **self._columns(incident)), merge=True)
+
+            result = incident_to_dict(incident)
+        result['opened'] = opened
+        if opened:
+            logger.info(f"摄像头 {self.camera_id} 开始新事件: {'危险' if danger else '安全'}，ID: {result['id']}")
+        return result
+
+    @staticmethod
+    def _columns(incident: Incident) -> dict:
+        """事件除ID以外的列（提交给写入队列的是副本，避免写入线程与本线程同时修改同一对象）"""
+        return {
+            'camera_id': incident.camera_id,
+            'start_date': incident.start_date,
+            'end_date': incident.end_date,
+            'danger': incident.danger,
+            'peak_severity': incident.peak_severity,
+            'record_count': incident.record_count,
+            'first_record_id': incident.first_record_id,
+            'last_record_id': incident.last_record_id,
+            'samples': incident.samples,
+            'frame_path': incident.frame_path,
+        }
+
+
+class IncidentStore:
+    """事件查询类"""
+
+    def __init__(self, frame_dir: Optional[str] = None):
+        """
+        初始化事件查询
+
+        Args:
+            frame_dir (str): 代表帧保存目录，为None时使用INCIDENT_FRAME_DIR
+        """
+        self.frame_dir = frame_dir or INCIDENT_FRAME_DIR
+
+    def query(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              danger: Optional[bool] = None, camera_id: Optional[str] = None,
+              cursor: Optional[str] = None, limit: int = 50) -> dict:
+        """
+        按开始时间倒序分页查询事件
+
+        Args:
+            start (datetime): 只返回在该时间之后结束的事件
+            end (datetime): 只返回在该时间之前开始的事件
+            danger (bool): 只返回危险(True)或安全(False)的事件，None表示不过滤
+            camera_id (str): 摄像头标识
+            cursor (str): 上一页返回的游标，None表示第一页
+            limit (int): 每页事件数量
+
+        Returns:
+            dict: {"items": [...], "next_cursor": 下一页游标或None}
+
+        Raises:
+            ValueError: 参数无效
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        conditions = []
+        params = {'limit': limit + 1}
+        if camera_id:
+            conditions.append("camera_id = :camera_id")
+            params['camera_id'] = camera_id
+        if danger is True:
+            conditions.append("danger = 1")
+        elif danger is False:
+            conditions.append("danger = 0")
+        if start is not None:
+            conditions.append("end_date >= :start")
+            params['start'] = start.strftime(DB_DATETIME_FORMAT)
+        if end is not None:
+            conditions.append("start_date < :end")
+            params['end'] = end.strftime(DB_DATETIME_FORMAT)
+        if cursor:
+            params['cursor_date'], params['cursor_id'] = decode_cursor(cursor)
+            conditions.append("(start_date, id) < (:cursor_date, :cursor_id)")
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with engine.connect() as connection:
+            ids = [row[0] for row in connection.execute(text(
+                f"SELECT id FROM incidents {where} ORDER BY start_date DESC, id DESC LIMIT :limit"),
+                params)]
+
+        next_cursor = None
+        incidents = self._load(ids[:limit])
+        if len(ids) > limit:
+            last = incidents[-1]
+            next_cursor = encode_cursor(last.start_date.strftime(DB_DATETIME_FORMAT), last.id)
+        return {'items': [incident_to_dict(incident) for incident in incidents], 'next_cursor': next_cursor}
+
+    def _load(self, ids: List[int]) -> List[Incident]:
+        """按给定顺序加载事件"""
+        if not ids:
+            return []
+        # 获取数据库会话
+        db_gen = get_db()
+        db = next(db_gen)
+        try:
+            by_id = {incident.id: incident for incident in db.query(Incident).filter(Incident.id.in_(ids)).all()}
+            return [by_id[incident_id] for incident_id in ids if incident_id in by_id]
+        finally:
+            # 关闭数据库会话
+            try:
+                next(db_gen)
+            except StopIteration:
+                pass
+
+    def recent(self, limit: int = 20) -> List[dict]:
+        """
+        最近的事件（按时间顺序排列，用于聊天上下文）
+
+        Args:
+            limit (int): 事件数量
+
+        Returns:
+            list: 事件字典列表
+        """
+        with engine.connect() as connection:
+            ids = [row[0] for row in connection.execute(text(
+                "SELECT id FROM incidents ORDER BY start_date DESC, id DESC LIMIT :limit"), {'limit': limit})]
+        return [incident_to_dict(incident) for incident in reversed(self._load(ids))]
+
+    def frame_path(self, incident_id: int) -> Optional[str]:
+        """
+        事件代表帧的文件路径
+
+        Args:
+            incident_id (int): 事件ID
+
+        Returns:
+            str: 文件路径，没有代表帧时为None
+        """
+        incidents = self._load([incident_id])
+        if not incidents or not incidents[0].frame_path:
+            return None
+        path = os.path.join(self.frame_dir, os.path.basename(incidents[0].frame_path))
+        return path if os.path.exists(path) else None
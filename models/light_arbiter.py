@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+灯光仲裁模块
+
+光照度轮询（太暗时红灯）和VLM分析结果（危险黄灯、安全绿灯）原来各自直接设置同一个灯，
+两者交替时灯光来回闪烁，每次切换都要写总线。该模块收集所有输入，统一决定灯光状态：
+- 输入：手动指定（可设置有效期）、危险判断、环境太暗
+- 优先级：手动指定 > 危险（黄）> 太暗（红）> 安全（绿）
+- 滞回：光照度低于dark_lux进入"太暗"，高于bright_lux才退出；危险判断在最后一次危险结果后
+  至少保持danger_hold秒，并且需要连续safe_confirmations次安全结果才解除
+- 最短保持时间：灯光切换后至少保持min_hold秒才会切换到优先级更低的状态（更高优先级的状态立即生效）
+- 只有决定的状态变化时才写总线；状态不变时每隔refresh_interval秒重发一次，防止设备断电重启后状态不一致
+
+仲裁不使用单独的定时线程：保持时间到期后的切换在下一次输入或tick()时生效（传感器每次轮询都会调用）
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+from services.metrics import metrics
+
+from .rs485_bus import PRIORITY_ALERT, PRIORITY_CONTROL
+
+logger = logging.getLogger("LightArbiter")
+
+# 各输入对应的灯光颜色和优先级（数值越大越优先）
+LEVELS = {
+    "safe": ("green", 0),
+    "dark": ("red", 1),
+    "danger": ("yellow", 2),
+    "manual": (None, 3),
+}
+
+
+class LightArbiter:
+    """灯光仲裁类"""
+
+    def __init__(self, controller, dark_lux: float = 50, bright_lux: float = 60, danger_hold: float = 10.0,
+                 safe_confirmations: int = 2, min_hold: float = 3.0, refresh_interval: float = 60.0):
+        """
+        初始化灯光仲裁
+
+        Args:
+            controller: RS485控制器（RS485Controller或AsyncRS485Controller）
+            dark_lux (float): 光照度低于该值时进入"太暗"
+            bright_lux (float): 光照度高于等于该值时退出"太暗"
+            danger_hold (float): 最后一次危险结果后危险状态至少保持的时间（秒）
+            safe_confirmations (int): 解除危险状态需要的连续安全结果次数
+            min_hold (float): 灯光切换后切换到更低优先级状态前的最短保持时间（秒）
+            refresh_interval (float): 状态不变时重发灯光命令的间隔（秒），0表示不重发
+        """
+        self.controller = controller
+        self.dark_lux = dark_lux
+        self.bright_lux = max(bright_lux, dark_lux)
+        self.danger_hold = danger_hold
+        self.safe_confirmations = max(1, safe_confirmations)
+        self.min_hold = min_hold
+        self.refresh_interval = refresh_interval
+
+        # 输入状态
+        self.dark = False
+        self.danger = False
+        self.last_danger_at = 0.0
+        self.safe_count = 0
+        self.manual_color: Optional[str] = None
+        self.manual_until: Optional[float] = None
+
+        # 当前输出
+        self.level: Optional[str] = None
+        self.color: Optional[str] = None
+        self.changed_at = 0.0
+        self.sent_at = 0.0
+        self.transitions = 0
+        # 控制器未连接时命令的Future可能已完成，回调在持有锁的线程中立即执行
+        self.lock = threading.RLock()
+
+    # ---- 输入 ----
+
+    def update_lux(self, lux: Optional[float]) -> None:
+        """
+        输入光照度读数
+
+        Args:
+            lux (float): 光照度，读取失败时为None（保持原状态）
+        """
+        with self.lock:
+            if lux is not None:
+                if not self.dark and lux < self.dark_lux:
+                    self.dark = True
+                    logger.info(f"光照度 {lux} 低于 {self.dark_lux}，进入太暗状态")
+                elif self.dark and lux >= self.bright_lux:
+                    self.dark = False
+                    logger.info(f"光照度 {lux} 高于 {self.bright_lux}，退出太暗状态")
+            self._resolve()
+
+    def update_verdict(self, is_dangerous: bool) -> None:
+        """
+        输入VLM危险判断结果
+
+        Args:
+            is_dangerous (bool): 是否危险
+        """
+        now = time.monotonic()
+        with self.lock:
+            if is_dangerous:
+                self.danger = True
+                self.last_danger_at = now
+                self.safe_count = 0
+            elif self.danger:
+                self.safe_count += 1
+            self._resolve()
+
+    def set_override(self, color: str, duration: Optional[float] = None) -> None:
+        """
+        手动指定灯光颜色（优先于所有自动判断）
+
+        Args:
+            color (str): 灯光命令 ("green", "yellow", "red", "off")
+            duration (float): 有效时间（秒），None表示直到clear_override
+        """
+        with self.lock:
+            self.manual_color = color
+            self.manual_until = time.monotonic() + duration if duration else None
+            logger.info(f"手动指定灯光: {color}" + (f"，{duration} 秒" if duration else ""))
+            self._resolve()
+
+    def clear_override(self) -> None:
+        """取消手动指定，恢复自动判断"""
+        with self.lock:
+            self.manual_color = None
+            self.manual_until = None
+            self._resolve()
+
+    def tick(self) -> None:
+        """重新评估（保持时间和手动指定到期、定期重发）"""
+        with self.lock:
+            self._resolve()
+
+    # ---- 仲裁 ----
+
+    def _wanted(self, now: float) -> str:
+        """按优先级决定当前应处于的状态"""
+        if self.manual_color is not None and self.manual_until is not None and now >= self.manual_until:
+            logger.info("手动指定灯光已到期")
+            self.manual_color = None
+            self.manual_until = None
+        if self.danger and self.safe_count >= self.safe_confirmations and now - self.last_danger_at >= self.danger_hold:
+            self.danger = False
+            self.safe_count = 0
+            logger.info("危险状态已解除")
+        if self.manual_color is not None:
+            return "manual"
+        if self.danger:
+            return "danger"
+        if self.dark:
+            return "dark"
+        return "safe"
+
+    def _resolve(self) -> None:
+        """决定灯光状态，变化时写总线（调用方持有锁）"""
+        now = time.monotonic()
+        level = self._wanted(now)
+        color = self.manual_color if level == "manual" else LEVELS[level][0]
+
+        if color == self.color:
+            # 上次命令失败时立即重发，否则定期重发
+            if not self.sent_at or (self.refresh_interval and now - self.sent_at >= self.refresh_interval):
+                self._send(level, color, now, force=True)
+            return
+        if (self.level is not None and LEVELS[level][1] < LEVELS[self.level][1]
+                and now - self.changed_at < self.min_hold):
+            # 降级到更低优先级的状态前先保持最短时间
+            return
+
+        logger.info(f"灯光状态: {self.level or '未知'}({self.color}) -> {level}({color})")
+        self.level = level
+        self.color = color
+        self.changed_at = now
+        self.transitions += 1
+        metrics.increment('light.transitions')
+        self._send(level, color, now)
+
+    def _send(self, level: str, color: str, now: float, force: bool = False) -> None:
+        """提交灯光命令（不等待总线），force表示忽略控制器的灯光状态缓存"""
+        self.sent_at = now
+        priority = PRIORITY_ALERT if level in ("danger", "manual") else PRIORITY_CONTROL
+        try:
+            future = self.controller.set_light_async(color, force=force, priority=priority)
+            future.add_done_callback(lambda f: self._log_result(f, color))
+        except Exception as e:
+            logger.error(f"提交灯光命令时出错: {e}")
+
+    def _log_result(self, future, color: str) -> None:
+        """记录灯光命令的结果，失败时下次评估重发"""
+        try:
+            ok = future.result()
+        except Exception as e:
+            logger.error(f"设置灯光为 {color} 时出错: {e}")
+            ok = False
+        if not ok:
+            with self.lock:
+                if self.color == color:
+                    self.sent_at = 0.0
+
+    def status(self) -> dict:
+        """
+        仲裁状态
+
+        Returns:
+            dict: 当前状态、颜色、各输入和切换次数
+        """
+        with self.lock:
+            return {
+                "level": self.level,
+                "color": self.color,
+                "dark": self.dark,
+                "danger": self.danger,
+                "manual": self.manual_color,
+                "transitions": self.transitions,
+            }
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+数据保留与压缩模块
+
+每次分析都会写入一行记录，数据库会无限增长，该模块实现后台保留策略：
+- 最近N天的分析记录保留完整内容
+- 更早的记录按摄像头合并为摘要(analysis_summaries)：连续的危险记录合并为一个事件，
+  连续的安全记录按天合并，摘要保留时段、记录数量和第一条记录的描述
+- 按摄像头和时间分小批处理，每批一个短事务（合并摘要和删除记录在同一事务中，中断后可安全重跑），
+  批之间短暂让出数据库，分析和聊天的写入不会被长时间阻塞
+- 小时/天汇总表保留被清理记录的统计（见database.py迁移5）
+- 删除后用增量VACUUM把空闲页归还给文件系统
+- 结束时间早于保留期的事件(incidents)及其代表帧文件同样分小批删除
+  （这些时段已合并为摘要），跨越保留期起点的事件去掉指向已删除记录的引用
+- 超过保留期的光照度时间序列分区一并删除
+
+命令行用法：
+  python -m models.retention --keep-days 30 --dry-run   # 只报告将清理的数据和可回收的空间
+  python -m models.retention --keep-days 30             # 执行一次清理
+  python -m models.retention --vacuum                   # 已有数据库一次性转换为增量VACUUM模式
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from .database import DESCRIPTION_SQL, AnalysisSummary, engine, init_db
+from .description_store import ensure_dictionary
+from .incidents import IncidentStore
+from .timeseries_store import TimeSeriesStore
+
+logger = logging.getLogger("Retention")
+
+# SQLAlchemy在SQLite中保存DateTime的字符串格式
+DB_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# PRAGMA auto_vacuum 的取值
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+def _parse_date(value) -> datetime:
+    """把数据库中的时间（字符串或datetime）转换为datetime"""
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+class RetentionJob:
+    """数据保留任务类"""
+
+    def __init__(self, keep_days: int = 30, lux_keep_days: Optional[int] = None,
+                 incident_gap: float = 300.0, chunk_size: int = 500, pause: float = 0.05,
+                 vacuum_pages: int = 1000, interval: float = 3600.0):
+        """
+        初始化数据保留任务
+
+        Args:
+            keep_days (int): 分析记录保留完整内容的天数
+            lux_keep_days (int): 光照度原始读数保留的天数，为None时与keep_days相同
+            incident_gap (float): 同一时段内相邻记录的最大间隔（秒），超过时开始新的时段
+            chunk_size (int): 每个事务最多处理的记录数量
+            pause (float): 两个事务之间的暂停时间（秒），让其他写入有机会获得数据库锁
+            vacuum_pages (int): 每次增量VACUUM最多回收的页数
+            interval (float): 后台运行的间隔（秒）
+        """
+        self.keep_days = keep_days
+        self.lux_keep_days = keep_days if lux_keep_days is None else lux_keep_days
+        self.incident_gap = incident_gap
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.interval = interval
+        self.incident_store = IncidentStore()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def cutoff(self, keep_days: Optional[int] = None, now: Optional[datetime] = None) -> datetime:
+        """
+        计算保留期的起点（对齐到天），早于该时间的数据会被清理
+
+        Args:
+            keep_days (int): 保留天数，为None时使用keep_days
+            now (datetime): 当前时间，为None时使用datetime.now()
+
+        Returns:
+            datetime: 保留期起点
+        """
+        now = now or datetime.now()
+        keep_days = self.keep_days if keep_days is None else keep_days
+        return (now - timedelta(days=keep_days)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _split_runs(self, rows, previous: Optional[dict] = None) -> List[dict]:
+        """
+        把同一摄像头按时间排序的记录划分为时段
+
+        危险状态变化、相邻记录间隔超过incident_gap或跨天时开始新的时段；
+        第一个时段能接上previous（上一批最后一个摘要）时合并到previous
+
+        Args:
+            rows: (id, date, danger, description) 列表
+            previous (dict): 该摄像头最新的已有摘要
+
+        Returns:
+            list: 时段列表，合并到已有摘要的时段带有id
+        """
+        runs = []
+        current = previous
+        for _, date, danger, description in rows:
+            date = _parse_date(date)
+            danger = bool(danger)
+            if (current is None or current['danger'] != danger
+                    or (date - current['end_date']).total_seconds() > self.incident_gap
+                    or date.date() != current['start_date'].date()):
+                current = {'id': None, 'start_date': date, 'end_date': date, 'danger': danger,
+                           'record_count': 0, 'description': description}
+                runs.append(current)
+            elif current is previous and not runs:
+                runs.append(current)
+            current['end_date'] = date
+            current['record_count'] += 1
+        return runs
+
+    def _latest_summary(self, connection, camera_id: str) -> Optional[dict]:
+        """读取摄像头最新的摘要"""
+        row = connection.execute(text(
+            "SELECT id, start_date, end_date, danger, record_count, description FROM analysis_summaries "
+            "WHERE camera_id = :camera_id ORDER BY end_date DESC LIMIT 1"), {'camera_id': camera_id}).first()
+        if row is None:
+            return None
+        return {'id': row[0], 'start_date': _parse_date(row[1]), 'end_date': _parse_date(row[2]),
+                'danger': bool(row[3]), 'record_count': row[4], 'description': row[5]}
+
+    def _cameras(self, connection) -> List[str]:
+        """有分析记录的摄像头"""
+        return [row[0] for row in connection.execute(text(
+            "SELECT DISTINCT camera_id FROM analysis_counters WHERE count > 0 ORDER BY camera_id"))]
+
+    def _collapse_chunk(self, camera_id: str, cutoff: str) -> int:
+        """在一个事务中把一批过期记录合并为摘要并删除，返回处理的记录数"""
+        with engine.begin() as connection:
+            rows = connection.execute(text(
+                f"SELECT id, date, danger, {DESCRIPTION_SQL} FROM analysis_records "
+                "WHERE camera_id = :camera_id AND date < :cutoff ORDER BY date, id LIMIT :limit"),
+                {'camera_id': camera_id, 'cutoff': cutoff, 'limit': self.chunk_size}).all()
+            if not rows:
+                return 0
+
+            for run in self._split_runs(rows, self._latest_summary(connection, camera_id)):
+                values = {
+                    'camera_id': camera_id,
+                    'start_date': run['start_date'],
+                    'end_date': run['end_date'],
+                    'danger': run['danger'],
+                    'record_count': run['record_count'],
+                    'description': run['description'],
+                }
+                if run['id'] is None:
+                    connection.execute(AnalysisSummary.__table__.insert(), values)
+                else:
+                    connection.execute(AnalysisSummary.__table__.update()
+                                       .where(AnalysisSummary.__table__.c.id == run['id']), values)
+
+            # 维护标志只在本事务内可见，汇总表的删除触发器据此跳过
+            connection.execute(text("INSERT OR IGNORE INTO maintenance_flags (name) VALUES ('retention')"))
+            ids = [row[0] for row in rows]
+            connection.execute(text(
+                f"DELETE FROM analysis_records WHERE id IN ({','.join(str(record_id) for record_id in ids)})"))
+            connection.execute(text("DELETE FROM maintenance_flags WHERE name = 'retention'"))
+        return len(rows)
+
+    def _prune_incidents_chunk(self, cutoff: str) -> Tuple[int, int]:
+        """
+        删除一批结束时间早于保留期起点的事件及其代表帧
+
+        Returns:
+            tuple: (删除的事件数, 删除的代表帧字节数)
+        """
+        with engine.connect() as connection:
+            ids = [row[0] for row in connection.execute(text(
+                "SELECT id FROM incidents WHERE end_date < :cutoff ORDER BY start_date, id LIMIT :limit"),
+                {'cutoff': cutoff, 'limit': self.chunk_size})]
+        if not ids:
+            return 0, 0
+
+        # 事务提交后再删除文件，事务失败时代表帧仍然可用
+        frames = [path for path in (self.incident_store.frame_path(incident_id) for incident_id in ids) if path]
+        with engine.begin() as connection:
+            connection.execute(text(
+                f"DELETE FROM incidents WHERE id IN ({','.join(str(incident_id) for incident_id in ids)})"))
+        removed_bytes = 0
+        for path in frames:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                removed_bytes += size
+            except OSError as e:
+                logger.error(f"删除事件代表帧 {path} 时出错: {e}")
+        return len(ids), removed_bytes
+
+    def _detach_incidents(self, cutoff: str) -> None:
+        """跨越保留期起点的事件：去掉指向已删除记录的第一条记录ID"""
+        with engine.begin() as connection:
+            connection.execute(text(
+                "UPDATE incidents SET first_record_id = NULL WHERE start_date < :cutoff "
+                "AND first_record_id IS NOT NULL "
+                "AND NOT EXISTS (SELECT 1 FROM analysis_records r WHERE r.id = incidents.first_record_id)"),
+                {'cutoff': cutoff})
+
+    def _refresh_counters(self) -> None:
+        """删除记录后重新计算计数表中的最早记录时间"""
+        with engine.begin() as connection:
+            connection.execute(text(
+                "UPDATE analysis_counters SET "
+                "first_date = (SELECT MIN(date) FROM analysis_records r "
+                "WHERE r.camera_id = analysis_counters.camera_id AND r.danger = analysis_counters.danger), "
+                "last_date = CASE WHEN count > 0 THEN last_date END"))
+
+    def _vacuum_mode(self) -> str:
+        """数据库的自动VACUUM模式"""
+        with engine.connect() as connection:
+            return AUTO_VACUUM_MODES.get(connection.execute(text("PRAGMA auto_vacuum")).scalar(), 'unknown')
+
+    def _free_bytes(self) -> int:
+        """数据库文件中空闲页的字节数"""
+        with engine.connect() as connection:
+            free_pages = connection.execute(text("PRAGMA freelist_count")).scalar()
+            page_size = connection.execute(text("PRAGMA page_size")).scalar()
+        return free_pages * page_size
+
+    def incremental_vacuum(self) -> int:
+        """
+        分步把空闲页归还给文件系统（需要auto_vacuum=INCREMENTAL）
+
+        Returns:
+            int: 回收的字节数
+        """
+        if self._vacuum_mode() != 'incremental':
+            return 0
+        before = self._free_bytes()
+        remaining = None
+        connection = engine.raw_connection()
+        try:
+            driver_connection = connection.driver_connection
+            while not self.stop_event.is_set():
+                # sqlite3模块执行不返回列的语句时只单步执行一次（只回收一页），executescript才会执行完整条语句
+                driver_connection.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)});")
+                previous, remaining = remaining, driver_connection.execute("PRAGMA freelist_count").fetchone()[0]
+                if remaining == 0 or remaining == previous:
+                    break
+                time.sleep(self.pause)
+        finally:
+            connection.close()
+        return before - self._free_bytes()
+
+    def _analysis_bytes(self, connection) -> int:
+        """分析记录表、描述表及其索引和全文索引占用的字节数"""
+        names = [row[0] for row in connection.execute(text(
+            "SELECT name FROM sqlite_master WHERE tbl_name IN ('analysis_records', 'analysis_descriptions') "
+            "OR name LIKE 'analysis_fts%'"))]
+        try:
+            params = {f'name{index}': name for index, name in enumerate(names)}
+            placeholders = ','.join(f':{key}' for key in params)
+            return connection.execute(text(
+                f"SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN ({placeholders})"), params).scalar()
+        except OperationalError:
+            # SQLite未编译dbstat时按整个数据库文件估算
+            page_count = connection.execute(text("PRAGMA page_count")).scalar()
+            page_size = connection.execute(text("PRAGMA page_size")).scalar()
+            return page_count * page_size
+
+    def report(self) -> dict:
+        """
+        试运行：报告将被清理的数据和预计可回收的空间，不修改数据库
+
+        Returns:
+            dict: 保留期起点、各摄像头将合并的记录数和摘要数、将删除的事件数和代表帧字节数、预计回收的字节数等
+        """
+        cutoff = self.cutoff()
+        cutoff_text = cutoff.strftime(DB_DATETIME_FORMAT)
+        cameras: Dict[str, dict] = {}
+        with engine.connect() as connection:
+            total = connection.execute(text("SELECT COALESCE(SUM(count), 0) FROM analysis_counters")).scalar()
+            analysis_bytes = self._analysis_bytes(connection)
+            page_count = connection.execute(text("PRAGMA page_count")).scalar()
+            page_size = connection.execute(text("PRAGMA page_size")).scalar()
+            for camera_id in self._cameras(connection):
+                previous = self._latest_summary(connection, camera_id)
+                rows = connection.execute(text(
+                    f"SELECT id, date, danger, {DESCRIPTION_SQL} FROM analysis_records "
+                    "WHERE camera_id = :camera_id AND date < :cutoff ORDER BY date, id"),
+                    {'camera_id': camera_id, 'cutoff': cutoff_text})
+                records = 0
+                summaries = 0
+                incidents = 0
+                # 分批读取，与实际清理的合并结果一致
+                while True:
+                    chunk = rows.fetchmany(self.chunk_size)
+                    if not chunk:
+                        break
+                    runs = self._split_runs(chunk, previous)
+                    records += len(chunk)
+                    new_runs = [run for run in runs if run['id'] is None]
+                    summaries += len(new_runs)
+                    incidents += sum(1 for run in new_runs if run['danger'])
+                    # 下一批能接上的最后一个时段已计入，视为已有摘要
+                    previous = dict(runs[-1], id=runs[-1]['id'] or -1)
+                if records:
+                    cameras[camera_id] = {'records': records, 'summaries': summaries, 'incidents': incidents}
+
+            expired_incidents = [row[0] for row in connection.execute(text(
+                "SELECT id FROM incidents WHERE end_date < :cutoff"), {'cutoff': cutoff_text})]
+
+        frame_bytes = 0
+        for incident_id in expired_incidents:
+            path = self.incident_store.frame_path(incident_id)
+            if path:
+                frame_bytes += os.path.getsize(path)
+        expired = sum(camera['records'] for camera in cameras.values())
+        lux_cutoff = self.cutoff(self.lux_keep_days)
+        lux_bytes = TimeSeriesStore('lux').size_before(lux_cutoff.date())
+        return {
+            'cutoff': cutoff.strftime('%Y-%m-%d %H:%M:%S'),
+            'total_records': total,
+            'expired_records': expired,
+            'cameras': cameras,
+            'database_bytes': page_count * page_size,
+            'free_bytes': self._free_bytes(),
+            'estimated_reclaimable_bytes': int(analysis_bytes * expired / total) if total else 0,
+            'auto_vacuum': self._vacuum_mode(),
+            'expired_incidents': len(expired_incidents),
+            'incident_frame_bytes': frame_bytes,
+            'lux_cutoff': lux_cutoff.strftime('%Y-%m-%d'),
+            'lux_reclaimable_bytes': lux_bytes,
+        }
+
+    def run_once(self) -> dict:
+        """
+        执行一次清理
+
+        Returns:
+            dict: 合并删除的记录数、删除的事件数和代表帧字节数、回收的数据库字节数和删除的光照度分区字节数
+        """
+        start = time.perf_counter()
+        cutoff = self.cutoff().strftime(DB_DATETIME_FORMAT)
+        with engine.connect() as connection:
+            cameras = self._cameras(connection)
+
+        removed = 0
+        for camera_id in cameras:
+            while not self.stop_event.is_set():
+                count = self._collapse_chunk(camera_id, cutoff)
+                removed += count
+                if count < self.chunk_size:
+                    break
+                time.sleep(self.pause)
+        if removed:
+            self._refresh_counters()
+
+        incidents = 0
+        frame_bytes = 0
+        while not self.stop_event.is_set():
+            count, size = self._prune_incidents_chunk(cutoff)
+            incidents += count
+            frame_bytes += size
+            if count < self.chunk_size:
+                break
+            time.sleep(self.pause)
+        self._detach_incidents(cutoff)
+
+        # 新数据库积累足够的描述后训练第一个描述压缩字典
+        try:
+            ensure_dictionary()
+        except Exception as e:
+            logger.error(f"训练描述压缩字典时出错: {e}")
+
+        reclaimed = self.incremental_vacuum()
+        lux_bytes = TimeSeriesStore('lux').delete_before(self.cutoff(self.lux_keep_days).date())
+        result = {
+            'removed_records': removed,
+            'removed_incidents': incidents,
+            'incident_frame_bytes': frame_bytes,
+            'reclaimed_bytes': reclaimed,
+            'lux_removed_bytes': lux_bytes,
+            'elapsed_seconds': round(time.perf_counter() - start, 2),
+        }
+        if removed or incidents or reclaimed or lux_bytes:
+            logger.info(f"数据保留清理完成: {result}")
+        return result
+
+    def start(self) -> None:
+        """启动后台清理线程（启动后立即运行一次，之后每隔interval秒运行一次）"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="RetentionJob", daemon=True)
+        self.thread.start()
+        logger.info(f"数据保留任务已启动，保留最近 {self.keep_days} 天的分析记录")
+
+    def stop(self) -> None:
+        """停止后台清理线程（正在处理的批次会先完成）"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=10)
+            logger.info("数据保留任务已停止")
+
+    def _run(self) -> None:
+        """后台清理线程主循环"""
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"数据保留清理时出错: {e}")
+            self.stop_event.wait(self.interval)
+
+
+def convert_to_incremental_vacuum() -> None:
+    """把已有数据库转换为增量VACUUM模式（执行一次完整VACUUM，期间数据库被锁定）"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        connection.exec_driver_sql("VACUUM")
+        mode = connection.execute(text("PRAGMA auto_vacuum")).scalar()
+    logger.info(f"VACUUM完成，auto_vacuum={AUTO_VACUUM_MODES.get(mode, mode)}")
+
+
+def main():
+    """命令行入口"""
+    # 设置日志
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="VLM Demo data retention")
+    parser.add_argument("--keep-days", type=int, default=30,
+                        help="Keep full analysis records for this many days (default: 30)")
+    parser.add_argument("--lux-keep-days", type=int, default=None,
+                        help="Keep raw lux readings for this many days (default: same as --keep-days)")
+    parser.add_argument("--incident-gap", type=float, default=300.0,
+                        help="Max gap in seconds between records of one summarized period (default: 300)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Records per transaction (default: 500)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed and reclaimed")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="Convert an existing database to incremental auto-vacuum with a one-time full VACUUM")
+    args = parser.parse_args()
+
+    init_db()
+    job = RetentionJob(keep_days=args.keep_days, lux_keep_days=args.lux_keep_days,
+                       incident_gap=args.incident_gap, chunk_size=args.chunk_size)
+    if args.vacuum:
+        convert_to_incremental_vacuum()
+    elif args.dry_run:
+        print(json.dumps(job.report(), indent=2, ensure_ascii=False))
+    else:
+        print(json.dumps(job.run_once(), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
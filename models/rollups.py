@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+汇总统计模块
+
+管理看板需要"每小时每个摄像头的危险事件数"和"每小时平均光照度"，
+直接对分析记录做GROUP BY会随数据库变大而变慢，光照度原始读数也不在数据库中，
+因此按小时/天维护汇总表：
+- 分析汇总(analysis_rollups)由数据库触发器随记录插入/删除增量更新（见database.py迁移4）
+- 光照度汇总(lux_rollups)由Web UI在收到传感器数据时在内存中累加，定期通过写入队列保存
+- 统计接口只读取汇总表
+- 历史数据可用命令行重建：python -m models.rollups --rebuild [--since 2025-01-01]
+  （光照度小时汇总根据时间序列存储中的原始读数重算）
+"""
+
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+
+from .database import ROLLUP_BUCKETS, LuxRollup, engine, get_db, init_db, rebuild_analysis_rollups
+from .db_writer import db_writer
+from .timeseries_store import TimeSeriesStore
+
+logger = logging.getLogger("Rollups")
+
+# SQLAlchemy在SQLite中保存DateTime的字符串格式
+DB_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# 每种粒度单次查询最多覆盖的时间范围
+MAX_RANGE = {
+    'hour': timedelta(days=93),
+    'day': timedelta(days=3660),
+}
+
+# 未指定开始时间时默认查询的时间范围
+DEFAULT_RANGE = {
+    'hour': timedelta(hours=24),
+    'day': timedelta(days=30),
+}
+
+
+def _parse_db_date(value) -> datetime:
+    """把数据库中的时间（字符串或datetime）转换为datetime（精确到秒）"""
+    return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+
+
+def period_start(bucket: str, moment: datetime) -> datetime:
+    """
+    计算时间点所在汇总周期的开始时间
+
+    Args:
+        bucket (str): "hour" 或 "day"
+        moment (datetime): 时间点
+
+    Returns:
+        datetime: 周期开始时间
+    """
+    if bucket == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class LuxRollupAccumulator:
+    """光照度汇总累加器类
+
+    每个读数只更新内存中当前小时和当天的聚合值（次数、总和、最小值、最大值），
+    每隔flush_interval秒把有变化的周期整行写入数据库；
+    进程重启后第一次遇到某个周期时先从数据库读取已保存的值，再继续累加
+    """
+
+    def __init__(self, flush_interval: float = 60.0):
+        """
+        初始化光照度汇总累加器
+
+        Args:
+            flush_interval (float): 写入数据库的间隔（秒）
+        """
+        self.flush_interval = flush_interval
+        self.periods: Dict[Tuple[str, datetime], dict] = {}
+        self.dirty = set()
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _load_period(self, bucket: str, start: datetime) -> dict:
+        """从数据库读取周期已保存的聚合值"""
+        aggregate = {'count': 0, 'total': 0.0, 'minimum': None, 'maximum': None}
+        try:
+            # 获取数据库会话
+            db_gen = get_db()
+            db = next(db_gen)
+
+            row = db.get(LuxRollup, (bucket, start))
+            if row is not None:
+                aggregate = {'count': row.count or 0, 'total': row.total or 0.0,
+                             'minimum': row.minimum, 'maximum': row.maximum}
+
+            # 关闭数据库会话
+            try:
+                next(db_gen)
+            except StopIteration:
+                pass
+        except Exception as e:
+            logger.error(f"读取光照度汇总时出错: {e}")
+        return aggregate
+
+    def add(self, lux: float, timestamp: Optional[float] = None) -> None:
+        """
+        累加一个光照度读数
+
+        Args:
+            lux (float): 光照度
+            timestamp (float): 读数时间（Unix时间戳），为None时使用当前时间
+        """
+        lux = float(lux)
+        self.add_aggregate(lux, lux, lux, 1, timestamp)
+
+    def add_aggregate(self, mean: float, minimum: float, maximum: float, samples: int,
+                      timestamp: Optional[float] = None) -> None:
+        """
+        累加一组光照度读数的聚合（传感器只在超出死区或心跳时发送，数据包附带自上次发送以来原始读数的聚合）
+
+        Args:
+            mean (float): 读数平均值
+            minimum (float): 读数最小值
+            maximum (float): 读数最大值
+            samples (int): 读数数量
+            timestamp (float): 发送时间（Unix时间戳），为None时使用当前时间
+        """
+        moment = datetime.fromtimestamp(timestamp) if timestamp else datetime.now()
+        samples = int(samples)
+        if samples <= 0:
+            return
+        total = float(mean) * samples
+        minimum = float(minimum)
+        maximum = float(maximum)
+        for bucket in ROLLUP_BUCKETS:
+            key = (bucket, period_start(bucket, moment))
+            with self.lock:
+                aggregate = self.periods.get(key)
+            if aggregate is None:
+                loaded = self._load_period(*key)
+                with self.lock:
+                    aggregate = self.periods.setdefault(key, loaded)
+            with self.lock:
+                aggregate['count'] += samples
+                aggregate['total'] += total
+                aggregate['minimum'] = minimum if aggregate['minimum'] is None else min(aggregate['minimum'], minimum)
+                aggregate['maximum'] = maximum if aggregate['maximum'] is None else max(aggregate['maximum'], maximum)
+                self.dirty.add(key)
+
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """把有变化的周期写入数据库，并从内存中移除已结束的周期"""
+        with self.lock:
+            self.last_flush = time.monotonic()
+            records = [
+                LuxRollup(bucket=bucket, period_start=start, **self.periods[(bucket, start)])
+                for bucket, start in sorted(self.dirty)
+            ]
+            self.dirty.clear()
+            # 每种粒度只保留最新的周期
+            latest = {}
+            for bucket, start in self.periods:
+                latest[bucket] = max(latest.get(bucket, start), start)
+            for key in [key for key in self.periods if key[1] != latest[key[0]]]:
+                del self.periods[key]
+
+        for record in records:
+            db_writer.submit(record, merge=True)
+
+
+class RollupStats:
+    """汇总统计查询类（只读取汇总表）"""
+
+    def query(self, bucket: str = 'hour', start: Optional[datetime] = None, end: Optional[datetime] = None,
+              camera_id: Optional[str] = None) -> dict:
+        """
+        查询时间范围内每个周期的分析和光照度统计
+
+        Args:
+            bucket (str): "hour" 或 "day"
+            start (datetime): 开始时间（包含），为None时按粒度取最近24小时或30天
+            end (datetime): 结束时间（不包含），为None时为当前时间
+            camera_id (str): 摄像头标识，None表示所有摄像头
+
+        Returns:
+            dict: {"bucket", "start", "end", "analyses": [...], "lux": [...]}
+
+        Raises:
+            ValueError: 参数无效
+        """
+        if bucket not in ROLLUP_BUCKETS:
+            raise ValueError(f"Invalid bucket: {bucket}")
+        end = end or datetime.now()
+        start = period_start(bucket, start or end - DEFAULT_RANGE[bucket])
+        if start >= end:
+            raise ValueError("start must be earlier than end")
+        if end - start > MAX_RANGE[bucket]:
+            raise ValueError(f"Time range too large for bucket '{bucket}' (max {MAX_RANGE[bucket].days} days)")
+
+        params = {'bucket': bucket, 'start': start.strftime(DB_DATETIME_FORMAT), 'end': end.strftime(DB_DATETIME_FORMAT)}
+        analysis_sql = ("SELECT period_start, camera_id, total, danger FROM analysis_rollups "
+                        "WHERE bucket = :bucket AND period_start >= :start AND period_start < :end")
+        if camera_id:
+            analysis_sql += " AND camera_id = :camera_id"
+            params['camera_id'] = camera_id
+        analysis_sql += " ORDER BY period_start, camera_id"
+        lux_sql = ("SELECT period_start, count, total, minimum, maximum FROM lux_rollups "
+                   "WHERE bucket = :bucket AND period_start >= :start AND period_start < :end ORDER BY period_start")
+
+        with engine.connect() as connection:
+            analysis_rows = connection.execute(text(analysis_sql), params).all()
+            lux_rows = connection.execute(text(lux_sql), params).all()
+
+        return {
+            'bucket': bucket,
+            'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+            'end': end.strftime('%Y-%m-%d %H:%M:%S'),
+            'analyses': [
+                {'period_start': str(row[0])[:19], 'camera_id': row[1], 'total': row[2], 'danger': row[3]}
+                for row in analysis_rows if row[2] > 0
+            ],
+            'lux': [
+                {
+                    'period_start': str(row[0])[:19],
+                    'count': row[1],
+                    'mean': round(row[2] / row[1], 2) if row[1] else None,
+                    'min': round(row[3], 2) if row[3] is not None else None,
+                    'max': round(row[4], 2) if row[4] is not None else None,
+                }
+                for row in lux_rows
+            ],
+        }
+
+
+def rebuild(since: Optional[datetime] = None) -> None:
+    """
+    根据原始数据重建汇总表
+
+    分析汇总按天分批重算，每天一个短事务，运行中的写入不会被长时间阻塞；
+    保留期清理已合并为摘要的天（直到最后一个摘要所在的天）只剩汇总表中的统计，保持不变；
+    光照度小时汇总根据时间序列存储中的读数按天重算（没有读数文件的天保持不变），
+    天汇总再根据小时汇总重算
+
+    Args:
+        since (datetime): 只重建该时间所在的天及之后的数据，None表示全部重建
+    """
+    with engine.connect() as connection:
+        first, last = connection.execute(text("SELECT MIN(date), MAX(date) FROM analysis_records")).one()
+        summarized = connection.execute(text("SELECT MAX(end_date) FROM analysis_summaries")).scalar()
+
+    # 保留期清理删除了原始记录的天不能根据剩余记录重算
+    retained_end = None
+    if summarized is not None:
+        retained_end = period_start('day', _parse_db_date(summarized)) + timedelta(days=1)
+        logger.info(f"{retained_end:%Y-%m-%d} 之前的分析汇总已由保留期清理合并为摘要，保持不变")
+
+    day = period_start('day', since) if since else None
+    if retained_end is not None and (day is None or day < retained_end):
+        day = retained_end
+    if first is not None:
+        first_day = period_start('day', _parse_db_date(first))
+        end_day = period_start('day', _parse_db_date(last)) + timedelta(days=1)
+        if day is None or day < first_day:
+            day = first_day
+        end_day = max(end_day, day)
+
+        # 删除记录范围以外的汇总（例如原始记录已被手动删除），保留期清理合并过的天除外
+        params = {'start': day.strftime(DB_DATETIME_FORMAT), 'end': end_day.strftime(DB_DATETIME_FORMAT)}
+        condition = "period_start >= :end"
+        if not since:
+            condition += " OR (period_start < :start"
+            if retained_end is not None:
+                condition += " AND period_start >= :retained_end"
+                params['retained_end'] = retained_end.strftime(DB_DATETIME_FORMAT)
+            condition += ")"
+        with engine.begin() as connection:
+            connection.execute(text(f"DELETE FROM analysis_rollups WHERE {condition}"), params)
+
+        days = 0
+        while day < end_day:
+            with engine.begin() as connection:
+                rebuild_analysis_rollups(connection, day.strftime(DB_DATETIME_FORMAT),
+                                         (day + timedelta(days=1)).strftime(DB_DATETIME_FORMAT))
+            day += timedelta(days=1)
+            days += 1
+        logger.info(f"已重建 {days} 天的分析汇总")
+    else:
+        with engine.begin() as connection:
+            rebuild_analysis_rollups(connection, day.strftime(DB_DATETIME_FORMAT) if day else None)
+        logger.info("没有分析记录，已清空分析汇总")
+
+    lux_series = TimeSeriesStore('lux')
+    lux_days = [day for day in lux_series.partitions() if since is None or day >= since.date()]
+    for day in lux_days:
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        buckets = lux_series.aggregate(day_start, day_end, 3600)
+        rows = [
+            {'start': period_start('hour', datetime.fromtimestamp(start)).strftime(DB_DATETIME_FORMAT),
+             'count': int(count), 'total': float(total), 'minimum': float(minimum), 'maximum': float(maximum)}
+            for start, count, total, minimum, maximum in zip(buckets['start'], buckets['count'], buckets['total'],
+                                                             buckets['min'], buckets['max'])
+        ]
+        with engine.begin() as connection:
+            connection.execute(text(
+                "DELETE FROM lux_rollups WHERE bucket = 'hour' AND period_start >= :start AND period_start < :end"),
+                {'start': day_start.strftime(DB_DATETIME_FORMAT), 'end': day_end.strftime(DB_DATETIME_FORMAT)})
+            if rows:
+                connection.execute(text(
+                    "INSERT INTO lux_rollups (bucket, period_start, count, total, minimum, maximum) "
+                    "VALUES ('hour', :start, :count, :total, :minimum, :maximum)"), rows)
+    logger.info(f"已根据时间序列读数重建 {len(lux_days)} 天的光照度小时汇总")
+
+    params = {'start': period_start('day', since).strftime(DB_DATETIME_FORMAT) if since else None}
+    condition = " AND period_start >= :start" if since else ""
+    with engine.begin() as connection:
+        connection.execute(text(f"DELETE FROM lux_rollups WHERE bucket = 'day'{condition}"), params)
+        connection.execute(text(
+            "INSERT INTO lux_rollups (bucket, period_start, count, total, minimum, maximum) "
+            f"SELECT 'day', strftime('{ROLLUP_BUCKETS['day']}', period_start), SUM(count), SUM(total), "
+            f"MIN(minimum), MAX(maximum) FROM lux_rollups WHERE bucket = 'hour'{condition} GROUP BY 2"), params)
+    logger.info("已根据小时汇总重建光照度天汇总")
+
+
+def main():
+    """命令行入口"""
+    # 设置日志
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="VLM Demo rollup tables")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Rebuild rollup tables from raw analysis records and stored sensor readings")
+    parser.add_argument("--since", type=str, default=None,
+                        help="Only rebuild from this date on, e.g. 2025-01-01 (default: everything)")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        return
+    since = datetime.strptime(args.since, '%Y-%m-%d') if args.since else None
+    init_db()
+    start = time.perf_counter()
+    rebuild(since)
+    logger.info(f"汇总表重建完成，耗时 {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
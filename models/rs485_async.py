@@ -0,0 +1,562 @@
+#!/usr/bin/env python3
+"""
+RS485异步控制器模块
+
+同步的ModbusSerialClient每次读写都会阻塞调用线程直到响应或超时（0.5秒），
+该模块基于pymodbus的异步客户端（AsyncModbusSerialClient）实现同样的功能：
+- 一个事件循环线程处理所有设备，每个设备一个轮询协程，不需要每个设备一个线程
+- 总线仍然是半双工的：事务通过带优先级的总线锁串行执行（危险报警优先），两次事务之间保持帧间隔
+- 每次事务有独立的超时，超时或通信错误时释放总线后重试（设备返回异常响应时不重试）
+- 灯光命令在获得总线前被新命令取代时合并执行，并沿用RS485Controller的灯光状态缓存和多寄存器写入
+- 对外接口与RS485Controller相同（connect、set_light_async、read_device、bus_stats等），
+  RS485SensorDataSender可以直接使用；另外提供start_polling按设备登记表并发轮询
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymodbus import FramerType
+from pymodbus.client import AsyncModbusSerialClient, AsyncModbusTcpClient
+
+from services.metrics import metrics
+
+from .rs485_bus import PRIORITY_CONTROL, PRIORITY_POLL, DeviceStats
+from .rs485_bus import inter_frame_gap as rtu_frame_gap
+from .rs485_controller import ILLEGAL_FUNCTION, LIGHT_OFF, LIGHT_STATES, tcp_address
+from .rs485_devices import DeviceConfig, default_devices
+
+logger = logging.getLogger("AsyncRS485Controller")
+
+
+class _BusLock:
+    """带优先级的总线锁（只在事件循环线程中使用）"""
+
+    def __init__(self):
+        self.locked = False
+        self.waiters: List[list] = []  # [优先级, 序号, Future]
+        self.sequence = itertools.count()
+
+    async def acquire(self, priority: int) -> None:
+        """
+        获取总线，等待时按优先级排队
+
+        Args:
+            priority (int): 优先级，数值越小越先获得总线
+        """
+        if not self.locked and not self.waiters:
+            self.locked = True
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self.sequence), waiter]
+        heapq.heappush(self.waiters, entry)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 已经获得总线但调用方被取消，交给下一个等待者
+                self.release()
+            else:
+                self.waiters.remove(entry)
+                heapq.heapify(self.waiters)
+            raise
+
+    def release(self) -> None:
+        """释放总线，直接交给优先级最高的等待者"""
+        while self.waiters:
+            _, _, waiter = heapq.heappop(self.waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.locked = False
+
+
+class AsyncRS485Controller:
+    """RS485异步控制器类（集成灯光控制和传感器读取功能）"""
+
+    def __init__(self, serial_port='/dev/ttyTHS1', baud=9600, light_control_addr=0x01, light_sensor_addr=0x0B,
+                 light_refresh_interval=60.0, inter_frame_gap=None, timeout=0.5, retries=2,
+                 request_timeout=5.0):
+        """
+        初始化RS485异步控制器
+
+        Args:
+            serial_port (str): 串口设备路径，或"tcp://主机:端口"
+            baud (int): 波特率
+            light_control_addr (int): 灯光控制设备地址
+            light_sensor_addr (int): 光照传感器地址
+            light_refresh_interval (float): 灯光状态未变化时重写一次的间隔（秒），0表示每次都写
+            inter_frame_gap (float): 两次事务之间的最小间隔（秒），为None时使用3.5个字符时间
+            timeout (float): 单次事务的超时时间（秒）
+            retries (int): 超时或通信错误时的重试次数
+            request_timeout (float): 同步方法等待结果的最长时间（秒）
+        """
+        self.serial_port = serial_port
+        self.baud = baud
+        self.light_control_addr = light_control_addr
+        self.light_sensor_addr = light_sensor_addr
+        self.timeout = timeout
+        self.retries = retries
+        self.request_timeout = request_timeout
+        self.gap = rtu_frame_gap(baud) if inter_frame_gap is None else inter_frame_gap
+
+        # Modbus寄存器定义（与RS485Controller相同）
+        self.REG_G, self.REG_Y, self.REG_R = 0x0000, 0x0001, 0x0002
+
+        # 灯光状态缓存
+        self.light_state: Optional[Tuple[int, int, int]] = None
+        self.light_written_at = 0.0
+        self.light_refresh_interval = light_refresh_interval
+        self.multi_write_supported = True
+        # 尚未获得总线的灯光命令：(颜色, 是否强制写入) 和等待结果的Future
+        self.light_request: Optional[Tuple[str, bool]] = None
+        self.light_pending: Optional[asyncio.Future] = None
+
+        # 总线事务统计
+        self.transactions = 0
+        self.failed_transactions = 0
+        self.skipped_writes = 0
+        self.merged = 0
+        self.retried = 0
+        self.devices: Dict[int, DeviceStats] = {}
+        self.stats_lock = threading.Lock()
+        self.started_at = time.monotonic()
+
+        # 事件循环线程、总线锁和轮询协程
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.bus_lock: Optional[_BusLock] = None
+        self.last_frame_at = 0.0
+        self.poll_tasks: List[asyncio.Task] = []
+        self.client = None
+
+        logger.info(f"初始化RS485异步控制器")
+        logger.info(f"串口: {serial_port}:{baud}，超时 {timeout} 秒，重试 {retries} 次")
+        logger.info(f"灯光控制地址: 0x{light_control_addr:02X}")
+        logger.info(f"光照传感器地址: 0x{light_sensor_addr:02X}")
+
+    def _create_client(self):
+        """创建pymodbus异步客户端（重试由本类处理）"""
+        address = tcp_address(self.serial_port)
+        if address is not None:
+            return AsyncModbusTcpClient(address[0], port=address[1], framer=FramerType.RTU,
+                                        timeout=self.timeout, retries=0)
+        return AsyncModbusSerialClient(port=self.serial_port, baudrate=self.baud, bytesize=8, parity='N',
+                                       stopbits=1, timeout=self.timeout, retries=0)
+
+    # ---- 事件循环线程 ----
+
+    def _run_coroutine(self, coroutine) -> Future:
+        """在事件循环线程中执行协程，返回concurrent.futures.Future"""
+        if self.loop is None or not self.loop.is_running():
+            coroutine.close()
+            future: Future = Future()
+            future.set_exception(RuntimeError("RS485异步控制器未连接"))
+            return future
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def _wait(self, coroutine, default):
+        """在事件循环线程中执行协程并等待结果，出错或超时时返回default"""
+        try:
+            return self._run_coroutine(coroutine).result(self.request_timeout)
+        except Exception as e:
+            logger.error(f"等待RS485总线结果时出错: {e!r}")
+            return default
+
+    def connect(self):
+        """
+        启动事件循环线程并连接到RS485设备
+
+        Returns:
+            bool: 连接是否成功
+        """
+        if self.loop is None or not self.loop.is_running():
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever, name="RS485Async", daemon=True)
+            self.thread.start()
+        try:
+            if self._run_coroutine(self._connect()).result(self.request_timeout + self.timeout):
+                logger.info("成功连接到RS485设备")
+                return True
+            logger.error("无法连接到RS485设备")
+            return False
+        except Exception as e:
+            logger.error(f"连接RS485设备时出错: {e}")
+            return False
+
+    async def _connect(self) -> bool:
+        """在事件循环中创建客户端并连接"""
+        self.bus_lock = _BusLock()
+        if self.client is None:
+            self.client = self._create_client()
+        return await self.client.connect()
+
+    def disconnect(self):
+        """停止轮询、断开RS485设备连接并停止事件循环线程"""
+        if self.loop is None or not self.loop.is_running():
+            return
+        try:
+            self._run_coroutine(self._disconnect()).result(self.request_timeout)
+            logger.info("已断开RS485设备连接")
+        except Exception as e:
+            logger.error(f"断开RS485设备连接时出错: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2)
+        self.loop.close()
+        self.loop = None
+
+    async def _disconnect(self) -> None:
+        """在事件循环中取消轮询协程并关闭客户端"""
+        await self._stop_polling()
+        if self.client is not None:
+            # 客户端绑定在当前事件循环上，重新连接时重新创建
+            self.client.close()
+            self.client = None
+
+    # ---- 总线事务 ----
+
+    def _count_transaction(self, ok):
+        """记录一次总线事务"""
+        self.transactions += 1
+        metrics.increment('rs485.transactions')
+        if not ok:
+            self.failed_transactions += 1
+            metrics.increment('rs485.failed_transactions')
+
+    def _record(self, device_addr: int, latency: float, error: Optional[str]) -> None:
+        """记录设备的一次事务"""
+        with self.stats_lock:
+            self.devices.setdefault(device_addr, DeviceStats()).add(latency, error)
+        metrics.observe(f'rs485.device_{device_addr:02X}.latency_ms', latency * 1000)
+        if error is not None:
+            metrics.increment(f'rs485.device_{device_addr:02X}.errors')
+
+    async def _transact_locked(self, device_addr: int, request: Callable):
+        """
+        执行一次Modbus事务（调用方已持有总线锁）
+
+        Args:
+            device_addr (int): 设备地址
+            request (callable): 返回pymodbus请求协程的函数
+
+        Returns:
+            pymodbus响应
+
+        Raises:
+            Exception: 超时或通信错误（已计入错误数）
+        """
+        wait = self.last_frame_at + self.gap - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        start = time.monotonic()
+        error = None
+        try:
+            response = await asyncio.wait_for(request(), self.timeout + self.gap * 2)
+            if response is None or response.isError():
+                error = str(response)
+            return response
+        except asyncio.TimeoutError:
+            error = "timeout"
+            raise
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            raise
+        finally:
+            end = time.monotonic()
+            self.last_frame_at = end
+            self._record(device_addr, end - start, error)
+            self._count_transaction(error is None)
+
+    async def _transact(self, device_addr: int, request: Callable, priority: int = PRIORITY_POLL):
+        """
+        获取总线并执行一次Modbus事务，超时或通信错误时释放总线后重试
+
+        Args:
+            device_addr (int): 设备地址
+            request (callable): 返回pymodbus请求协程的函数
+            priority (int): 总线优先级
+
+        Returns:
+            pymodbus响应，重试后仍失败时为None
+        """
+        for attempt in range(self.retries + 1):
+            await self.bus_lock.acquire(priority)
+            try:
+                return await self._transact_locked(device_addr, request)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt < self.retries:
+                    self.retried += 1
+                    metrics.increment('rs485.retries')
+                    logger.debug(f"设备 0x{device_addr:02X} 事务失败，重试: {e!r}")
+                else:
+                    logger.error(f"设备 0x{device_addr:02X} 事务失败: {e!r}")
+            finally:
+                self.bus_lock.release()
+        return None
+
+    async def read_registers_async(self, addr, reg, count, function="holding", priority=PRIORITY_POLL):
+        """
+        读取连续的Modbus寄存器（协程）
+
+        Args:
+            addr (int): 设备地址
+            reg (int): 起始寄存器地址
+            count (int): 寄存器数量
+            function (str): 寄存器类型（holding或input）
+            priority (int): 总线优先级
+
+        Returns:
+            list: 寄存器值，读取失败时为None
+        """
+        read = self.client.read_input_registers if function == "input" else self.client.read_holding_registers
+        rr = await self._transact(addr, lambda: read(reg, count=count, device_id=addr), priority)
+        if rr is None or rr.isError() or len(getattr(rr, 'registers', None) or []) < count:
+            if rr is not None:
+                logger.error(f"读取设备 0x{addr:02X} 寄存器 {reg}-{reg + count - 1} 时出错: {rr}")
+            return None
+        return list(rr.registers[:count])
+
+    async def _read_device(self, device: DeviceConfig, priority=PRIORITY_POLL):
+        """轮询设备的所有合并读取（协程）"""
+        values = {}
+        for block in device.blocks:
+            registers = await self.read_registers_async(device.address, block.start, block.count,
+                                                        block.function, priority)
+            if registers is None:
+                values.update({field.name: None for field in block.fields})
+            else:
+                values.update(block.decode(registers))
+        return values if any(value is not None for value in values.values()) else None
+
+    def read_device_async(self, device, priority=PRIORITY_POLL) -> Future:
+        """
+        提交设备轮询，不等待执行
+
+        Args:
+            device (DeviceConfig): 设备配置
+            priority (int): 总线优先级
+
+        Returns:
+            Future: 结果为 字段名称 -> 数值 的字典，全部无效时为None
+        """
+        return self._run_coroutine(self._read_device(device, priority))
+
+    def read_device(self, device, priority=PRIORITY_POLL):
+        """
+        轮询设备并等待结果
+
+        Args:
+            device (DeviceConfig): 设备配置
+            priority (int): 总线优先级
+
+        Returns:
+            dict: 字段名称 -> 数值，全部无效时为None
+        """
+        return self._wait(self._read_device(device, priority), None)
+
+    def read_lux(self, priority=PRIORITY_POLL):
+        """
+        读取光照度值
+
+        Args:
+            priority (int): 总线优先级
+
+        Returns:
+            int: 光照度值，如果读取失败则返回None
+        """
+        values = self.read_device(default_devices(self.light_sensor_addr)[0], priority)
+        return values.get("lux") if values else None
+
+    # ---- 灯光控制 ----
+
+    def set_light_async(self, color, force=False, priority=PRIORITY_CONTROL) -> Future:
+        """
+        提交灯光命令，不等待执行
+
+        尚未获得总线的灯光命令被新命令取代，两者的Future都返回新命令的结果
+
+        Args:
+            color (str): 灯光命令 ("green", "yellow", "red", "danger", "dark", "off")
+            force (bool): 忽略缓存，总是写入
+            priority (int): 总线优先级（危险报警使用PRIORITY_ALERT）
+
+        Returns:
+            Future: 结果为灯光是否处于要求的状态
+        """
+        return self._run_coroutine(self._set_light(color, force, priority))
+
+    def set_light(self, color, force=False, priority=PRIORITY_CONTROL):
+        """
+        设置灯光颜色并等待结果
+
+        Args:
+            color (str): 灯光命令
+            force (bool): 忽略缓存，总是写入
+            priority (int): 总线优先级
+
+        Returns:
+            bool: 灯光是否处于要求的状态
+        """
+        return self._wait(self._set_light(color, force, priority), False)
+
+    async def _set_light(self, color, force, priority) -> bool:
+        """合并灯光命令并在获得总线后写入（协程）"""
+        if self.light_pending is not None:
+            # 上一条命令还在等待总线，改为执行本命令
+            previous_force = self.light_request[1]
+            self.light_request = (color, force or previous_force)
+            self.merged += 1
+            metrics.increment('rs485.merged_commands')
+            return await asyncio.shield(self.light_pending)
+
+        self.light_request = (color, force)
+        pending = self.light_pending = asyncio.get_running_loop().create_future()
+        try:
+            await self.bus_lock.acquire(priority)
+            try:
+                self.light_pending = None
+                color, force = self.light_request
+                ok = await self._apply_light(color, force)
+            finally:
+                self.bus_lock.release()
+            pending.set_result(ok)
+        except BaseException as e:
+            if self.light_pending is pending:
+                self.light_pending = None
+            if not pending.done():
+                pending.set_exception(e if isinstance(e, Exception) else RuntimeError("灯光命令已取消"))
+            raise
+        return ok
+
+    async def _write(self, addr, request) -> bool:
+        """执行一次写入事务（调用方已持有总线锁）"""
+        try:
+            result = await self._transact_locked(addr, request)
+        except Exception as e:
+            logger.error(f"写入寄存器时出错: {e!r}")
+            return False
+        if result.isError():
+            logger.error(f"写入寄存器时出错: {result}")
+            if getattr(result, 'exception_code', None) == ILLEGAL_FUNCTION and self.multi_write_supported:
+                logger.warning(f"设备 0x{addr:02X} 不支持写多个寄存器，改为逐个写入")
+                self.multi_write_supported = False
+            return False
+        return True
+
+    async def _apply_light(self, color, force=False) -> bool:
+        """设置灯光颜色（调用方已持有总线锁）"""
+        state = LIGHT_STATES.get(color, LIGHT_OFF)
+        now = time.monotonic()
+        if (not force and state == self.light_state
+                and (not self.light_refresh_interval or now - self.light_written_at < self.light_refresh_interval)):
+            self.skipped_writes += 1
+            metrics.increment('rs485.light_writes_skipped')
+            return True
+
+        addr = self.light_control_addr
+        ok = False
+        if self.multi_write_supported:
+            ok = await self._write(addr, lambda: self.client.write_registers(self.REG_G, list(state), device_id=addr))
+        if not self.multi_write_supported:
+            # 先关灯再开灯，只写与缓存不同的寄存器
+            previous = self.light_state if self.light_state is not None and not force else (None, None, None)
+            ok = True
+            for i in sorted(range(3), key=lambda i: state[i]):
+                if previous[i] != state[i]:
+                    ok = await self._write(addr, lambda i=i: self.client.write_register(
+                        self.REG_G + i, state[i], device_id=addr)) and ok
+
+        if ok:
+            self.light_state = state
+            self.light_written_at = now
+            logger.info(f"灯光已设置为: {color}")
+        else:
+            self.light_state = None
+            logger.error(f"设置灯光为 {color} 失败")
+        return ok
+
+    # ---- 并发轮询 ----
+
+    def start_polling(self, devices: List[DeviceConfig], on_values: Callable[[DeviceConfig, Optional[dict]], None]) -> None:
+        """
+        为每个设备启动一个轮询协程
+
+        各设备的首次轮询在其轮询周期内错开，之后按各自周期轮询；总线锁保证事务串行执行
+
+        Args:
+            devices (list): 设备配置列表
+            on_values (callable): 每次轮询后在事件循环线程中调用 on_values(设备, 读数或None)，不能阻塞
+        """
+        self._run_coroutine(self._start_polling(devices, on_values)).result(self.request_timeout)
+
+    async def _start_polling(self, devices, on_values) -> None:
+        """在事件循环中创建轮询协程"""
+        await self._stop_polling()
+        for index, device in enumerate(devices):
+            phase = device.poll_interval * index / len(devices)
+            self.poll_tasks.append(asyncio.get_running_loop().create_task(
+                self._poll_device(device, phase, on_values), name=f"poll-{device.name}"))
+        logger.info(f"已启动 {len(devices)} 个设备轮询协程")
+
+    def stop_polling(self) -> None:
+        """停止所有轮询协程"""
+        try:
+            self._run_coroutine(self._stop_polling()).result(self.request_timeout)
+        except Exception as e:
+            logger.error(f"停止轮询时出错: {e}")
+
+    async def _stop_polling(self) -> None:
+        """取消所有轮询协程"""
+        tasks, self.poll_tasks = self.poll_tasks, []
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _poll_device(self, device: DeviceConfig, phase: float, on_values) -> None:
+        """单个设备的轮询协程"""
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(phase)
+        due = loop.time()
+        while True:
+            try:
+                values = await self._read_device(device)
+                on_values(device, values)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"轮询设备 {device.name} 时出错: {e}")
+            # 按计划时刻推进，落后超过一个周期时从当前时刻重新计算
+            now = loop.time()
+            due += device.poll_interval
+            if due < now:
+                due = now + device.poll_interval
+            await asyncio.sleep(due - now)
+
+    def bus_stats(self):
+        """
+        总线事务统计
+
+        Returns:
+            dict: 事务数、失败数、重试数、跳过的灯光写入数、被合并的灯光命令数、平均每分钟事务数和各设备统计
+        """
+        minutes = max((time.monotonic() - self.started_at) / 60.0, 1e-9)
+        with self.stats_lock:
+            devices = {f"0x{addr:02X}": stats.to_dict() for addr, stats in sorted(self.devices.items())}
+        return {
+            "transactions": self.transactions,
+            "failed_transactions": self.failed_transactions,
+            "retries": self.retried,
+            "skipped_light_writes": self.skipped_writes,
+            "merged_commands": self.merged,
+            "transactions_per_minute": round(self.transactions / minutes, 1),
+            "devices": devices,
+        }
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+RS485总线调度模块
+
+RS485是半双工总线，同一时间只能有一个Modbus事务。传感器轮询线程和VLM分析线程
+各自直接调用Modbus客户端时，请求帧会交错，导致CRC错误和超时。该模块：
+- 由唯一的总线线程执行所有Modbus事务，其他线程提交任务后通过Future获取结果
+- 任务按优先级执行（危险报警先于灯光控制，灯光控制先于例行轮询），同优先级按提交顺序
+- 带合并键的任务（例如灯光命令）在执行前被同一键的新任务取代，旧任务的Future返回新任务的结果
+- 两次事务之间保持Modbus RTU规定的帧间隔（3.5个字符时间），不再固定sleep
+- 按设备地址统计事务数、错误数和延迟
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from services.metrics import metrics
+
+logger = logging.getLogger("RS485Bus")
+
+# 任务优先级（数值越小越先执行）
+PRIORITY_ALERT = 0    # 危险报警
+PRIORITY_CONTROL = 1  # 灯光等控制命令
+PRIORITY_POLL = 2     # 例行传感器轮询
+
+# 波特率高于19200时Modbus RTU规定的固定帧间隔（秒）
+MIN_INTER_FRAME_GAP = 0.00175
+
+
+def inter_frame_gap(baud: int) -> float:
+    """
+    计算Modbus RTU帧间隔：3.5个字符时间（每个字符11位）
+
+    Args:
+        baud (int): 波特率
+
+    Returns:
+        float: 帧间隔（秒）
+    """
+    if baud > 19200:
+        return MIN_INTER_FRAME_GAP
+    return 3.5 * 11 / baud
+
+
+class _Task:
+    """队列中的总线任务"""
+
+    def __init__(self, job: Callable, priority: int, key: Optional[str]):
+        self.job = job
+        self.priority = priority
+        self.key = key
+        self.future: Future = Future()
+        self.superseded = False
+        self.submitted_at = time.monotonic()
+
+
+class DeviceStats:
+    """单个设备的事务统计"""
+
+    def __init__(self):
+        self.transactions = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_error: Optional[str] = None
+
+    def add(self, latency: float, error: Optional[str]) -> None:
+        """记录一次事务（调用方负责加锁）"""
+        self.transactions += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        if error is not None:
+            self.errors += 1
+            self.last_error = error
+
+    def to_dict(self) -> dict:
+        return {
+            "transactions": self.transactions,
+            "errors": self.errors,
+            "avg_latency_ms": round(self.total_latency / self.transactions * 1000, 1) if self.transactions else None,
+            "max_latency_ms": round(self.max_latency * 1000, 1),
+            "last_error": self.last_error,
+        }
+
+
+class RS485Bus:
+    """RS485总线调度类（唯一拥有Modbus客户端的线程）"""
+
+    def __init__(self, client, baud: int = 9600, gap: Optional[float] = None):
+        """
+        初始化总线调度
+
+        Args:
+            client: pymodbus Modbus客户端
+            baud (int): 波特率（用于计算帧间隔）
+            gap (float): 两次事务之间的最小间隔（秒），为None时使用3.5个字符时间
+        """
+        self.client = client
+        self.gap = inter_frame_gap(baud) if gap is None else gap
+        self.queue: list = []
+        self.pending: Dict[str, _Task] = {}
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self.last_frame_at = 0.0
+        self.devices: Dict[int, DeviceStats] = {}
+        self.stats_lock = threading.Lock()
+        self.merged = 0
+
+    def start(self) -> None:
+        """启动总线线程（首次提交任务时自动调用）"""
+        with self.condition:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name="RS485Bus", daemon=True)
+            self.thread.start()
+        logger.info(f"RS485总线线程已启动，帧间隔 {self.gap * 1000:.2f} ms")
+
+    def stop(self, timeout: float = 2) -> None:
+        """
+        执行完队列中的任务并停止总线线程
+
+        Args:
+            timeout (float): 最长等待时间（秒）
+        """
+        with self.condition:
+            if not self.running:
+                return
+            self.running = False
+            self.condition.notify()
+            thread = self.thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        logger.info("RS485总线线程已停止")
+
+    def in_bus_thread(self) -> bool:
+        """当前线程是否为总线线程"""
+        return self.thread is not None and threading.current_thread() is self.thread
+
+    def submit(self, job: Callable, priority: int = PRIORITY_POLL, key: Optional[str] = None) -> Future:
+        """
+        提交总线任务
+
+        Args:
+            job (callable): 在总线线程中执行的函数（通过transact执行Modbus事务），返回值作为Future的结果
+            priority (int): 优先级，数值越小越先执行
+            key (str): 合并键，队列中尚未执行的同键任务被本任务取代
+
+        Returns:
+            Future: 任务结果
+        """
+        task = _Task(job, priority, key)
+        if self.in_bus_thread():
+            # 任务中再次提交（例如在总线线程中调用同步接口）时直接执行，避免死锁
+            self._execute(task)
+            return task.future
+        if self.thread is None or not self.thread.is_alive():
+            self.start()
+        with self.condition:
+            if key is not None:
+                previous = self.pending.get(key)
+                if previous is not None:
+                    # 旧命令尚未执行，直接由新命令取代
+                    previous.superseded = True
+                    _chain(task.future, previous.future)
+                    priority = min(priority, previous.priority)
+                    task.priority = priority
+                    self.merged += 1
+                    metrics.increment('rs485.merged_commands')
+                self.pending[key] = task
+            heapq.heappush(self.queue, (priority, next(self.sequence), task))
+            metrics.set_gauge('rs485.queue_depth', len(self.queue))
+            self.condition.notify()
+        return task.future
+
+    def call(self, job: Callable, priority: int = PRIORITY_POLL, key: Optional[str] = None,
+             timeout: Optional[float] = None):
+        """
+        提交总线任务并等待结果
+
+        Args:
+            job (callable): 在总线线程中执行的函数
+            priority (int): 优先级
+            key (str): 合并键
+            timeout (float): 最长等待时间（秒）
+
+        Returns:
+            任务的返回值
+
+        Raises:
+            Exception: 任务抛出的异常或等待超时
+        """
+        return self.submit(job, priority, key).result(timeout)
+
+    def transact(self, device_addr: int, request: Callable):
+        """
+        执行一次Modbus事务（只能在总线线程的任务中调用）
+
+        保证与上一次事务之间的帧间隔，并记录设备的延迟和错误
+
+        Args:
+            device_addr (int): 设备地址
+            request (callable): 发送请求并返回pymodbus响应的函数
+
+        Returns:
+            pymodbus响应
+
+        Raises:
+            Exception: 请求抛出的异常（已计入错误数）
+        """
+        wait = self.last_frame_at + self.gap - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        start = time.monotonic()
+        error = None
+        try:
+            response = request()
+            if response is None or response.isError():
+                error = str(response)
+            return response
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            end = time.monotonic()
+            self.last_frame_at = end
+            self._record(device_addr, end - start, error)
+
+    def _record(self, device_addr: int, latency: float, error: Optional[str]) -> None:
+        """记录设备的一次事务"""
+        with self.stats_lock:
+            self.devices.setdefault(device_addr, DeviceStats()).add(latency, error)
+        metrics.observe(f'rs485.device_{device_addr:02X}.latency_ms', latency * 1000)
+        if error is not None:
+            metrics.increment(f'rs485.device_{device_addr:02X}.errors')
+
+    def device_stats(self) -> dict:
+        """
+        各设备的事务统计
+
+        Returns:
+            dict: {"0x01": {"transactions", "errors", "avg_latency_ms", "max_latency_ms", "last_error"}, ...}
+        """
+        with self.stats_lock:
+            return {f"0x{addr:02X}": stats.to_dict() for addr, stats in sorted(self.devices.items())}
+
+    def _next_task(self) -> Optional[_Task]:
+        """取出下一个要执行的任务，队列为空且已停止时返回None"""
+        with self.condition:
+            while True:
+                while self.queue:
+                    _, _, task = heapq.heappop(self.queue)
+                    metrics.set_gauge('rs485.queue_depth', len(self.queue))
+                    if task.superseded:
+                        continue
+                    if task.key is not None and self.pending.get(task.key) is task:
+                        del self.pending[task.key]
+                    return task
+                if not self.running:
+                    return None
+                self.condition.wait()
+
+    def _execute(self, task: _Task) -> None:
+        """执行任务并设置Future结果"""
+        if not task.future.set_running_or_notify_cancel():
+            return
+        metrics.observe('rs485.queue_wait_ms', (time.monotonic() - task.submitted_at) * 1000)
+        try:
+            task.future.set_result(task.job())
+        except Exception as e:
+            task.future.set_exception(e)
+
+    def _run(self) -> None:
+        """总线线程主循环"""
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            self._execute(task)
+
+
+def _chain(source: Future, target: Future) -> None:
+    """source完成后把结果传给target（被取代的命令返回取代它的命令的结果）"""
+    def copy(done: Future) -> None:
+        if not target.set_running_or_notify_cancel():
+            return
+        if done.cancelled():
+            target.set_exception(RuntimeError("取代的命令已取消"))
+        elif done.exception() is not None:
+            target.set_exception(done.exception())
+        else:
+            target.set_result(done.result())
+    source.add_done_callback(copy)
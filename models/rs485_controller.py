@@ -3,34 +3,76 @@
 RS485控制器模块
 
 该模块实现了RS485灯光控制和传感器数据读取功能
+
+9600波特率下每次Modbus RTU事务约需几十毫秒，总线是稀缺资源：
+- 灯光的三个寄存器（绿、黄、红）相邻，切换颜色用一次写多个寄存器(0x10)事务完成
+- 缓存最后写入的灯光状态，颜色不变时不再写总线（每隔一段时间重写一次，防止设备断电重启后状态不一致）
+- 统计总线事务数，可计算每分钟事务数
+
+所有Modbus事务都通过RS485Bus在唯一的总线线程中执行（见rs485_bus.py），
+公开方法可以在任意线程中调用；*_async方法返回Future，同步方法等待结果
 """
 
 import json
 import logging
 import time
+from concurrent.futures import Future
 from datetime import datetime
+from typing import List, Optional, Tuple
+from pymodbus import FramerType
 from pymodbus.client import ModbusSerialClient as RTU
+from pymodbus.client import ModbusTcpClient
+
+from services.metrics import metrics
+
+from .rs485_bus import PRIORITY_CONTROL, PRIORITY_POLL, RS485Bus
 
-# 设置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger("RS485Controller")
 
+# 灯光命令对应的寄存器值（绿、黄、红），其他命令（"danger"、"dark"、"off"）关闭所有灯
+LIGHT_STATES = {
+    "green": (1, 0, 0),
+    "yellow": (0, 1, 0),
+    "red": (0, 0, 1),
+}
+LIGHT_OFF = (0, 0, 0)
+
+# Modbus异常码：设备不支持该功能码
+ILLEGAL_FUNCTION = 0x01
+
+
+def tcp_address(port: str) -> Optional[Tuple[str, int]]:
+    """
+    解析"tcp://主机:端口"形式的端口（RS485模拟器或RS485转以太网网关，使用RTU帧格式）
+
+    Args:
+        port (str): 串口设备路径或"tcp://主机:端口"
+
+    Returns:
+        tuple: (主机, 端口)，串口设备路径时为None
+    """
+    if not port.startswith("tcp://"):
+        return None
+    host, _, tcp_port = port[len("tcp://"):].rpartition(":")
+    return host or "127.0.0.1", int(tcp_port)
+
 
 class RS485Controller:
     """RS485控制器类（集成灯光控制和传感器读取功能）"""
     
-    def __init__(self, serial_port='/dev/ttyTHS1', baud=9600, light_control_addr=0x01, light_sensor_addr=0x0B):
+    def __init__(self, serial_port='/dev/ttyTHS1', baud=9600, light_control_addr=0x01, light_sensor_addr=0x0B,
+                 light_refresh_interval=60.0, inter_frame_gap=None, request_timeout=5.0):
         """
         初始化RS485控制器
         
         Args:
-            serial_port (str): 串口设备路径
+            serial_port (str): 串口设备路径，或"tcp://主机:端口"（见tcp_address）
             baud (int): 波特率
             light_control_addr (int): 灯光控制设备地址
             light_sensor_addr (int): 光照传感器地址
+            light_refresh_interval (float): 灯光状态未变化时重写一次的间隔（秒），0表示每次都写
+            inter_frame_gap (float): 两次事务之间的最小间隔（秒），为None时使用3.5个字符时间
+            request_timeout (float): 同步方法等待总线结果的最长时间（秒）
         """
         # RS485配置
         self.serial_port = serial_port
@@ -44,9 +86,29 @@ class RS485Controller:
         # 光照传感器寄存器
         self.REG_LUX_HIGH, self.REG_LUX_LOW = 0x0007, 0x0008
         
+        # 灯光状态缓存：最后成功写入的 (绿, 黄, 红) 值和写入时间，None表示未知
+        self.light_state: Optional[Tuple[int, int, int]] = None
+        self.light_written_at = 0.0
+        self.light_refresh_interval = light_refresh_interval
+        # 设备不支持写多个寄存器时退回逐个写入
+        self.multi_write_supported = True
+        
+        # 总线事务统计
+        self.transactions = 0
+        self.failed_transactions = 0
+        self.skipped_writes = 0
+        self.started_at = time.monotonic()
+        
         # 初始化Modbus客户端
-        self.client = RTU(port=self.serial_port, baudrate=self.baud,
-                          bytesize=8, parity='N', stopbits=1, timeout=0.5)
+        address = tcp_address(self.serial_port)
+        if address is not None:
+            self.client = ModbusTcpClient(address[0], port=address[1], framer=FramerType.RTU, timeout=0.5)
+        else:
+            self.client = RTU(port=self.serial_port, baudrate=self.baud,
+                              bytesize=8, parity='N', stopbits=1, timeout=0.5)
+        # 总线调度：所有事务在总线线程中串行执行
+        self.bus = RS485Bus(self.client, baud=self.baud, gap=inter_frame_gap)
+        self.request_timeout = request_timeout
         
         logger.info(f"初始化RS485控制器")
         logger.info(f"串口: {serial_port}:{baud}")
@@ -62,6 +124,7 @@ class RS485Controller:
         """
         try:
             if self.client.connect():
+                self.bus.start()
                 logger.info("成功连接到RS485设备")
                 return True
             else:
@@ -74,12 +137,29 @@ class RS485Controller:
     def disconnect(self):
         """断开RS485设备连接"""
         try:
+            self.bus.stop()
             self.client.close()
             logger.info("已断开RS485设备连接")
         except Exception as e:
             logger.error(f"断开RS485设备连接时出错: {e}")
     
-    def write_register(self, addr, reg, val):
+    def _count_transaction(self, ok):
+        """记录一次总线事务"""
+        self.transactions += 1
+        metrics.increment('rs485.transactions')
+        if not ok:
+            self.failed_transactions += 1
+            metrics.increment('rs485.failed_transactions')
+    
+    def _call(self, job, priority, default):
+        """在总线线程中执行任务并等待结果，出错或超时时返回default"""
+        try:
+            return self.bus.call(job, priority, timeout=self.request_timeout)
+        except Exception as e:
+            logger.error(f"等待RS485总线结果时出错: {e!r}")
+            return default
+    
+    def write_register(self, addr, reg, val, priority=PRIORITY_CONTROL):
         """
         写入Modbus寄存器
         
@@ -87,51 +167,174 @@ class RS485Controller:
             addr (int): 设备地址
             reg (int): 寄存器地址
             val (int): 写入值
+            priority (int): 总线任务优先级
             
         Returns:
             bool: 是否成功
         """
+        return self._call(lambda: self._write_register(addr, reg, val), priority, False)
+    
+    def _write_register(self, addr, reg, val):
+        """写入Modbus寄存器（在总线线程中执行）"""
         try:
-            result = self.client.write_register(reg, val, device_id=addr)
-            return not result.isError()
+            result = self.bus.transact(addr, lambda: self.client.write_register(reg, val, device_id=addr))
+            ok = not result.isError()
         except Exception as e:
             logger.error(f"写入寄存器时出错: {e}")
-            return False
+            ok = False
+        self._count_transaction(ok)
+        return ok
+    
+    def write_registers(self, addr, reg, values: List[int], priority=PRIORITY_CONTROL):
+        """
+        在一次事务中写入多个连续的Modbus寄存器（功能码0x10）
+        
+        Args:
+            addr (int): 设备地址
+            reg (int): 起始寄存器地址
+            values (list): 写入值
+            priority (int): 总线任务优先级
+            
+        Returns:
+            bool: 是否成功
+        """
+        values = list(values)
+        return self._call(lambda: self._write_registers(addr, reg, values), priority, False)
+    
+    def _write_registers(self, addr, reg, values: List[int]):
+        """写入多个连续的Modbus寄存器（在总线线程中执行）"""
+        try:
+            result = self.bus.transact(addr, lambda: self.client.write_registers(reg, values, device_id=addr))
+            ok = not result.isError()
+            if not ok:
+                logger.error(f"写入多个寄存器时出错: {result}")
+                if getattr(result, 'exception_code', None) == ILLEGAL_FUNCTION:
+                    # 设备不支持功能码0x10，之后逐个写入
+                    logger.warning(f"设备 0x{addr:02X} 不支持写多个寄存器，改为逐个写入")
+                    self.multi_write_supported = False
+        except Exception as e:
+            logger.error(f"写入多个寄存器时出错: {e}")
+            ok = False
+        self._count_transaction(ok)
+        return ok
     
-    def set_light(self, color):
+    def set_light_async(self, color, force=False, priority=PRIORITY_CONTROL) -> Future:
         """
-        设置灯光颜色
+        提交灯光命令，不等待执行
+        
+        队列中尚未执行的灯光命令被新命令取代（只执行最新的命令），
+        被取代命令的Future返回新命令的结果
         
         Args:
             color (str): 灯光命令 ("green", "yellow", "red", "danger", "dark", "off")
+            force (bool): 忽略缓存，总是写入
+            priority (int): 总线任务优先级（危险报警使用PRIORITY_ALERT）
+            
+        Returns:
+            Future: 结果为灯光是否处于要求的状态
         """
+        return self.bus.submit(lambda: self._apply_light(color, force), priority, key="light")
+    
+    def set_light(self, color, force=False, priority=PRIORITY_CONTROL):
+        """
+        设置灯光颜色并等待结果
         
-        # 先关闭所有灯
-        for r in (self.REG_G, self.REG_Y, self.REG_R):
-            self.write_register(self.light_control_addr, r, 0)
+        颜色与缓存的状态相同时不写总线；否则在一次事务中写入三个灯光寄存器
         
-        # 根据命令设置对应灯
-        if color == "red":
-            self.write_register(self.light_control_addr, self.REG_R, 1)
-        elif color == "green":
-            self.write_register(self.light_control_addr, self.REG_G, 1)
-        elif color == "yellow":
-            self.write_register(self.light_control_addr, self.REG_Y, 1)
-
-        logger.info(f"灯光已设置为: {color}")
+        Args:
+            color (str): 灯光命令 ("green", "yellow", "red", "danger", "dark", "off")
+            force (bool): 忽略缓存，总是写入
+            priority (int): 总线任务优先级
+            
+        Returns:
+            bool: 灯光是否处于要求的状态
+        """
+        try:
+            return self.set_light_async(color, force, priority).result(self.request_timeout)
+        except Exception as e:
+            logger.error(f"等待灯光命令结果时出错: {e!r}")
+            return False
+    
+    def _apply_light(self, color, force=False):
+        """设置灯光颜色（在总线线程中执行）"""
+        state = LIGHT_STATES.get(color, LIGHT_OFF)
+        now = time.monotonic()
+        if (not force and state == self.light_state
+                and (not self.light_refresh_interval or now - self.light_written_at < self.light_refresh_interval)):
+            self.skipped_writes += 1
+            metrics.increment('rs485.light_writes_skipped')
+            return True
+        
+        ok = False
+        if self.multi_write_supported:
+            ok = self._write_registers(self.light_control_addr, self.REG_G, list(state))
+        if not self.multi_write_supported:
+            # 先关灯再开灯，只写与缓存不同的寄存器
+            previous = self.light_state if self.light_state is not None and not force else (None, None, None)
+            ok = True
+            order = sorted(range(3), key=lambda i: state[i])
+            for i in order:
+                if previous[i] != state[i]:
+                    ok = self._write_register(self.light_control_addr, self.REG_G + i, state[i]) and ok
+        
+        if ok:
+            self.light_state = state
+            self.light_written_at = now
+            logger.info(f"灯光已设置为: {color}")
+        else:
+            # 写入失败时状态未知，下次总是重写
+            self.light_state = None
+            logger.error(f"设置灯光为 {color} 失败")
+        return ok
+    
+    def bus_stats(self):
+        """
+        总线事务统计
+        
+        Returns:
+            dict: 事务数、失败数、跳过的灯光写入数、被合并的灯光命令数、启动以来的平均每分钟事务数和各设备统计
+        """
+        minutes = max((time.monotonic() - self.started_at) / 60.0, 1e-9)
+        return {
+            "transactions": self.transactions,
+            "failed_transactions": self.failed_transactions,
+            "skipped_light_writes": self.skipped_writes,
+            "merged_commands": self.bus.merged,
+            "transactions_per_minute": round(self.transactions / minutes, 1),
+            "devices": self.bus.device_stats(),
+        }
+    
+    def read_lux_async(self, priority=PRIORITY_POLL) -> Future:
+        """
+        提交光照度读取，不等待执行
+        
+        Args:
+            priority (int): 总线任务优先级
+            
+        Returns:
+            Future: 结果为光照度值，读取失败时为None
+        """
+        return self.bus.submit(self._read_lux, priority)
     
-    def read_lux(self):
+    def read_lux(self, priority=PRIORITY_POLL):
         """
         读取光照度值
         
+        Args:
+            priority (int): 总线任务优先级
+            
         Returns:
             int: 光照度值，如果读取失败则返回None
         """
+        return self._call(self._read_lux, priority, None)
+    
+    def _read_lux(self):
+        """读取光照度值（在总线线程中执行）"""
         try:
-            time.sleep(0.02)
             # 在pymodbus 3.x中，使用device_id参数替代slave/unit参数
-            rr = self.client.read_holding_registers(self.REG_LUX_HIGH, count=2, device_id=self.light_sensor_addr)
-            time.sleep(0.02)
+            rr = self.bus.transact(self.light_sensor_addr, lambda: self.client.read_holding_registers(
+                self.REG_LUX_HIGH, count=2, device_id=self.light_sensor_addr))
+            self._count_transaction(not rr.isError())
             if rr.isError():
                 logger.error(f"读取光照度寄存器时出错: {rr}")
                 return None
@@ -152,7 +355,77 @@ class RS485Controller:
             return lux
         except Exception as e:
             logger.error(f"读取光照度时发生异常: {e}")
+            self._count_transaction(False)
+            return None
+    
+    def read_registers(self, addr, reg, count, function="holding", priority=PRIORITY_POLL):
+        """
+        读取连续的Modbus寄存器
+        
+        Args:
+            addr (int): 设备地址
+            reg (int): 起始寄存器地址
+            count (int): 寄存器数量
+            function (str): 寄存器类型（holding或input）
+            priority (int): 总线任务优先级
+            
+        Returns:
+            list: 寄存器值，读取失败时为None
+        """
+        return self._call(lambda: self._read_registers(addr, reg, count, function), priority, None)
+    
+    def _read_registers(self, addr, reg, count, function="holding"):
+        """读取连续的Modbus寄存器（在总线线程中执行）"""
+        read = self.client.read_input_registers if function == "input" else self.client.read_holding_registers
+        try:
+            rr = self.bus.transact(addr, lambda: read(reg, count=count, device_id=addr))
+            ok = not rr.isError() and len(getattr(rr, 'registers', None) or []) >= count
+        except Exception as e:
+            logger.error(f"读取设备 0x{addr:02X} 寄存器 {reg}-{reg + count - 1} 时出错: {e}")
+            self._count_transaction(False)
             return None
+        self._count_transaction(ok)
+        if not ok:
+            logger.error(f"读取设备 0x{addr:02X} 寄存器 {reg}-{reg + count - 1} 时出错: {rr}")
+            return None
+        return list(rr.registers[:count])
+    
+    def read_device_async(self, device, priority=PRIORITY_POLL) -> Future:
+        """
+        提交设备轮询：在一个总线任务中依次执行该设备的所有合并读取
+        
+        Args:
+            device (DeviceConfig): 设备配置
+            priority (int): 总线任务优先级
+            
+        Returns:
+            Future: 结果为 字段名称 -> 数值 的字典（读取失败或超出范围的字段为None），全部无效时为None
+        """
+        return self.bus.submit(lambda: self._read_device(device), priority)
+    
+    def read_device(self, device, priority=PRIORITY_POLL):
+        """
+        轮询设备并等待结果
+        
+        Args:
+            device (DeviceConfig): 设备配置
+            priority (int): 总线任务优先级
+            
+        Returns:
+            dict: 字段名称 -> 数值，全部无效时为None
+        """
+        return self._call(lambda: self._read_device(device), priority, None)
+    
+    def _read_device(self, device):
+        """轮询设备（在总线线程中执行）"""
+        values = {}
+        for block in device.blocks:
+            registers = self._read_registers(device.address, block.start, block.count, block.function)
+            if registers is None:
+                values.update({field.name: None for field in block.fields})
+            else:
+                values.update(block.decode(registers))
+        return values if any(value is not None for value in values.values()) else None
     
     def lux_to_json(self, lux, err=None):
         """
@@ -177,6 +450,11 @@ class RS485Controller:
 
 def main():
     """主函数，用于测试RS485控制器（同时控制灯光和读取传感器数值）"""
+    # 设置日志
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
     import argparse
     
     # 创建命令行参数解析器
@@ -205,6 +483,11 @@ def main():
         default=0x0B,
         help="光照传感器地址 (默认: 0x0B)"
     )
+    parser.add_argument(
+        "--simulate",
+        action="store_true",
+        help="使用本机RS485模拟器代替串口设备"
+    )
     parser.add_argument(
         "--duration",
         type=int,
@@ -214,6 +497,13 @@ def main():
     
     args = parser.parse_args()
     
+    # 启动模拟器
+    simulator = None
+    if args.simulate:
+        from .rs485_simulator import RS485Simulator
+        simulator = RS485Simulator(baud=args.baud, light_addr=args.light_addr, sensor_addr=args.sensor_addr)
+        args.port = simulator.start()
+    
     # 创建RS485控制器实例
     controller = RS485Controller(
         serial_port=args.port,
@@ -225,6 +515,8 @@ def main():
     # 连接到RS485设备
     if not controller.connect():
         logger.error("无法连接到RS485设备")
+        if simulator is not None:
+            simulator.stop()
         return
     
     # 灯光颜色列表
@@ -259,8 +551,11 @@ def main():
     finally:
         # 关闭所有灯光
         controller.set_light("off")
+        logger.info(f"总线统计: {controller.bus_stats()}")
         # 断开连接
         controller.disconnect()
+        if simulator is not None:
+            simulator.stop()
         logger.info("测试结束")
 
 
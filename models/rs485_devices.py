@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+RS485设备登记和轮询调度模块
+
+同一条RS485总线上可以挂多个Modbus传感器（光照、温湿度、气体、门磁等），
+每个设备的地址、寄存器表、数据类型、缩放和轮询周期在JSON配置文件中描述：
+
+    {
+      "devices": [
+        {"name": "lux_sensor", "address": "0x0B", "poll_interval": 1,
+         "heartbeat": 5, "smoothing": "median", "window": 3,
+         "registers": {"lux": {"register": 7, "type": "uint32", "unit": "Lux", "min": 0, "max": 100000,
+                               "deadband": 2, "deadband_percent": 5,
+                               "trigger_delta": 20, "trigger_percent": 50, "trigger_direction": "drop"}}},
+        {"name": "climate", "address": "0x0C", "poll_interval": 10,
+         "registers": {"temperature": {"register": 0, "type": "int16", "scale": 0.1, "unit": "°C"},
+                       "humidity": {"register": 1, "type": "uint16", "scale": 0.1, "unit": "%"}}}
+      ]
+    }
+
+- 寄存器字段: register（地址）、type（uint16/int16/uint32/int32/float32）、scale、offset、unit、
+  function（holding/input，默认holding）、word_order（big/little，32位类型的字序，默认big）、
+  min/max（有效范围，超出时该值为None）
+- 发布（见sensor_filter.py）: 设备的heartbeat（最长发布间隔，秒），字段的smoothing（ewma/median/none）、
+  alpha、window、deadband、deadband_percent；字段未指定时使用设备级的同名配置。poll_interval是采样周期，
+  可以比心跳短得多（过采样），数据包只在值超出死区或心跳到期时发送
+- 触发分析: 字段的trigger_delta/trigger_percent/trigger_direction（both/drop/rise）。相邻两次采样的平滑值
+  变化同时超过trigger_delta和上一个值的trigger_percent%时，请求VLM立即分析当前帧（见event_bus.py）；
+  门磁等开关量设置 "trigger_delta": 0 即可在每次变化时触发
+- 同一设备的相邻寄存器合并为尽量少的读取（间隔不超过max_gap个寄存器，单次最多125个寄存器）
+- 轮询调度把各设备的首次轮询错开，并保证两次轮询之间的最小间隔，避免同时轮询挤占总线
+"""
+
+import heapq
+import json
+import logging
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .sensor_filter import SMOOTHING_METHODS
+
+logger = logging.getLogger("RS485Devices")
+
+# 数据类型占用的寄存器数量和struct格式（大端）
+DATA_TYPES = {
+    "uint16": (1, ">H"),
+    "int16": (1, ">h"),
+    "uint32": (2, ">I"),
+    "int32": (2, ">i"),
+    "float32": (2, ">f"),
+}
+
+# 寄存器类型
+REGISTER_FUNCTIONS = ("holding", "input")
+
+# 触发分析的变化方向
+TRIGGER_DIRECTIONS = ("both", "drop", "rise")
+
+# Modbus单次读取最多125个寄存器
+MAX_READ_REGISTERS = 125
+
+
+def _parse_int(value, name: str) -> int:
+    """解析整数，支持"0x0B"形式的字符串"""
+    try:
+        return int(value, 0) if isinstance(value, str) else int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} 不是有效的整数: {value!r}")
+
+
+class RegisterField:
+    """设备寄存器表中的一个字段"""
+
+    def __init__(self, name: str, register: int, data_type: str = "uint16", scale: float = 1.0,
+                 offset: float = 0.0, unit: str = "", function: str = "holding", word_order: str = "big",
+                 minimum: Optional[float] = None, maximum: Optional[float] = None, smoothing: str = "none",
+                 alpha: float = 0.5, window: int = 3, deadband: float = 0.0, deadband_percent: float = 0.0,
+                 trigger_delta: Optional[float] = None, trigger_percent: Optional[float] = None,
+                 trigger_direction: str = "both"):
+        """
+        初始化寄存器字段
+
+        Args:
+            name (str): 字段名称（发送的数据包中的键）
+            register (int): 起始寄存器地址
+            data_type (str): 数据类型
+            scale (float): 缩放系数，值 = 原始值 × scale + offset
+            offset (float): 偏移量
+            unit (str): 单位
+            function (str): 寄存器类型（holding或input）
+            word_order (str): 32位类型的字序，big表示高位字在前
+            minimum (float): 有效范围下限
+            maximum (float): 有效范围上限
+            smoothing (str): 发布前的平滑方法（ewma、median、none）
+            alpha (float): ewma系数
+            window (int): median窗口大小（采样数）
+            deadband (float): 绝对死区，平滑值变化超过该值时发布
+            deadband_percent (float): 相对死区（上次发布值的百分比）
+            trigger_delta (float): 触发立即分析的最小变化量，与trigger_percent都为None时不触发
+            trigger_percent (float): 触发立即分析的最小变化（上一个值的百分比）
+            trigger_direction (str): 触发的变化方向（both、drop、rise）
+
+        Raises:
+            ValueError: 参数无效
+        """
+        if data_type not in DATA_TYPES:
+            raise ValueError(f"字段 {name} 的数据类型无效: {data_type}")
+        if function not in REGISTER_FUNCTIONS:
+            raise ValueError(f"字段 {name} 的寄存器类型无效: {function}")
+        if word_order not in ("big", "little"):
+            raise ValueError(f"字段 {name} 的字序无效: {word_order}")
+        if smoothing not in SMOOTHING_METHODS:
+            raise ValueError(f"字段 {name} 的平滑方法无效: {smoothing}")
+        if trigger_direction not in TRIGGER_DIRECTIONS:
+            raise ValueError(f"字段 {name} 的触发方向无效: {trigger_direction}")
+        self.name = name
+        self.register = register
+        self.data_type = data_type
+        self.count = DATA_TYPES[data_type][0]
+        self.scale = scale
+        self.offset = offset
+        self.unit = unit
+        self.function = function
+        self.word_order = word_order
+        self.minimum = minimum
+        self.maximum = maximum
+        self.smoothing = smoothing
+        self.alpha = alpha
+        self.window = window
+        self.deadband = deadband
+        self.deadband_percent = deadband_percent
+        self.trigger_delta = trigger_delta
+        self.trigger_percent = trigger_percent
+        self.trigger_direction = trigger_direction
+
+    def decode(self, words: List[int]):
+        """
+        把寄存器值转换为物理量
+
+        Args:
+            words (list): 该字段的寄存器值
+
+        Returns:
+            数值（缩放为1且无偏移的整数类型保持为int），超出有效范围时为None
+        """
+        if self.word_order == "little":
+            words = list(reversed(words))
+        raw = struct.unpack(DATA_TYPES[self.data_type][1],
+                            b"".join(struct.pack(">H", word & 0xFFFF) for word in words))[0]
+        if self.scale == 1 and self.offset == 0:
+            value = raw
+        else:
+            value = round(raw * self.scale + self.offset, 6)
+        if (self.minimum is not None and value < self.minimum) or (self.maximum is not None and value > self.maximum):
+            logger.warning(f"字段 {self.name} 读取到超出范围的值: {value}")
+            return None
+        return value
+
+    def triggered(self, previous: Optional[float], current: Optional[float]) -> bool:
+        """
+        相邻两次采样之间的变化是否需要立即分析
+
+        Args:
+            previous (float): 上一个值
+            current (float): 当前值
+
+        Returns:
+            bool: 是否触发
+        """
+        if self.trigger_delta is None and self.trigger_percent is None:
+            return False
+        if previous is None or current is None:
+            return False
+        change = current - previous
+        if (self.trigger_direction == "drop" and change >= 0) or (self.trigger_direction == "rise" and change <= 0):
+            return False
+        return (abs(change) > (self.trigger_delta or 0)
+                and abs(change) > abs(previous) * (self.trigger_percent or 0) / 100)
+
+
+class ReadBlock:
+    """一次Modbus读取覆盖的连续寄存器及其中的字段"""
+
+    def __init__(self, function: str, start: int, count: int, fields: List[RegisterField]):
+        self.function = function
+        self.start = start
+        self.count = count
+        self.fields = fields
+
+    def decode(self, registers: List[int]) -> Dict[str, object]:
+        """
+        解析读取结果
+
+        Args:
+            registers (list): 从start开始的count个寄存器值
+
+        Returns:
+            dict: 字段名称 -> 数值
+        """
+        return {field.name: field.decode(registers[field.register - self.start:
+                                                   field.register - self.start + field.count])
+                for field in self.fields}
+
+    def __repr__(self) -> str:
+        return f"ReadBlock({self.function}, {self.start}, {self.count}, {[field.name for field in self.fields]})"
+
+
+def plan_reads(fields: List[RegisterField], max_gap: int = 4,
+               max_registers: int = MAX_READ_REGISTERS) -> List[ReadBlock]:
+    """
+    把字段合并为尽量少的读取
+
+    同一寄存器类型中，地址相邻或间隔不超过max_gap个寄存器的字段合并为一次读取
+    （多读几个不用的寄存器比多一次事务快得多）
+
+    Args:
+        fields (list): 寄存器字段
+        max_gap (int): 合并时允许跳过的最大寄存器数量
+        max_registers (int): 单次读取的最大寄存器数量
+
+    Returns:
+        list: 读取块列表
+    """
+    blocks: List[ReadBlock] = []
+    for function in REGISTER_FUNCTIONS:
+        current: Optional[ReadBlock] = None
+        for field in sorted((f for f in fields if f.function == function), key=lambda f: f.register):
+            end = field.register + field.count
+            if (current is not None and field.register <= current.start + current.count + max_gap
+                    and max(end, current.start + current.count) - current.start <= max_registers):
+                current.count = max(current.count, end - current.start)
+                current.fields.append(field)
+            else:
+                current = ReadBlock(function, field.register, field.count, [field])
+                blocks.append(current)
+    return blocks
+
+
+class DeviceConfig:
+    """RS485设备配置"""
+
+    def __init__(self, name: str, address: int, fields: List[RegisterField],
+                 poll_interval: float = 1.0, max_gap: int = 4, heartbeat: float = 0.0):
+        """
+        初始化设备配置
+
+        Args:
+            name (str): 设备名称
+            address (int): Modbus设备地址
+            fields (list): 寄存器字段
+            poll_interval (float): 轮询周期（秒）
+            max_gap (int): 合并读取时允许跳过的最大寄存器数量
+            heartbeat (float): 最长发布间隔（秒），0表示每次轮询都发布
+
+        Raises:
+            ValueError: 参数无效
+        """
+        if not 1 <= address <= 247:
+            raise ValueError(f"设备 {name} 的地址无效: {address}")
+        if not fields:
+            raise ValueError(f"设备 {name} 没有寄存器")
+        if poll_interval <= 0:
+            raise ValueError(f"设备 {name} 的轮询周期无效: {poll_interval}")
+        self.name = name
+        self.address = address
+        self.fields = fields
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.blocks = plan_reads(fields, max_gap)
+        self.units = {field.name: field.unit for field in fields}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DeviceConfig":
+        """
+        从配置字典创建设备配置
+
+        Args:
+            data (dict): 设备配置（格式见模块说明）
+
+        Returns:
+            DeviceConfig: 设备配置
+
+        Raises:
+            ValueError: 配置无效
+        """
+        name = data.get("name")
+        if not name:
+            raise ValueError(f"设备缺少名称: {data}")
+        fields = []
+        for field_name, spec in (data.get("registers") or {}).items():
+            if isinstance(spec, (int, str)):
+                spec = {"register": spec}
+            fields.append(RegisterField(
+                name=field_name,
+                register=_parse_int(spec.get("register"), f"{name}.{field_name}.register"),
+                data_type=spec.get("type", "uint16"),
+                scale=float(spec.get("scale", 1.0)),
+                offset=float(spec.get("offset", 0.0)),
+                unit=spec.get("unit", ""),
+                function=spec.get("function", data.get("function", "holding")),
+                word_order=spec.get("word_order", data.get("word_order", "big")),
+                minimum=spec.get("min"),
+                maximum=spec.get("max"),
+                smoothing=spec.get("smoothing", data.get("smoothing", "none")),
+                alpha=float(spec.get("alpha", data.get("alpha", 0.5))),
+                window=int(spec.get("window", data.get("window", 3))),
+                deadband=float(spec.get("deadband", data.get("deadband", 0.0))),
+                deadband_percent=float(spec.get("deadband_percent", data.get("deadband_percent", 0.0))),
+                trigger_delta=spec.get("trigger_delta"),
+                trigger_percent=spec.get("trigger_percent"),
+                trigger_direction=spec.get("trigger_direction", "both"),
+            ))
+        return cls(
+            name=name,
+            address=_parse_int(data.get("address"), f"{name}.address"),
+            fields=fields,
+            poll_interval=float(data.get("poll_interval", 1.0)),
+            max_gap=int(data.get("max_gap", 4)),
+            heartbeat=float(data.get("heartbeat", 0.0)),
+        )
+
+
+def load_devices(path: str) -> List[DeviceConfig]:
+    """
+    从JSON配置文件加载设备登记表
+
+    Args:
+        path (str): 配置文件路径
+
+    Returns:
+        list: 设备配置列表
+
+    Raises:
+        ValueError: 配置无效
+        OSError: 文件无法读取
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    devices = [DeviceConfig.from_dict(item) for item in data.get("devices", [])]
+    names = [device.name for device in devices]
+    if len(set(names)) != len(names):
+        raise ValueError(f"设备名称重复: {names}")
+    for device in devices:
+        logger.info(f"已登记设备 {device.name} (0x{device.address:02X})，"
+                    f"{len(device.fields)} 个字段，{len(device.blocks)} 次读取，每 {device.poll_interval} 秒轮询")
+    return devices
+
+
+def default_devices(light_sensor_addr: int = 0x0B) -> List[DeviceConfig]:
+    """
+    没有配置文件时的默认设备：只有光照度传感器
+
+    每0.25秒采样一次（及时发现开关灯），中位数平滑去除单次跳变，变化超过2 Lux且超过5%时发布，
+    否则每5秒发布一次心跳；光照度骤降（下降超过20 Lux且超过50%）时请求立即分析
+
+    Args:
+        light_sensor_addr (int): 光照传感器地址
+
+    Returns:
+        list: 设备配置列表
+    """
+    return [DeviceConfig("lux_sensor", light_sensor_addr,
+                         [RegisterField("lux", 0x0007, "uint32", unit="Lux", minimum=0, maximum=100000,
+                                        smoothing="median", window=3, deadband=2, deadband_percent=5,
+                                        trigger_delta=20, trigger_percent=50, trigger_direction="drop")],
+                         poll_interval=0.25, heartbeat=5.0)]
+
+
+class PollScheduler:
+    """设备轮询调度类"""
+
+    def __init__(self, devices: List[DeviceConfig], min_spacing: float = 0.1):
+        """
+        初始化轮询调度
+
+        各设备的首次轮询在其轮询周期内均匀错开，之后按各自周期轮询；
+        多个设备同时到期时依次轮询，两次轮询之间至少间隔min_spacing秒
+
+        Args:
+            devices (list): 设备配置列表
+            min_spacing (float): 两次设备轮询之间的最小间隔（秒）
+        """
+        self.min_spacing = min_spacing
+        self.queue: List[Tuple[float, int, DeviceConfig]] = []
+        self.last_poll = 0.0
+        now = time.monotonic()
+        for index, device in enumerate(devices):
+            phase = device.poll_interval * index / len(devices)
+            heapq.heappush(self.queue, (now + phase, index, device))
+
+    def next_due(self) -> Tuple[float, DeviceConfig]:
+        """
+        下一个要轮询的设备
+
+        Returns:
+            tuple: (轮询时刻（time.monotonic）, 设备配置)
+        """
+        due, _, device = self.queue[0]
+        return max(due, self.last_poll + self.min_spacing), device
+
+    def polled(self, device: DeviceConfig, at: Optional[float] = None) -> None:
+        """
+        记录设备已轮询，安排下一次轮询
+
+        Args:
+            device (DeviceConfig): 刚轮询的设备（必须是next_due返回的设备）
+            at (float): 轮询时刻，为None时为当前时间
+        """
+        at = time.monotonic() if at is None else at
+        if self.queue[0][2] is not device:
+            raise ValueError(f"设备 {device.name} 不是下一个要轮询的设备")
+        due, index, _ = heapq.heappop(self.queue)
+        self.last_poll = at
+        # 按计划时刻推进，避免误差累积；落后超过一个周期时从当前时刻重新计算
+        next_due = due + device.poll_interval
+        if next_due < at:
+            next_due = at + device.poll_interval
+        heapq.heappush(self.queue, (next_due, index, device))
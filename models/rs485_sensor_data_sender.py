@@ -3,6 +3,16 @@
 RS485传感器数据发送器模块
 
 该模块实现了RS485传感器数据的读取和发送功能
+
+按设备登记表（见rs485_devices.py）轮询总线上的所有传感器，
+每个设备的读数经平滑后按死区和心跳发送sensor_data数据包（见sensor_filter.py），值不变时不再每次轮询都发送；
+光照度传感器的数据包格式保持不变（lux、unit、timestamp），另外附带自上次发送以来各字段的min/max/mean聚合（stats）
+
+配置了触发条件的字段（例如光照度骤降、门磁变化）通过事件总线请求视频流传输器立即分析当前帧（见event_bus.py）
+
+灯光由LightArbiter统一决定：光照度读数和VLM危险判断都作为仲裁的输入，不再直接设置灯光
+
+使用AsyncRS485Controller时不创建发送线程，由控制器的事件循环为每个设备运行一个轮询协程
 """
 
 import json
@@ -10,43 +20,65 @@ import logging
 import socket
 import threading
 import time
-from typing import Optional
+from typing import List, Optional, Union
+
+from services.metrics import metrics
 
+from .event_bus import ANALYSIS_REQUEST, EventBus, event_bus
+from .rs485_async import AsyncRS485Controller
+from .light_arbiter import LightArbiter
 from .rs485_controller import RS485Controller
+from .rs485_devices import DeviceConfig, PollScheduler, default_devices
+from .sensor_filter import DevicePublisher
 
-# 设置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger("RS485SensorDataSender")
 
 
 class RS485SensorDataSender:
     """RS485传感器数据发送器类"""
     
-    def __init__(self, sensor_reader: RS485Controller, host: str = 'localhost', port: int = 5000):
+    def __init__(self, sensor_reader: Union[RS485Controller, AsyncRS485Controller], host: str = 'localhost', port: int = 5000,
+                 devices: Optional[List[DeviceConfig]] = None, min_poll_spacing: float = 0.1,
+                 light_arbiter: Optional[LightArbiter] = None, events: Optional[EventBus] = None):
         """
         初始化RS485传感器数据发送器
         
         Args:
-            sensor_reader (RS485Controller): RS485控制器实例
+            sensor_reader (RS485Controller): RS485控制器实例（同步或异步）
             host (str): 目标主机地址
             port (int): UDP端口
+            devices (list): 要轮询的设备，为None时只轮询光照度传感器
+            min_poll_spacing (float): 两次设备轮询之间的最小间隔（秒）
+            light_arbiter (LightArbiter): 灯光仲裁，为None时使用默认参数创建
+            events (EventBus): 发布分析请求的事件总线，为None时使用进程内共享的事件总线
         """
         self.sensor_reader = sensor_reader
+        self.devices = devices or default_devices(sensor_reader.light_sensor_addr)
+        self.min_poll_spacing = min_poll_spacing
+        self.light_arbiter = light_arbiter or LightArbiter(sensor_reader)
+        # 各设备的平滑和发布决策
+        self.publishers = {device.name: DevicePublisher.for_device(device) for device in self.devices}
+        self.events = events or event_bus
         self.host = host
         self.port = port
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.running = False
         self.thread: Optional[threading.Thread] = None
+        # 每隔该时间（秒）报告一次总线每分钟事务数
+        self.stats_interval = 60
+        self.last_stats = time.monotonic()
+        self.last_transactions = 0
         
-        logger.info(f"初始化RS485传感器数据发送器，目标地址: {host}:{port}")
+        logger.info(f"初始化RS485传感器数据发送器，目标地址: {host}:{port}，设备: "
+                    f"{', '.join(device.name for device in self.devices)}")
     
     def start(self) -> None:
         """启动数据发送器"""
         if not self.running:
             self.running = True
+            if isinstance(self.sensor_reader, AsyncRS485Controller):
+                self._start_async()
+                return
             self.thread = threading.Thread(target=self._send_data_loop, daemon=True)
             self.thread.start()
             logger.info("RS485传感器数据发送器已启动")
@@ -55,7 +87,9 @@ class RS485SensorDataSender:
         """停止数据发送器"""
         if self.running:
             self.running = False
-            if self.thread:
+            if isinstance(self.sensor_reader, AsyncRS485Controller):
+                self.sensor_reader.disconnect()
+            elif self.thread:
                 self.thread.join(timeout=2)
             logger.info("RS485传感器数据发送器已停止")
     
@@ -63,21 +97,115 @@ class RS485SensorDataSender:
         """
         处理vLLM危险判断结果并控制灯光
         
+        判断结果交给灯光仲裁（危险时黄灯，安全时绿灯），灯光命令提交到总线队列后立即返回，不阻塞分析线程
+        
         Args:
             is_dangerous (bool): 是否危险
         """
         try:
-            if is_dangerous:
-                # 当vLLM判断为危险时，将灯光设置为黄色
-                self.sensor_reader.set_light("yellow")
-                logger.info("vLLM判断为危险，灯光已设置为黄色")
-            else:
-                # 当vLLM判断为安全时，将灯光设置为绿色
-                self.sensor_reader.set_light("green")
-                logger.info("vLLM判断为安全，灯光已设置为绿色")
+            self.light_arbiter.update_verdict(is_dangerous)
         except Exception as e:
             logger.error(f"设置灯光时出错: {e}")
     
+    def _start_async(self) -> None:
+        """异步控制器：连接后为每个设备启动轮询协程"""
+        if not self.sensor_reader.connect():
+            logger.error("无法连接到RS485设备")
+            self.running = False
+            return
+        self.last_stats = time.monotonic()
+        self.last_transactions = self.sensor_reader.transactions
+        self.sensor_reader.start_polling(self.devices, self._on_poll)
+        logger.info("RS485传感器数据发送器已启动（异步轮询）")
+    
+    def _on_poll(self, device: DeviceConfig, values: Optional[dict]) -> None:
+        """
+        处理一次设备轮询的结果
+        
+        Args:
+            device (DeviceConfig): 设备配置
+            values (dict): 字段名称 -> 数值，读取失败时为None
+        """
+        if values is not None:
+            self._handle_values(device, values)
+        else:
+            logger.warning(f"无法读取设备 {device.name} 的数据")
+        self._report_stats()
+    
+    def _report_stats(self) -> None:
+        """报告最近一段时间的总线每分钟事务数"""
+        now = time.monotonic()
+        if now - self.last_stats >= self.stats_interval:
+            transactions = self.sensor_reader.transactions
+            per_minute = (transactions - self.last_transactions) * 60 / (now - self.last_stats)
+            metrics.set_gauge('rs485.transactions_per_minute', round(per_minute, 1))
+            published = sum(publisher.published for publisher in self.publishers.values())
+            suppressed = sum(publisher.suppressed for publisher in self.publishers.values())
+            logger.info(f"RS485总线: {per_minute:.1f} 次事务/分钟，累计 {self.sensor_reader.bus_stats()}，"
+                        f"数据包已发送 {published}，未变化未发送 {suppressed}")
+            self.last_stats, self.last_transactions = now, transactions
+    
+    def _handle_values(self, device: DeviceConfig, values: dict) -> None:
+        """
+        处理设备读数：平滑后的光照度控制灯光，超出死区或心跳到期时发送sensor_data数据包
+        
+        Args:
+            device (DeviceConfig): 设备配置
+            values (dict): 字段名称 -> 原始数值
+        """
+        publisher = self.publishers[device.name]
+        result = publisher.add(values)
+        if "lux" in values:
+            # 平滑后的光照度交给灯光仲裁（太暗时红灯），每个采样都评估
+            self.light_arbiter.update_lux(publisher.smoothed().get("lux"))
+        else:
+            self.light_arbiter.tick()
+        self._check_triggers(device, publisher, values)
+        if result is None:
+            metrics.increment('sensor.suppressed')
+            return
+        metrics.increment('sensor.published')
+        
+        # 创建数据包
+        data = {
+            "device": device.name,
+            "address": device.address,
+            "timestamp": time.time()
+        }
+        data.update(result["values"])
+        lux = data.get("lux")
+        if lux is not None:
+            data["unit"] = device.units.get("lux") or "Lux"
+        data["units"] = device.units
+        data["stats"] = result["stats"]
+        data_packet = {
+            "type": "sensor_data",
+            "data": data
+        }
+        
+        # 发送数据包
+        packet_json = json.dumps(data_packet)
+        self.socket.sendto(packet_json.encode('utf-8'), (self.host, self.port))
+        logger.debug(f"发送设备 {device.name} 数据: {result['values']}")
+    
+    def _check_triggers(self, device: DeviceConfig, publisher: DevicePublisher, values: dict) -> None:
+        """
+        检查本次采样是否需要立即分析（平滑值的突变），需要时发布分析请求
+        
+        Args:
+            device (DeviceConfig): 设备配置
+            publisher (DevicePublisher): 设备的发布决策（已加入本次采样）
+            values (dict): 字段名称 -> 原始数值
+        """
+        for field in device.fields:
+            if values.get(field.name) is None:
+                continue
+            field_filter = publisher.filters[field.name]
+            if field.triggered(field_filter.previous, field_filter.value):
+                reason = f"{field.name} {field_filter.previous} -> {field_filter.value}"
+                logger.info(f"设备 {device.name} 触发立即分析: {reason}")
+                self.events.publish(ANALYSIS_REQUEST, source=device.name, reason=reason)
+    
     def _send_data_loop(self) -> None:
         """数据发送循环"""
         # 连接RS485设备
@@ -85,36 +213,22 @@ class RS485SensorDataSender:
             logger.error("无法连接到RS485设备")
             self.running = False
             return
-            
+        
+        scheduler = PollScheduler(self.devices, self.min_poll_spacing)
+        self.last_stats = time.monotonic()
+        self.last_transactions = self.sensor_reader.transactions
         while self.running:
             try:
-                # 读取光照度数据
-                lux = self.sensor_reader.read_lux()
+                # 等待下一个到期的设备（睡眠分段进行，以便及时停止）
+                due, device = scheduler.next_due()
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(min(wait, 0.5))
+                    continue
                 
-                if lux is not None:
-                    # 控制灯光颜色：当光照度小于50时设为红色，否则设为绿色
-                    if lux < 50:
-                        self.sensor_reader.set_light("red")
-                    
-                    # 创建数据包
-                    data_packet = {
-                        "type": "sensor_data",
-                        "data": {
-                            "lux": lux,
-                            "unit": "Lux",
-                            "timestamp": time.time()
-                        }
-                    }
-                    
-                    # 发送数据包
-                    packet_json = json.dumps(data_packet)
-                    self.socket.sendto(packet_json.encode('utf-8'), (self.host, self.port))
-                    logger.debug(f"发送光照度数据: {lux} Lux")
-                else:
-                    logger.warning("无法读取光照度数据")
-                
-                # 每秒发送一次数据
-                time.sleep(1)
+                values = self.sensor_reader.read_device(device)
+                scheduler.polled(device)
+                self._on_poll(device, values)
             except Exception as e:
                 logger.error(f"发送传感器数据时出错: {e}")
                 time.sleep(1)
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+RS485 Modbus RTU模拟器模块
+
+没有/dev/ttyTHS1硬件时，用该模块在本机模拟RS485总线上的设备：
+- 在一对互相连接的伪终端上运行pymodbus RTU从站（pty模式），或在TCP端口上使用RTU帧格式（tcp模式）
+- 模拟灯光控制器（0x01，寄存器0-2为绿/黄/红）和光照传感器（0x0B，寄存器7-8为32位光照度）的寄存器表，
+  也可以按设备登记表（见rs485_devices.py）添加其他设备
+- 可配置响应延迟，并按波特率模拟帧在总线上的传输时间
+- 可注入错误：按概率返回设备忙异常，或不响应（主站超时）；可模拟不支持写多个寄存器的灯光控制器
+- 记录灯光状态的每次变化及时间，用于测量报警到亮灯的延迟
+
+RS485Controller、AsyncRS485Controller、RS485SensorDataSender和rs485_controller测试工具
+使用模拟器给出的端口即可（pty模式为伪终端路径，tcp模式为"tcp://主机:端口"）
+
+用法:
+  python -m models.rs485_simulator                                  # pty模式，打印端口路径
+  python -m models.rs485_simulator --transport tcp --tcp-port 5020
+  python -m models.rs485_simulator --latency 0.01 --error-rate 0.02 --timeout-rate 0.01 --lux 30
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import select
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from pymodbus import FramerType
+from pymodbus.constants import ExcCodes
+from pymodbus.datastore import ModbusDeviceContext, ModbusSequentialDataBlock, ModbusServerContext
+from pymodbus.exceptions import NoSuchIdException
+from pymodbus.server import ModbusSerialServer, ModbusTcpServer
+
+from .rs485_devices import DeviceConfig, load_devices
+
+logger = logging.getLogger("RS485Simulator")
+
+# 模拟设备的寄存器数量
+REGISTER_COUNT = 256
+
+# 功能码
+FC_READ_HOLDING = 3
+FC_READ_INPUT = 4
+FC_WRITE_REGISTER = 6
+FC_WRITE_REGISTERS = 16
+
+
+def _frame_bytes(func_code: int, count: int) -> int:
+    """一次事务在总线上传输的字节数（请求 + 响应）"""
+    if func_code in (FC_READ_HOLDING, FC_READ_INPUT):
+        return 8 + 5 + 2 * count
+    if func_code == FC_WRITE_REGISTERS:
+        return 9 + 2 * count + 8
+    return 8 + 8
+
+
+class SimulatedDevice(ModbusDeviceContext):
+    """模拟的Modbus从站设备"""
+
+    def __init__(self, simulator: "RS485Simulator", address: int, name: str):
+        """
+        初始化模拟设备
+
+        Args:
+            simulator (RS485Simulator): 所属模拟器（提供延迟和错误注入配置）
+            address (int): 设备地址
+            name (str): 设备名称
+        """
+        super().__init__(hr=ModbusSequentialDataBlock(0, [0] * REGISTER_COUNT),
+                         ir=ModbusSequentialDataBlock(0, [0] * REGISTER_COUNT))
+        self.simulator = simulator
+        self.address = address
+        self.name = name
+
+    async def _respond(self, func_code: int, count: int) -> Optional[ExcCodes]:
+        """模拟响应延迟和错误，返回要响应的异常码"""
+        await asyncio.sleep(self.simulator.transaction_time(func_code, count))
+        roll = random.random()
+        if roll < self.simulator.timeout_rate:
+            self.simulator.injected_timeouts += 1
+            # 服务端忽略"不存在"的设备，主站等待超时
+            raise NoSuchIdException(f"模拟设备 0x{self.address:02X} 不响应")
+        if roll < self.simulator.timeout_rate + self.simulator.error_rate:
+            self.simulator.injected_errors += 1
+            return ExcCodes.DEVICE_BUSY
+        return None
+
+    async def async_getValues(self, func_code: int, address: int, count: int = 1):
+        """读取寄存器"""
+        error = await self._respond(func_code, count)
+        if error is not None:
+            return error
+        self.simulator.requests += 1
+        return self.getValues(func_code, address, count)
+
+    async def async_setValues(self, func_code: int, address: int, values):
+        """写入寄存器"""
+        if func_code == FC_WRITE_REGISTERS and self.address == self.simulator.light_addr \
+                and not self.simulator.multi_write:
+            await asyncio.sleep(self.simulator.transaction_time(func_code, len(values)))
+            return ExcCodes.ILLEGAL_FUNCTION
+        error = await self._respond(func_code, len(values))
+        if error is not None:
+            return error
+        self.simulator.requests += 1
+        result = self.setValues(func_code, address, values)
+        if self.address == self.simulator.light_addr:
+            self.simulator._light_written()
+        return result
+
+
+class RS485Simulator:
+    """RS485总线模拟器类"""
+
+    def __init__(self, transport: str = "pty", baud: int = 9600, latency: float = 0.005,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0, lux: int = 120,
+                 multi_write: bool = True, light_addr: int = 0x01, sensor_addr: int = 0x0B,
+                 devices: Optional[List[DeviceConfig]] = None, tcp_host: str = "127.0.0.1", tcp_port: int = 5020):
+        """
+        初始化模拟器
+
+        Args:
+            transport (str): "pty"（伪终端）或 "tcp"（TCP上的RTU帧）
+            baud (int): 模拟的波特率（用于计算帧传输时间，0表示不模拟）
+            latency (float): 设备处理每个请求的延迟（秒）
+            error_rate (float): 返回设备忙异常的概率
+            timeout_rate (float): 不响应的概率
+            lux (int): 光照度初始值
+            multi_write (bool): 灯光控制器是否支持写多个寄存器（功能码0x10）
+            light_addr (int): 灯光控制器地址
+            sensor_addr (int): 光照传感器地址
+            devices (list): 额外模拟的设备
+            tcp_host (str): tcp模式的监听地址
+            tcp_port (int): tcp模式的监听端口
+        """
+        if transport not in ("pty", "tcp"):
+            raise ValueError(f"不支持的传输方式: {transport}")
+        self.transport = transport
+        self.baud = baud
+        self.latency = latency
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.multi_write = multi_write
+        self.light_addr = light_addr
+        self.sensor_addr = sensor_addr
+        self.tcp_host = tcp_host
+        self.tcp_port = tcp_port
+
+        self.devices = {
+            light_addr: SimulatedDevice(self, light_addr, "light"),
+            sensor_addr: SimulatedDevice(self, sensor_addr, "lux_sensor"),
+        }
+        for device in devices or []:
+            if device.address not in self.devices:
+                self.devices[device.address] = SimulatedDevice(self, device.address, device.name)
+        self.set_lux(lux)
+
+        # 统计和灯光状态变化记录
+        self.requests = 0
+        self.injected_errors = 0
+        self.injected_timeouts = 0
+        self.light_events: List[Tuple[float, Tuple[int, int, int]]] = []
+        self.light_lock = threading.Lock()
+
+        self.port: Optional[str] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.server = None
+        self.thread: Optional[threading.Thread] = None
+        self.relay_thread: Optional[threading.Thread] = None
+        self.ptys: List[int] = []
+        self.running = False
+
+    def transaction_time(self, func_code: int, count: int) -> float:
+        """
+        一次事务的模拟耗时：设备处理延迟 + 帧在总线上的传输时间
+
+        Args:
+            func_code (int): 功能码
+            count (int): 寄存器数量
+
+        Returns:
+            float: 耗时（秒）
+        """
+        wire = _frame_bytes(func_code, count) * 11 / self.baud if self.baud else 0.0
+        return self.latency + wire
+
+    def set_lux(self, lux: int) -> None:
+        """
+        设置光照传感器的读数
+
+        Args:
+            lux (int): 光照度
+        """
+        lux = max(0, int(lux))
+        self.devices[self.sensor_addr].setValues(FC_READ_HOLDING, 7, [(lux >> 16) & 0xFFFF, lux & 0xFFFF])
+
+    def set_register(self, address: int, register: int, values: List[int], function: str = "holding") -> None:
+        """
+        设置模拟设备的寄存器值
+
+        Args:
+            address (int): 设备地址
+            register (int): 起始寄存器
+            values (list): 寄存器值
+            function (str): 寄存器类型（holding或input）
+        """
+        func_code = FC_READ_INPUT if function == "input" else FC_READ_HOLDING
+        self.devices[address].setValues(func_code, register, list(values))
+
+    @property
+    def light_state(self) -> Tuple[int, int, int]:
+        """灯光控制器当前的 (绿, 黄, 红) 寄存器值"""
+        return tuple(self.devices[self.light_addr].getValues(FC_READ_HOLDING, 0, 3))
+
+    def _light_written(self) -> None:
+        """记录灯光状态变化"""
+        state = self.light_state
+        with self.light_lock:
+            if not self.light_events or self.light_events[-1][1] != state:
+                self.light_events.append((time.monotonic(), state))
+
+    def wait_for_light(self, state: Tuple[int, int, int], since: float, timeout: float = 5.0) -> Optional[float]:
+        """
+        等待灯光变为指定状态
+
+        Args:
+            state (tuple): 目标 (绿, 黄, 红)
+            since (float): 只考虑该时刻（time.monotonic）之后的变化
+            timeout (float): 最长等待时间（秒）
+
+        Returns:
+            float: 变为目标状态的时刻，超时时为None
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.light_lock:
+                for at, event_state in self.light_events:
+                    if at >= since and event_state == tuple(state):
+                        return at
+            time.sleep(0.001)
+        return None
+
+    # ---- 启动和停止 ----
+
+    def _open_ptys(self) -> Tuple[str, str]:
+        """创建两个伪终端并在它们之间转发数据，返回 (从站端路径, 主站端路径)"""
+        import pty
+        import tty
+
+        master_a, slave_a = pty.openpty()
+        master_b, slave_b = pty.openpty()
+        for fd in (slave_a, slave_b):
+            tty.setraw(fd)
+        self.ptys = [master_a, slave_a, master_b, slave_b]
+
+        def relay():
+            peers = {master_a: master_b, master_b: master_a}
+            while self.running:
+                try:
+                    readable, _, _ = select.select(list(peers), [], [], 0.2)
+                    for fd in readable:
+                        os.write(peers[fd], os.read(fd, 4096))
+                except OSError:
+                    return
+
+        self.relay_thread = threading.Thread(target=relay, name="RS485SimulatorRelay", daemon=True)
+        self.relay_thread.start()
+        return os.ttyname(slave_a), os.ttyname(slave_b)
+
+    def start(self) -> str:
+        """
+        启动模拟器
+
+        Returns:
+            str: 主站使用的端口（伪终端路径或"tcp://主机:端口"）
+        """
+        self.running = True
+        context = ModbusServerContext(devices=self.devices, single=False)
+        if self.transport == "pty":
+            server_port, self.port = self._open_ptys()
+        else:
+            self.port = f"tcp://{self.tcp_host}:{self.tcp_port}"
+
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def serve():
+            # pymodbus服务端需要在事件循环中创建
+            if self.transport == "pty":
+                self.server = ModbusSerialServer(context, framer=FramerType.RTU, port=server_port,
+                                                 baudrate=self.baud or 9600, ignore_missing_devices=True)
+            else:
+                self.server = ModbusTcpServer(context, framer=FramerType.RTU,
+                                              address=(self.tcp_host, self.tcp_port), ignore_missing_devices=True)
+            self.loop.call_soon(started.set)
+            await self.server.serve_forever()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            try:
+                self.loop.run_until_complete(serve())
+            except Exception as e:
+                logger.error(f"模拟器运行出错: {e}")
+            finally:
+                started.set()
+
+        self.thread = threading.Thread(target=run, name="RS485Simulator", daemon=True)
+        self.thread.start()
+        started.wait(5)
+        # 等待服务端打开端口
+        time.sleep(0.2)
+        logger.info(f"RS485模拟器已启动: {self.port}（设备: "
+                    f"{', '.join(f'{d.name}@0x{a:02X}' for a, d in sorted(self.devices.items()))}）")
+        return self.port
+
+    def stop(self) -> None:
+        """停止模拟器"""
+        if not self.running:
+            return
+        self.running = False
+        if self.loop is not None and self.server is not None:
+            try:
+                asyncio.run_coroutine_threadsafe(self.server.shutdown(), self.loop).result(2)
+            except Exception as e:
+                logger.debug(f"停止模拟器服务端时出错: {e}")
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+        if self.relay_thread is not None:
+            self.relay_thread.join(timeout=1)
+        for fd in self.ptys:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.ptys = []
+        logger.info(f"RS485模拟器已停止，处理 {self.requests} 个请求，"
+                    f"注入 {self.injected_errors} 个异常、{self.injected_timeouts} 个超时")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    """命令行入口：启动模拟器直到用户中断"""
+    # 设置日志
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = argparse.ArgumentParser(description="RS485 Modbus RTU模拟器")
+    parser.add_argument("--transport", choices=["pty", "tcp"], default="pty", help="传输方式 (默认: pty)")
+    parser.add_argument("--tcp-port", type=int, default=5020, help="tcp模式的监听端口 (默认: 5020)")
+    parser.add_argument("--baud", type=int, default=9600, help="模拟的波特率，0表示不模拟传输时间 (默认: 9600)")
+    parser.add_argument("--latency", type=float, default=0.005, help="设备处理延迟（秒）(默认: 0.005)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回设备忙异常的概率")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="不响应的概率")
+    parser.add_argument("--lux", type=int, default=120, help="光照度读数 (默认: 120)")
+    parser.add_argument("--no-multi-write", action="store_true", help="灯光控制器不支持写多个寄存器")
+    parser.add_argument("--devices", type=str, default=None, help="额外模拟的设备登记表JSON文件")
+    args = parser.parse_args()
+
+    simulator = RS485Simulator(
+        transport=args.transport,
+        baud=args.baud,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        lux=args.lux,
+        multi_write=not args.no_multi_write,
+        devices=load_devices(args.devices) if args.devices else None,
+        tcp_port=args.tcp_port
+    )
+    port = simulator.start()
+    print(f"模拟器端口: {port}")
+    print(f"例如: python -m models.rs485_controller --port {port}")
+    try:
+        last_state = None
+        while True:
+            time.sleep(1)
+            if simulator.light_state != last_state:
+                last_state = simulator.light_state
+                logger.info(f"灯光状态 (绿, 黄, 红): {last_state}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == "__main__":
+    main()
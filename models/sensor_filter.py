@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+传感器数据平滑和死区发布模块
+
+传感器按设备的轮询周期采样（可以高于发布频率，即过采样），每个采样先在本机平滑，
+再按死区决定是否发布，替代原来每秒无条件发送一次：
+- 平滑：ewma（指数加权移动平均，系数alpha）、median（最近window个采样的中位数）或none
+- 死区：平滑后的值与上次发布的值相差超过 max(deadband, |上次发布的值| × deadband_percent / 100) 时立即发布
+- 心跳：距上次发布超过heartbeat秒时即使没有变化也发布一次，接收端据此判断传感器仍在线
+- 聚合：每次发布附带自上次发布以来原始采样的最小值、最大值、平均值和采样数
+
+值变化时按采样频率发布，稳定时只按心跳发布，发布频率随数据变化自动调整
+"""
+
+import logging
+import statistics
+import time
+from collections import deque
+from typing import Dict, Optional
+
+logger = logging.getLogger("SensorFilter")
+
+# 平滑方法
+SMOOTHING_METHODS = ("ewma", "median", "none")
+
+
+class FieldFilter:
+    """单个字段的平滑、死区和聚合"""
+
+    def __init__(self, smoothing: str = "none", alpha: float = 0.5, window: int = 3,
+                 deadband: float = 0.0, deadband_percent: float = 0.0):
+        """
+        初始化字段过滤器
+
+        Args:
+            smoothing (str): 平滑方法（ewma、median、none）
+            alpha (float): ewma系数（0~1，越大越跟随最新采样）
+            window (int): median窗口大小（采样数）
+            deadband (float): 绝对死区
+            deadband_percent (float): 相对死区（上次发布值的百分比）
+
+        Raises:
+            ValueError: 参数无效
+        """
+        if smoothing not in SMOOTHING_METHODS:
+            raise ValueError(f"平滑方法无效: {smoothing}")
+        if not 0 < alpha <= 1:
+            raise ValueError(f"ewma系数无效: {alpha}")
+        if window < 1:
+            raise ValueError(f"median窗口无效: {window}")
+        self.smoothing = smoothing
+        self.alpha = alpha
+        self.deadband = max(0.0, deadband)
+        self.deadband_percent = max(0.0, deadband_percent)
+        self.samples: deque = deque(maxlen=window)
+        self.value: Optional[float] = None
+        self.previous: Optional[float] = None
+        self.published: Optional[float] = None
+        self._reset_aggregates()
+
+    def _reset_aggregates(self) -> None:
+        """清空自上次发布以来的聚合"""
+        self.count = 0
+        self.total = 0.0
+        self.minimum: Optional[float] = None
+        self.maximum: Optional[float] = None
+
+    def add(self, raw) -> None:
+        """
+        加入一个原始采样
+
+        Args:
+            raw: 原始采样，读取失败或超出范围时为None（忽略）
+        """
+        if raw is None:
+            return
+        self.previous = self.value
+        self.count += 1
+        self.total += raw
+        self.minimum = raw if self.minimum is None else min(self.minimum, raw)
+        self.maximum = raw if self.maximum is None else max(self.maximum, raw)
+        if self.smoothing == "ewma":
+            self.value = raw if self.value is None else round(self.alpha * raw + (1 - self.alpha) * self.value, 6)
+        elif self.smoothing == "median":
+            self.samples.append(raw)
+            self.value = statistics.median(self.samples)
+        else:
+            self.value = raw
+
+    def exceeds_deadband(self) -> bool:
+        """平滑后的值是否超出上次发布值的死区（从未发布过时为True）"""
+        if self.value is None:
+            return False
+        if self.published is None:
+            return True
+        threshold = max(self.deadband, abs(self.published) * self.deadband_percent / 100)
+        return abs(self.value - self.published) > threshold
+
+    def publish(self) -> Optional[dict]:
+        """
+        记录本次发布并返回聚合
+
+        Returns:
+            dict: {"min", "max", "mean", "samples"}，自上次发布以来没有采样时为None
+        """
+        self.published = self.value
+        if not self.count:
+            return None
+        aggregates = {
+            "min": self.minimum,
+            "max": self.maximum,
+            "mean": round(self.total / self.count, 6),
+            "samples": self.count,
+        }
+        self._reset_aggregates()
+        return aggregates
+
+
+class DevicePublisher:
+    """单个设备的发布决策"""
+
+    def __init__(self, filters: Dict[str, FieldFilter], heartbeat: float = 10.0):
+        """
+        初始化设备发布决策
+
+        Args:
+            filters (dict): 字段名称 -> 字段过滤器
+            heartbeat (float): 最长发布间隔（秒），0表示每个采样都发布
+        """
+        self.filters = filters
+        self.heartbeat = heartbeat
+        self.last_publish: Optional[float] = None
+        self.published = 0
+        self.suppressed = 0
+
+    @classmethod
+    def for_device(cls, device) -> "DevicePublisher":
+        """
+        按设备配置创建发布决策
+
+        Args:
+            device (DeviceConfig): 设备配置（各字段的平滑和死区见RegisterField）
+
+        Returns:
+            DevicePublisher: 发布决策
+        """
+        filters = {field.name: FieldFilter(field.smoothing, field.alpha, field.window,
+                                           field.deadband, field.deadband_percent)
+                   for field in device.fields}
+        return cls(filters, device.heartbeat)
+
+    def add(self, values: dict, now: Optional[float] = None) -> Optional[dict]:
+        """
+        加入一次设备读数，决定是否发布
+
+        Args:
+            values (dict): 字段名称 -> 原始数值
+            now (float): 采样时刻（time.monotonic），为None时为当前时间
+
+        Returns:
+            dict: 需要发布时返回 {"values": 平滑后的数值, "stats": 各字段的聚合}，否则为None
+        """
+        now = time.monotonic() if now is None else now
+        for name, raw in values.items():
+            field_filter = self.filters.get(name)
+            if field_filter is not None:
+                field_filter.add(raw)
+
+        due = (self.last_publish is None or not self.heartbeat
+               or now - self.last_publish >= self.heartbeat)
+        if not due and not any(f.exceeds_deadband() for f in self.filters.values()):
+            self.suppressed += 1
+            return None
+
+        self.last_publish = now
+        self.published += 1
+        result: Dict[str, dict] = {"values": {}, "stats": {}}
+        for name, field_filter in self.filters.items():
+            result["values"][name] = field_filter.value
+            aggregates = field_filter.publish()
+            if aggregates is not None:
+                result["stats"][name] = aggregates
+        return result
+
+    def smoothed(self) -> Dict[str, Optional[float]]:
+        """
+        各字段当前的平滑值（不论是否发布）
+
+        Returns:
+            dict: 字段名称 -> 平滑后的数值
+        """
+        return {name: field_filter.value for name, field_filter in self.filters.items()}
+
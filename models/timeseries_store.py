@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+传感器时间序列存储模块
+
+RS485光照度传感器每秒产生一个读数，逐条写入SQLite代价太高，
+该模块把读数保存为按天分区的追加写二进制文件：
+- 每个读数8字节：相对分区开始时间的毫秒数(uint32) + 数值(float32)
+- 文件路径为 <根目录>/<序列名>/<YYYY-MM-DD>.bin，按本地时间分天（与分析记录的时间一致）
+- 写入先进入内存缓冲，每隔一段时间或积累一定数量后一次追加到文件
+- 读取时内存映射分区文件，按时间二分查找，不需要把整个文件读入内存
+- 支持按时间范围查询，以及为图表按时间分桶降采样（平均值、最小值、最大值）
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("TimeSeriesStore")
+
+# 时间序列根目录（可通过环境变量VLM_TIMESERIES_PATH指定）
+TIMESERIES_ROOT = os.environ.get('VLM_TIMESERIES_PATH') or os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'data', 'timeseries')
+
+# 每个读数的存储格式：分区内毫秒偏移 + 数值
+SAMPLE_DTYPE = np.dtype([('t', '<u4'), ('v', '<f4')])
+
+PARTITION_SUFFIX = '.bin'
+
+
+def partition_start(day: date) -> float:
+    """分区（本地时间的一天）开始时刻的Unix时间戳"""
+    return datetime.combine(day, datetime.min.time()).timestamp()
+
+
+class TimeSeriesStore:
+    """传感器时间序列存储类"""
+
+    def __init__(self, name: str = 'lux', root: Optional[str] = None,
+                 flush_samples: int = 60, flush_interval: float = 60.0):
+        """
+        初始化时间序列存储
+
+        Args:
+            name (str): 序列名称，例如 "lux"
+            root (str): 根目录，为None时使用TIMESERIES_ROOT
+            flush_samples (int): 缓冲多少个读数后写入文件
+            flush_interval (float): 最长缓冲时间（秒）
+        """
+        self.name = name
+        self.directory = os.path.join(root or TIMESERIES_ROOT, name)
+        self.flush_samples = flush_samples
+        self.flush_interval = flush_interval
+        self.buffer: List[Tuple[float, float]] = []  # (Unix时间戳, 数值)
+        self.last_timestamp: Optional[float] = None
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        logger.info(f"初始化时间序列存储: {self.directory}")
+
+    def _partition_path(self, day: date) -> str:
+        """分区文件路径"""
+        return os.path.join(self.directory, day.isoformat() + PARTITION_SUFFIX)
+
+    def partitions(self) -> List[date]:
+        """
+        列出已有的分区
+
+        Returns:
+            list: 按时间排序的分区日期
+        """
+        days = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(PARTITION_SUFFIX):
+                try:
+                    days.append(date.fromisoformat(filename[:-len(PARTITION_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(days)
+
+    def _load(self, day: date) -> np.ndarray:
+        """内存映射分区文件（忽略异常退出时写了一半的读数）"""
+        path = self._partition_path(day)
+        try:
+            count = os.path.getsize(path) // SAMPLE_DTYPE.itemsize
+        except OSError:
+            count = 0
+        if count == 0:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        return np.memmap(path, dtype=SAMPLE_DTYPE, mode='r', shape=(count,))
+
+    def _newest_timestamp(self) -> Optional[float]:
+        """已写入文件的最新读数时间（重启后用于保证分区内时间递增）"""
+        for day in reversed(self.partitions()):
+            samples = self._load(day)
+            if len(samples):
+                return partition_start(day) + int(samples['t'][-1]) / 1000.0
+        return None
+
+    def append(self, timestamp: float, value: float) -> bool:
+        """
+        追加一个读数
+
+        Args:
+            timestamp (float): 读数时间（Unix时间戳）
+            value (float): 读数
+
+        Returns:
+            bool: 是否已接受（早于已有读数的乱序读数会被丢弃）
+        """
+        with self.lock:
+            if self.last_timestamp is None:
+                self.last_timestamp = self._newest_timestamp()
+            if self.last_timestamp is not None and timestamp < self.last_timestamp:
+                logger.debug(f"丢弃乱序读数: {timestamp} < {self.last_timestamp}")
+                return False
+            self.last_timestamp = timestamp
+            self.buffer.append((timestamp, float(value)))
+            should_flush = (len(self.buffer) >= self.flush_samples
+                            or time.monotonic() - self.last_flush >= self.flush_interval)
+        if should_flush:
+            self.flush()
+        return True
+
+    def flush(self) -> None:
+        """把缓冲的读数追加到分区文件"""
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.buffer:
+                return
+            by_day: Dict[date, List[Tuple[float, float]]] = {}
+            for timestamp, value in self.buffer:
+                by_day.setdefault(datetime.fromtimestamp(timestamp).date(), []).append((timestamp, value))
+            self.buffer = []
+
+            for day, samples in by_day.items():
+                base = partition_start(day)
+                records = np.empty(len(samples), dtype=SAMPLE_DTYPE)
+                records['t'] = [round((timestamp - base) * 1000) for timestamp, _ in samples]
+                records['v'] = [value for _, value in samples]
+                try:
+                    with open(self._partition_path(day), 'ab') as f:
+                        f.write(records.tobytes())
+                except Exception as e:
+                    logger.error(f"写入时间序列分区 {day} 时出错: {e}")
+
+    def query(self, start: datetime, end: datetime) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        查询时间范围内的读数（包含尚未写入文件的缓冲读数）
+
+        Args:
+            start (datetime): 开始时间（包含）
+            end (datetime): 结束时间（不包含）
+
+        Returns:
+            tuple: (Unix时间戳数组(float64), 数值数组(float32))，按时间排序
+        """
+        start_ts, end_ts = start.timestamp(), end.timestamp()
+        timestamps = []
+        values = []
+        # 持有锁读取文件和缓冲，避免读取期间缓冲被写入文件而漏掉读数
+        with self.lock:
+            day = start.date()
+            while day <= end.date():
+                samples = self._load(day)
+                if len(samples):
+                    base = partition_start(day)
+                    offsets = samples['t']
+                    lo = np.searchsorted(offsets, max(0.0, (start_ts - base) * 1000), side='left')
+                    hi = np.searchsorted(offsets, max(0.0, (end_ts - base) * 1000), side='left')
+                    if hi > lo:
+                        timestamps.append(base + offsets[lo:hi].astype(np.float64) / 1000.0)
+                        values.append(np.array(samples['v'][lo:hi]))
+                day += timedelta(days=1)
+
+            pending = [(timestamp, value) for timestamp, value in self.buffer if start_ts <= timestamp < end_ts]
+        if pending:
+            timestamps.append(np.array([timestamp for timestamp, _ in pending], dtype=np.float64))
+            values.append(np.array([value for _, value in pending], dtype=np.float32))
+
+        if not timestamps:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float32)
+        return np.concatenate(timestamps), np.concatenate(values)
+
+    def aggregate(self, start: datetime, end: datetime, width: float) -> Dict[str, np.ndarray]:
+        """
+        按固定宽度的时间桶聚合读数（没有读数的桶不返回）
+
+        Args:
+            start (datetime): 开始时间（包含），也是第一个桶的开始
+            end (datetime): 结束时间（不包含）
+            width (float): 桶宽度（秒）
+
+        Returns:
+            dict: 各桶的 start（桶开始的Unix时间戳）、t（读数的平均时间）、count、total、min、max
+        """
+        timestamps, values = self.query(start, end)
+        if len(timestamps) == 0:
+            empty = np.empty(0)
+            return {'start': empty, 't': empty, 'count': empty, 'total': empty, 'min': empty, 'max': empty}
+
+        # 读数按时间排序，桶序号也是有序的，用reduceat按段聚合
+        index = ((timestamps - start.timestamp()) // width).astype(np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(index)) + 1))
+        counts = np.diff(np.append(starts, len(index)))
+        values = values.astype(np.float64)
+        return {
+            'start': start.timestamp() + index[starts] * width,
+            't': np.add.reduceat(timestamps, starts) / counts,
+            'count': counts,
+            'total': np.add.reduceat(values, starts),
+            'min': np.minimum.reduceat(values, starts),
+            'max': np.maximum.reduceat(values, starts),
+        }
+
+    def downsample(self, start: datetime, end: datetime, max_points: int = 500) -> dict:
+        """
+        为图表降采样：把时间范围平均分为max_points个桶，每桶返回平均值、最小值和最大值
+
+        Args:
+            start (datetime): 开始时间（包含）
+            end (datetime): 结束时间（不包含）
+            max_points (int): 最多返回的点数
+
+        Returns:
+            dict: {"t": [...], "mean": [...], "min": [...], "max": [...]}，t为Unix时间戳
+        """
+        width = max((end - start).total_seconds() / max(1, max_points), 0.001)
+        buckets = self.aggregate(start, end, width)
+        return {
+            't': [round(float(t), 3) for t in buckets['t']],
+            'mean': [round(float(v), 2) for v in buckets['total'] / np.maximum(buckets['count'], 1)],
+            'min': [round(float(v), 2) for v in buckets['min']],
+            'max': [round(float(v), 2) for v in buckets['max']],
+        }
+
+    def delete_before(self, day: date) -> int:
+        """
+        删除早于指定日期的分区
+
+        Args:
+            day (date): 保留该日期及之后的分区
+
+        Returns:
+            int: 删除的字节数
+        """
+        removed = 0
+        for partition in self.partitions():
+            if partition >= day:
+                break
+            path = self._partition_path(partition)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                removed += size
+            except OSError as e:
+                logger.error(f"删除时间序列分区 {partition} 时出错: {e}")
+        return removed
+
+    def size_before(self, day: date) -> int:
+        """早于指定日期的分区的总字节数"""
+        return sum(os.path.getsize(self._partition_path(partition))
+                   for partition in self.partitions() if partition < day)
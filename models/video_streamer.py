@@ -7,6 +7,10 @@
 2. 通过UDP协议将视频帧发送到指定地址和端口
 3. 定期将视频帧发送到LLaVA模型判断人的动作是否危险
 4. 通过同一UDP端口将视频帧和判断结果发送到接收端
+5. 传感器通过事件总线请求时立即分析当前帧（限速并合并重复请求）
+
+启动时只打开视频源：ollama和requests在第一次分析时导入，事件聚合和聊天上下文在分析线程中从数据库加载，
+不推迟第一帧的发送
 """
 
 import cv2
@@ -19,20 +23,21 @@ import os
 import re
 from datetime import datetime
 import logging
-import ollama
-import requests
-from typing import Optional, Any
+from typing import TYPE_CHECKING, Optional, Any
 
 # 导入数据库相关模块
-from .database import AnalysisRecord, get_db
+from .database import AnalysisRecord
+from .chat_context import AnalysisContextWindow
+from .incidents import IncidentTracker
+from .db_writer import db_writer
+from .event_bus import ANALYSIS_REQUEST, EventBus, event_bus
+
+from services.metrics import metrics
 
-from .rs485_sensor_data_sender import RS485SensorDataSender
+if TYPE_CHECKING:
+    # 只用于类型标注，RS485模块依赖pymodbus
+    from .rs485_sensor_data_sender import RS485SensorDataSender
 
-# 设置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger("VideoStreamer")
 
 
@@ -44,12 +49,15 @@ class VideoStreamer:
     2. 通过UDP发送视频帧
     3. 定期将视频帧发送到LLaVA模型判断人的动作是否危险
     4. 通过UDP发送判断结果
+    5. 响应传感器的立即分析请求
     """
     
     def __init__(self, port: int = 5000, host: str = 'localhost', description_interval: int = 5, 
                  model_name: str = "gemma3:4b", video_source: Any = 0, 
                  vllm_url: str = "http://localhost:11434/v1/completions", 
-                 rs485_sensor_data_sender: Optional[RS485SensorDataSender] = None):
+                 rs485_sensor_data_sender: Optional["RS485SensorDataSender"] = None,
+                 camera_id: str = "default", trigger_min_interval: float = 10.0,
+                 events: Optional[EventBus] = None):
         """
         初始化视频流传输器
         
@@ -61,6 +69,9 @@ class VideoStreamer:
             video_source (int or str): 视频源，0表示默认摄像头，其他数字表示摄像头索引，字符串表示视频文件路径
             vllm_url (str): vLLM API的URL，默认为"http://localhost:11434/v1/completions"
             rs485_sensor_data_sender (RS485SensorDataSender): RS485传感器数据发送器实例
+            camera_id (str): 摄像头标识，保存在分析记录中
+            trigger_min_interval (float): 两次传感器触发的分析之间的最小间隔（秒）
+            events (EventBus): 订阅分析请求的事件总线，为None时使用进程内共享的事件总线
         """
         # 网络配置参数
         self.port = 5000  # 固定发送到5000端口
@@ -74,6 +85,7 @@ class VideoStreamer:
         # 视频捕获相关属性
         self.cap = None
         self.video_source = video_source
+        self.camera_id = camera_id
         self.last_description_time = 0
         self.frame_delay = 0.033  # 默认30fps的延迟
         
@@ -90,9 +102,28 @@ class VideoStreamer:
         # RS485传感器数据发送器
         self.rs485_sensor_data_sender = rs485_sensor_data_sender
         
+        # 传感器触发的立即分析：尚未执行的请求合并为一个，两次触发的分析之间至少间隔trigger_min_interval秒，
+        # 间隔内的请求推迟到间隔结束时执行，期间已按计划分析过新帧的请求直接视为完成
+        self.trigger_min_interval = trigger_min_interval
+        self.pending_trigger: Optional[dict] = None
+        self.last_trigger_time = 0.0
+        self.trigger_lock = threading.Lock()
+        self.events = events or event_bus
+        self.events.subscribe(ANALYSIS_REQUEST, self.request_analysis)
+        
+        # 等待数据库写入线程返回记录ID的最长时间（秒）
+        self.record_id_timeout = 2.0
+        
+        # 事件聚合：同一摄像头连续、结论相同的分析结果合并为一个事件
+        # 聊天上下文窗口：加载一次，之后每个事件更新一次
+        # 两者都要读数据库，在第一次分析时加载（见_ensure_analysis_state）
+        self.incident_tracker: Optional[IncidentTracker] = None
+        self.context_window: Optional[AnalysisContextWindow] = None
+        self.state_lock = threading.Lock()
+        
         logger.info(f"初始化视频流传输器，目标地址: {host}:{self.port}")
         logger.info(f"使用模型: {model_name}, 分析间隔: {description_interval}秒")
-        logger.info(f"视频源: {video_source}")
+        logger.info(f"视频源: {video_source}, 摄像头标识: {camera_id}")
         logger.info(f"vLLM URL: {vllm_url}")
     
     def __del__(self):
@@ -100,13 +131,24 @@ class VideoStreamer:
         if hasattr(self, 'socket'):
             self.socket.close()
     
+    def _ensure_analysis_state(self) -> None:
+        """第一次分析时从数据库加载事件聚合和聊天上下文窗口"""
+        with self.state_lock:
+            if self.context_window is not None:
+                return
+            self.incident_tracker = IncidentTracker(camera_id=self.camera_id)
+            context_window = AnalysisContextWindow()
+            context_window.load_from_db()
+            self.context_window = context_window
+    
     def send_frame_via_udp(self, frame, frame_type="video"):
         """
         通过UDP发送视频帧或分析结果
         
         Args:
             frame: OpenCV图像帧或分析结果字典
-            frame_type (str): 帧类型，"video"表示视频帧，"description"表示分析结果，"vllm_response"表示vLLM响应
+            frame_type (str): 帧类型，"video"表示视频帧，"description"表示分析结果，"vllm_response"表示vLLM响应，
+                "incident"表示事件更新
         """
         try:
             if frame_type == "video":
@@ -118,8 +160,8 @@ class VideoStreamer:
                     "type": "video",
                     "data": encoded_data
                 }
-            else:  # description or vllm_response
-                # 处理分析结果数据或vLLM响应
+            else:  # description, vllm_response or incident
+                # 处理分析结果数据、vLLM响应或事件更新
                 packet_data = {
                     "type": frame_type,
                     "data": frame
@@ -150,14 +192,15 @@ class VideoStreamer:
             image: OpenCV图像
             
         Returns:
-            dict: 包含判断结果的字典，格式为 {"date": "时间", "description": "描述", "danger": true/false}
+            dict: 包含判断结果的字典，格式为 {"date": "时间", "description": "描述", "danger": true/false, "severity": 命中的危险类别数}
         """
         try:
             # 将图像编码为base64字符串
             base64_image = self.encode_image_to_base64(image)
             current_date = datetime.now()
             
-            # 使用ollama库调用模型，仅要求描述图片内容
+            # 使用ollama库调用模型，仅要求描述图片内容（第一次分析时导入）
+            import ollama
             prompt = "Please describe this image in detail. Focus on what people are doing, objects present, and the overall scene. Limit your description to 75 words."
             
             logger.info(f"向Ollama模型发送请求: {self.model_name}")
@@ -198,23 +241,20 @@ class VideoStreamer:
                 r'\b(accident|事故)\b'
             ]
             
-            # 检查描述中是否包含危险关键词
-            is_dangerous = False
-            for pattern in danger_patterns:
-                if re.search(pattern, description, re.IGNORECASE):
-                    is_dangerous = True
-                    break
+            # 检查描述中是否包含危险关键词，命中的类别数作为严重程度
+            severity = sum(1 for pattern in danger_patterns if re.search(pattern, description, re.IGNORECASE))
+            is_dangerous = severity > 0
             
-            # 构造返回的JSON
+            # 构造返回的JSON（记录ID在保存到数据库后填入）
             response_json = {
+                "id": None,
+                "camera_id": self.camera_id,
                 "date": current_date.strftime('%Y-%m-%d %H:%M:%S'),
                 "description": description,
-                "danger": is_dangerous
+                "danger": is_dangerous,
+                "severity": severity
             }
             
-            # 将分析结果保存到数据库
-            self.save_analysis_to_db(current_date, description, is_dangerous)
-            
             return response_json
 
         except Exception as e:
@@ -223,40 +263,33 @@ class VideoStreamer:
     
     def save_analysis_to_db(self, date, description, danger):
         """
-        将分析结果保存到数据库
+        将分析结果放入数据库写入队列，由写入线程批量提交
         
         Args:
             date: 分析时间
             description: 分析描述
             danger: 是否危险
-        """
-        try:
-            # 获取数据库会话
-            db_gen = get_db()
-            db = next(db_gen)
-            
-            # 创建新的分析记录
-            record = AnalysisRecord(
-                date=date,
-                description=description,
-                danger=danger
-            )
-            
-            # 添加到数据库
-            db.add(record)
-            db.commit()
-            db.refresh(record)
             
-            logger.info(f"分析结果已保存到数据库，ID: {record.id}")
-            
-            # 关闭数据库会话
-            try:
-                next(db_gen)
-            except StopIteration:
-                pass
-                
-        except Exception as e:
-            logger.error(f"保存分析结果到数据库时出错: {e}")
+        Returns:
+            Future: 提交完成后结果为新记录的ID
+        """
+        # 创建新的分析记录
+        record = AnalysisRecord(
+            date=date,
+            description=description,
+            danger=danger,
+            camera_id=self.camera_id
+        )
+        future = db_writer.submit(record)
+        
+        def on_saved(done):
+            if done.exception() is not None:
+                logger.error(f"保存分析结果到数据库时出错: {done.exception()}")
+                return
+            logger.info(f"分析结果已保存到数据库，ID: {done.result()}")
+        
+        future.add_done_callback(on_saved)
+        return future
     
     def chat_with_vllm(self, prompt):
         """
@@ -269,36 +302,9 @@ class VideoStreamer:
             str: vLLM的响应
         """
         try:
-            # 从数据库获取最近的20条分析记录作为上下文
-            context = ""
-            try:
-                # 获取数据库会话
-                db_gen = get_db()
-                db = next(db_gen)
-                
-                # 查询最近的20条记录
-                records = db.query(AnalysisRecord).order_by(AnalysisRecord.date.desc()).limit(20).all()
-                
-                # 构造上下文字符串
-                for record in reversed(records):  # 按时间顺序排列
-                    context += f"""
-                    **time**: {record.date.strftime('%Y-%m-%d %H:%M:%S')}
-                    **danger**: {'yes' if record.danger else 'no'}
-                    **description**: {record.description}
-                    """
-                
-                # 关闭数据库会话
-                try:
-                    next(db_gen)
-                except StopIteration:
-                    pass
-                    
-            except Exception as e:
-                logger.error(f"从数据库获取历史记录时出错: {e}")
-            
-            # 如果没有历史数据，提供一个默认的提示
-            if not context:
-                context = "No previous analysis data available."
+            # 使用内存中的上下文窗口（最近的20条分析记录），不查询数据库
+            self._ensure_analysis_state()
+            _, context, _ = self.context_window.snapshot()
             
             # 构造一个详细的提示，指导vLLM如何使用历史数据回答问题
             full_prompt = f"""You are an intelligent security monitoring assistant. Please provide an answer based on the following historical data and the user's question.
@@ -321,6 +327,7 @@ Please provide an accurate and helpful answer based on the historical data. If t
             
             # 发送请求到vLLM
             logger.info(f"向vLLM发送请求，基于历史数据回答问题: {prompt}")
+            import requests
             response = requests.post(self.vllm_url, json=data, timeout=60)  # 增加超时时间
             
             if response.status_code == 200:
@@ -344,31 +351,76 @@ Please provide an accurate and helpful answer based on the historical data. If t
             frame: OpenCV图像帧
         """
         current_time = time.time()
+        if self.analyzing:
+            return
         
-        # 检查是否达到了分析间隔时间并且没有正在进行的分析
-        if (current_time - self.last_description_time >= self.description_interval and 
-            not self.analyzing):
-            
-            with self.analyzing_lock:
-                self.analyzing = True
-            
-            # 创建新的线程来异步处理图像分析
-            description_thread = threading.Thread(
-                target=self._async_describe_frame, 
-                args=(frame,),
-                daemon=True
-            )
-            description_thread.start()
-            self.last_description_time = current_time
+        # 优先执行传感器触发的分析，否则检查是否达到了分析间隔时间
+        trigger = self._take_trigger(current_time)
+        if trigger is None:
+            if current_time - self.last_description_time < self.description_interval:
+                return
+            self._satisfy_trigger()
+        
+        with self.analyzing_lock:
+            self.analyzing = True
+        
+        # 创建新的线程来异步处理图像分析
+        description_thread = threading.Thread(
+            target=self._async_describe_frame, 
+            args=(frame, trigger),
+            daemon=True
+        )
+        description_thread.start()
+        self.last_description_time = current_time
     
-    def _async_describe_frame(self, frame):
+    def request_analysis(self, event: dict) -> None:
+        """
+        请求对当前帧立即分析（事件总线ANALYSIS_REQUEST的处理函数）
+        
+        尚未执行的请求只保留最早的一个，后续请求合并到其中
+        
+        Args:
+            event (dict): 事件内容 {"source", "reason", "timestamp"}
+        """
+        with self.trigger_lock:
+            if self.pending_trigger is not None:
+                self.pending_trigger["coalesced"] = self.pending_trigger.get("coalesced", 0) + 1
+                metrics.increment('analysis.triggers_coalesced')
+                return
+            self.pending_trigger = dict(event)
+        metrics.increment('analysis.triggers_requested')
+        logger.info(f"收到立即分析请求: {event.get('source')} ({event.get('reason')})")
+    
+    def _take_trigger(self, now: float) -> Optional[dict]:
+        """取出可以执行的分析请求（距上次触发的分析不足最小间隔时继续等待）"""
+        with self.trigger_lock:
+            if self.pending_trigger is None or now - self.last_trigger_time < self.trigger_min_interval:
+                return None
+            trigger = self.pending_trigger
+            self.pending_trigger = None
+            self.last_trigger_time = now
+        metrics.increment('analysis.triggered')
+        return trigger
+    
+    def _satisfy_trigger(self) -> None:
+        """按计划分析新帧时，等待中的请求已得到满足"""
+        with self.trigger_lock:
+            if self.pending_trigger is None:
+                return
+            self.pending_trigger = None
+        metrics.increment('analysis.triggers_satisfied')
+    
+    def _async_describe_frame(self, frame, trigger: Optional[dict] = None):
         """
         异步处理图像分析
         
         Args:
             frame: OpenCV图像帧
+            trigger (dict): 触发本次分析的传感器请求，按计划分析时为None
         """
         try:
+            self._ensure_analysis_state()
+            
             # 保存当前帧到文件，供Web UI访问
             try:
                 cv2.imwrite('latest_analysis_frame.jpg', frame)
@@ -381,16 +433,37 @@ Please provide an accurate and helpful answer based on the historical data. If t
             print(description)
             if description:
                 # 更新最新的分析结果
+                if trigger is not None:
+                    description["trigger"] = {"source": trigger.get("source"), "reason": trigger.get("reason")}
+                    logger.info(f"传感器触发的分析完成: {trigger.get('source')} ({trigger.get('reason')})，"
+                                f"延迟 {time.time() - trigger.get('timestamp', time.time()):.1f} 秒")
                 with self.description_lock:
                     self.latest_description = description
                 
-                # 控制RS485灯光：根据vLLM判断结果设置灯光颜色
+                # 控制RS485灯光：根据vLLM判断结果设置灯光颜色（先于数据库写入）
                 if self.rs485_sensor_data_sender:
                     is_dangerous = description.get("danger", False)
                     self.rs485_sensor_data_sender.handle_vllm_danger_result(is_dangerous)
                 
+                # 保存到数据库，等待写入线程返回记录ID（供Web UI去重和检索）
+                analysis_date = datetime.strptime(description["date"], '%Y-%m-%d %H:%M:%S')
+                record_future = self.save_analysis_to_db(analysis_date, description["description"],
+                                                         description["danger"])
+                try:
+                    description["id"] = record_future.result(timeout=self.record_id_timeout)
+                except Exception as e:
+                    logger.error(f"等待分析记录ID时出错: {e}")
+                
+                # 合并到当前事件，并更新聊天上下文窗口
+                _, frame_jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+                incident = self.incident_tracker.observe(description["id"], analysis_date,
+                                                         description["description"], description["danger"],
+                                                         description["severity"], frame_jpeg.tobytes())
+                self.context_window.update_incident(incident)
+                
                 # 发送完整的分析结果到UI（不包含图像数据）
                 self.send_frame_via_udp(description, frame_type="vllm_response")
+                self.send_frame_via_udp(incident, frame_type="incident")
                 
                 # 同时发送当前帧作为视频帧
                 self.send_frame_via_udp(frame, frame_type="video")
@@ -469,6 +542,9 @@ Please provide an accurate and helpful answer based on the historical data. If t
     def stop_streaming(self):
         """停止视频流传输"""
         self.running = False
+        self.events.unsubscribe(ANALYSIS_REQUEST, self.request_analysis)
         if self.cap:
             self.cap.release()
+        # 写完队列中尚未提交的分析记录
+        db_writer.flush(timeout=5)
         logger.info("视频流传输已停止")
\ No newline at end of file
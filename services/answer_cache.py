@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+聊天回答缓存模块
+
+多个屏幕上的操作员经常在几秒内问同一个问题，该模块按
+"规范化的问题 + 上下文中最新分析记录ID"缓存回答：
+- 相同的并发请求合并为一次生成，后到的请求跟随同一个条目逐token接收
+- 完成的回答在TTL内直接复用，超过容量时按LRU淘汰
+- 所有订阅者都断开后取消仍在进行的生成
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from services.metrics import metrics
+
+logger = logging.getLogger("AnswerCache")
+
+
+class AnswerEntry:
+    """一个回答的缓存条目（可能仍在生成中）"""
+
+    def __init__(self, key: tuple):
+        """
+        初始化缓存条目
+
+        Args:
+            key (tuple): 缓存键
+        """
+        self.key = key
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[str] = None
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self.cancelled = threading.Event()
+        self.on_cancel: Optional[Callable[[], None]] = None
+        self.listeners: List[Callable[[], None]] = []
+        self.condition = threading.Condition()
+
+    def _notify(self) -> None:
+        """唤醒等待中的订阅者"""
+        with self.condition:
+            self.condition.notify_all()
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"回答缓存监听器出错: {e}")
+
+    def append(self, token: str) -> None:
+        """
+        追加一个生成的token
+
+        Args:
+            token (str): token文本
+        """
+        with self.condition:
+            self.tokens.append(token)
+        self._notify()
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """添加状态变化回调（供异步服务唤醒事件循环）"""
+        with self.condition:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        """移除状态变化回调"""
+        with self.condition:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def read(self, index: int) -> Tuple[List[str], bool, Optional[str]]:
+        """
+        读取从index开始的新token
+
+        Args:
+            index (int): 已读取的token数量
+
+        Returns:
+            tuple: (新token列表, 是否完成, 错误信息)
+        """
+        with self.condition:
+            return self.tokens[index:], self.done, self.error
+
+    def wait(self, index: int, timeout: Optional[float] = None) -> Tuple[List[str], bool, Optional[str]]:
+        """
+        阻塞等待新token、完成或出错
+
+        Args:
+            index (int): 已读取的token数量
+            timeout (float): 最长等待时间（秒）
+
+        Returns:
+            tuple: (新token列表, 是否完成, 错误信息)
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.tokens) > index or self.done or self.error is not None,
+                                    timeout=timeout)
+            return self.tokens[index:], self.done, self.error
+
+    def text(self) -> str:
+        """完整的回答文本"""
+        with self.condition:
+            return ''.join(self.tokens).strip()
+
+
+class AnswerCache:
+    """回答缓存类（TTL + LRU，合并相同的并发请求）"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 60.0):
+        """
+        初始化回答缓存
+
+        Args:
+            max_entries (int): 最多缓存的回答数量
+            ttl (float): 完成的回答可以复用的时间（秒），0表示不缓存完成的回答
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[tuple, AnswerEntry]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        """
+        规范化问题：忽略大小写、多余空白和结尾的标点
+
+        Args:
+            question (str): 用户问题
+
+        Returns:
+            str: 规范化后的问题
+        """
+        question = re.sub(r'\s+', ' ', question.strip().lower())
+        return question.rstrip('?!.。？！ ')
+
+    def make_key(self, question: str, newest_record_id: Optional[int], *extra) -> tuple:
+        """
+        构造缓存键
+
+        Args:
+            question (str): 用户问题
+            newest_record_id (int): 上下文中最新分析记录的ID
+            extra: 其他影响回答的因素
+
+        Returns:
+            tuple: 缓存键
+        """
+        return (self.normalize_question(question), newest_record_id) + tuple(extra)
+
+    def _expired(self, entry: AnswerEntry, now: float) -> bool:
+        """判断完成的条目是否已过期"""
+        return entry.done and now - entry.finished_at >= self.ttl
+
+    def acquire(self, key: tuple) -> Tuple[AnswerEntry, bool]:
+        """
+        获取缓存条目并订阅
+
+        Args:
+            key (tuple): 缓存键
+
+        Returns:
+            tuple: (条目, 是否需要由调用方启动生成)
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.error is None and not self._expired(entry, now):
+                self.entries.move_to_end(key)
+                entry.subscribers += 1
+                metrics.increment('chat.cache_hit' if entry.done else 'chat.cache_coalesced')
+                return entry, False
+
+            entry = AnswerEntry(key)
+            entry.subscribers = 1
+            self.entries[key] = entry
+            self._evict(now)
+            metrics.increment('chat.cache_miss')
+            metrics.set_gauge('chat.cache_entries', len(self.entries))
+            return entry, True
+
+    def _evict(self, now: float) -> None:
+        """淘汰过期的条目，并在超过容量时按LRU淘汰已完成的条目（调用方持有锁）"""
+        for key in [key for key, entry in self.entries.items() if self._expired(entry, now)]:
+            del self.entries[key]
+        for key in list(self.entries):
+            if len(self.entries) <= self.max_entries:
+                break
+            if self.entries[key].done:
+                del self.entries[key]
+
+    def _remove(self, entry: AnswerEntry) -> None:
+        """从缓存中移除条目（调用方持有锁）"""
+        if self.entries.get(entry.key) is entry:
+            del self.entries[entry.key]
+
+    def finish(self, entry: AnswerEntry) -> None:
+        """
+        标记条目生成完成
+
+        Args:
+            entry (AnswerEntry): 缓存条目
+        """
+        with entry.condition:
+            entry.done = True
+            entry.finished_at = time.monotonic()
+        if self.ttl <= 0:
+            with self.lock:
+                self._remove(entry)
+        entry._notify()
+
+    def fail(self, entry: AnswerEntry, error: str) -> None:
+        """
+        标记条目生成失败，失败的回答不会被复用
+
+        Args:
+            entry (AnswerEntry): 缓存条目
+            error (str): 错误信息
+        """
+        with self.lock:
+            self._remove(entry)
+        with entry.condition:
+            entry.error = error
+        entry._notify()
+
+    def release(self, entry: AnswerEntry) -> None:
+        """
+        取消订阅；最后一个订阅者离开且生成尚未完成时取消生成
+
+        Args:
+            entry (AnswerEntry): 缓存条目
+        """
+        with self.lock:
+            entry.subscribers -= 1
+            if entry.subscribers > 0 or entry.done or entry.error is not None:
+                return
+            self._remove(entry)
+
+        logger.info("所有请求都已断开，取消回答生成")
+        entry.cancelled.set()
+        if entry.on_cancel is not None:
+            entry.on_cancel()
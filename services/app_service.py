@@ -3,21 +3,24 @@
 应用服务模块
 
 该模块负责协调应用程序的各个组件
+
+RS485模块（依赖pymodbus）只在启用RS485时导入；数据库在initialize_database中显式初始化
 """
 
 import logging
-from typing import Optional
+from typing import TYPE_CHECKING, Optional, Union
 
+from models.database import init_db
+from models.db_writer import db_writer
+from models.retention import RetentionJob
 from models.video_streamer import VideoStreamer
-from models.rs485_controller import RS485Controller
-from models.rs485_sensor_data_sender import RS485SensorDataSender
 from services.config import AppConfig
 
-# 设置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+if TYPE_CHECKING:
+    from models.rs485_async import AsyncRS485Controller
+    from models.rs485_controller import RS485Controller
+    from models.rs485_sensor_data_sender import RS485SensorDataSender
+
 logger = logging.getLogger("AppService")
 
 
@@ -33,25 +36,43 @@ class AppService:
         """
         self.config = config
         self.video_streamer: Optional[VideoStreamer] = None
-        self.rs485_controller: Optional[RS485Controller] = None
-        self.rs485_sensor_data_sender: Optional[RS485SensorDataSender] = None
+        self.rs485_controller: Optional[Union["RS485Controller", "AsyncRS485Controller"]] = None
+        self.rs485_sensor_data_sender: Optional["RS485SensorDataSender"] = None
+        self.retention_job: Optional[RetentionJob] = None
         
+    def initialize_database(self) -> None:
+        """初始化数据库（建表和迁移，数据库已是最新版本时只做检查）"""
+        init_db()
+        logger.info("数据库已初始化")
+    
     def initialize_rs485_components(self) -> None:
         """初始化RS485组件"""
         if self.config.enable_rs485_direct:
-            # 创建RS485控制器实例
-            self.rs485_controller = RS485Controller(
+            from models.rs485_async import AsyncRS485Controller
+            from models.rs485_controller import RS485Controller
+            from models.rs485_devices import load_devices
+            from models.rs485_sensor_data_sender import RS485SensorDataSender
+            
+            # 创建RS485控制器实例（异步模式下所有设备在一个事件循环中轮询）
+            controller_class = AsyncRS485Controller if self.config.rs485_async else RS485Controller
+            self.rs485_controller = controller_class(
                 serial_port=self.config.rs485_port,
                 baud=self.config.rs485_baud,
                 light_control_addr=self.config.light_control_addr,
                 light_sensor_addr=self.config.lux_sensor_addr
             )
             
+            # 加载设备登记表
+            devices = None
+            if self.config.rs485_devices_path:
+                devices = load_devices(self.config.rs485_devices_path)
+            
             # 创建RS485传感器数据发送器实例
             self.rs485_sensor_data_sender = RS485SensorDataSender(
                 sensor_reader=self.rs485_controller,
                 host=self.config.host,
-                port=5000  # 使用5000端口发送传感器数据，与UnifiedReceiver监听的端口一致
+                port=5000,  # 使用5000端口发送传感器数据，与UnifiedReceiver监听的端口一致
+                devices=devices
             )
             
             logger.info("RS485组件已初始化")
@@ -64,8 +85,10 @@ class AppService:
             description_interval=self.config.description_interval,
             model_name=self.config.model_name,
             video_source=self.config.video_source,
+            camera_id=self.config.camera_id,
             vllm_url=self.config.vllm_url,
-            rs485_sensor_data_sender=self.rs485_sensor_data_sender
+            rs485_sensor_data_sender=self.rs485_sensor_data_sender,
+            trigger_min_interval=self.config.trigger_min_interval
         )
         
         logger.info("视频流传输器已初始化")
@@ -76,6 +99,12 @@ class AppService:
             self.rs485_sensor_data_sender.start()
             logger.info("RS485传感器数据发送器已启动")
     
+    def start_retention_job(self) -> None:
+        """启动后台数据保留任务"""
+        if self.config.retention_days > 0:
+            self.retention_job = RetentionJob(keep_days=self.config.retention_days)
+            self.retention_job.start()
+    
     def start_video_streaming(self) -> None:
         """启动视频流传输"""
         if self.video_streamer:
@@ -88,5 +117,11 @@ class AppService:
             
         if self.rs485_sensor_data_sender:
             self.rs485_sensor_data_sender.stop()
+        
+        if self.retention_job:
+            self.retention_job.stop()
+        
+        # 写完数据库写入队列中的记录
+        db_writer.stop()
             
         logger.info("所有组件已停止")
\ No newline at end of file
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+聊天服务模块
+
+该模块负责构造基于历史分析记录的对话提示、调用vLLM并保存聊天记录，
+供同步(Flask)和异步(ASGI)两种Web服务模式共用
+
+提示按"固定说明 -> 按块滚动的历史记录 -> 会话记忆 -> 检索到的相关记录 -> 用户问题"排列，
+变化最频繁的内容放在最后，连续提问时Ollama可以复用前缀的KV缓存，只需计算新增部分
+"""
+
+import json
+import logging
+import threading
+from typing import Iterator, Optional
+
+from models.analysis_search import AnalysisSearchIndex
+from models.chat_context import AnalysisContextWindow
+from models.database import ChatRecord
+from models.db_writer import db_writer
+from services.answer_cache import AnswerCache, AnswerEntry
+from services.conversation_memory import ConversationMemory
+from services.metrics import metrics
+
+logger = logging.getLogger("ChatService")
+
+# 提示开头的固定说明（不随历史数据和问题变化，始终位于可缓存的前缀中）
+SYSTEM_INSTRUCTIONS = ("You are an intelligent security monitoring assistant. "
+                       "Please provide an answer based on the following historical data and the user's question.")
+
+
+class ChatService:
+    """聊天服务类"""
+
+    def __init__(self, ollama_url: str = "http://localhost:11434/api/generate",
+                 model_name: str = "gemma3:4b", context_limit: int = 20,
+                 max_tokens: int = 500, timeout: float = 30,
+                 context_window: Optional[AnalysisContextWindow] = None,
+                 retrieval_k: int = 5, keep_alive: str = "30m",
+                 answer_cache: Optional[AnswerCache] = None,
+                 memory: Optional[ConversationMemory] = None):
+        """
+        初始化聊天服务
+
+        Args:
+            ollama_url (str): Ollama生成接口URL
+            model_name (str): 模型名称
+            context_limit (int): 作为上下文的最近事件数量
+            max_tokens (int): 单次回答的最大token数
+            timeout (float): 请求超时时间（秒）
+            context_window (AnalysisContextWindow): 共享的上下文窗口，为None时新建
+            retrieval_k (int): 从更早的历史中检索的相关记录数量，0表示不检索
+            keep_alive (str): 请求Ollama在空闲时保持模型（及KV缓存）加载的时长
+            answer_cache (AnswerCache): 回答缓存，为None时使用默认配置新建
+            memory (ConversationMemory): 会话记忆，为None时新建（使用本服务生成摘要）
+        """
+        self.ollama_url = ollama_url
+        self.model_name = model_name
+        self.context_limit = context_limit
+        self.context_window = context_window or AnalysisContextWindow(max_records=context_limit)
+        self.search_index = AnalysisSearchIndex(top_k=retrieval_k)
+        self.retrieval_k = retrieval_k
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.answer_cache = answer_cache or AnswerCache()
+        self.memory = memory or ConversationMemory(summarize_fn=self.complete)
+
+        logger.info(f"初始化聊天服务，模型: {model_name}, URL: {ollama_url}")
+
+    @staticmethod
+    def normalize_session_id(value) -> Optional[str]:
+        """
+        校验浏览器传来的会话ID
+
+        Args:
+            value: 请求中的session_id字段
+
+        Returns:
+            str: 有效的会话ID，无效时为None
+        """
+        if not isinstance(value, str) or not value.strip():
+            return None
+        return value.strip()[:64]
+
+    def build_context(self) -> str:
+        """
+        获取最近分析记录的上下文字符串（由上下文窗口增量维护，不查询数据库）
+
+        Returns:
+            str: 上下文字符串
+        """
+        _, context, _ = self.context_window.snapshot()
+        return context
+
+    def build_relevant_context(self, user_message: str) -> str:
+        """
+        从全部历史中检索与问题相关、但不属于最近窗口中任何事件的记录
+
+        Args:
+            user_message (str): 用户的问题
+
+        Returns:
+            str: 相关记录的上下文字符串，没有时为空字符串
+        """
+        if self.retrieval_k <= 0:
+            return ""
+
+        records = self.search_index.search(user_message, k=self.retrieval_k)
+        return "\n".join(
+            AnalysisContextWindow.format_record(record['date'], record['description'], record['danger'])
+            for record in records if not self.context_window.contains(record['id'], record['camera_id'])
+        )
+
+    def build_prompt(self, user_message: str, session_id: Optional[str] = None) -> str:
+        """
+        构造一个详细的提示，指导vLLM如何使用历史数据回答问题
+
+        Args:
+            user_message (str): 用户的问题
+            session_id (str): 聊天会话ID，用于加入该会话的对话记忆
+
+        Returns:
+            str: 完整的提示
+        """
+        context = self.build_context()
+        # 会话记忆只在末尾追加（直到折叠进摘要），放在所有会话共用的历史记录之后
+        conversation = self.memory.build_section(session_id)
+        if conversation:
+            context = f"""{context}
+
+{conversation}"""
+        # 检索结果随问题变化，放在历史记录之后，不破坏可复用的前缀
+        relevant = self.build_relevant_context(user_message)
+        if relevant:
+            context = f"""{context}
+Relevant earlier records:
+{relevant}"""
+        return f"""{SYSTEM_INSTRUCTIONS}
+
+Historical Data:
+{context}
+
+User Question:
+{user_message}
+
+Please provide an accurate and helpful answer based on the historical data. If the question cannot be answered with the provided data, please state so clearly."""
+
+    def build_request(self, prompt: str, stream: bool = False) -> dict:
+        """
+        准备发送给vLLM的数据
+
+        Args:
+            prompt (str): 完整的提示
+            stream (bool): 是否逐token流式返回
+
+        Returns:
+            dict: 请求体
+        """
+        return {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "num_predict": self.max_tokens,
+                "temperature": 0
+            }
+        }
+
+    @staticmethod
+    def record_timings(response_data: dict) -> None:
+        """
+        记录Ollama返回的预填充(prompt eval)和生成耗时
+
+        prompt_eval_count 只统计实际计算的提示token，命中KV缓存的前缀不计入
+
+        Args:
+            response_data (dict): 非流式响应或流式响应的最后一个分块
+        """
+        prompt_tokens = response_data.get("prompt_eval_count")
+        if prompt_tokens is None:
+            return
+        prefill_ms = response_data.get("prompt_eval_duration", 0) / 1e6
+        eval_ms = response_data.get("eval_duration", 0) / 1e6
+        metrics.observe('chat.prompt_eval_count', prompt_tokens)
+        metrics.observe('chat.prompt_eval_ms', prefill_ms)
+        metrics.observe('chat.eval_count', response_data.get("eval_count", 0))
+        metrics.observe('chat.eval_ms', eval_ms)
+        logger.info(f"预填充 {prompt_tokens} 个token，耗时 {prefill_ms:.0f} ms；生成耗时 {eval_ms:.0f} ms")
+
+    def parse_response(self, status_code: int, response_data: Optional[dict]) -> str:
+        """
+        从vLLM的响应中提取回答文本
+
+        Args:
+            status_code (int): HTTP状态码
+            response_data (dict): 响应JSON
+
+        Returns:
+            str: 回答文本或错误信息
+        """
+        if status_code == 200 and response_data is not None:
+            self.record_timings(response_data)
+            return response_data.get("response", "").strip()
+        return f"Error: vLLM request failed with status {status_code}"
+
+    def generate(self, user_message: str, session_id: Optional[str] = None) -> str:
+        """
+        同步调用vLLM回答用户问题（经过回答缓存）
+
+        Args:
+            user_message (str): 用户的问题
+            session_id (str): 聊天会话ID
+
+        Returns:
+            str: 回答文本
+        """
+        return ''.join(self.stream_answer(user_message, session_id)).strip()
+
+    def complete(self, prompt: str) -> str:
+        """
+        不经过缓存直接调用vLLM（用于生成会话摘要等内部任务）
+
+        Args:
+            prompt (str): 完整的提示
+
+        Returns:
+            str: 生成的文本
+        """
+        import requests
+        response = requests.post(self.ollama_url, json=self.build_request(prompt), timeout=self.timeout)
+        if response.status_code != 200:
+            raise RuntimeError(self.parse_response(response.status_code, None))
+        return response.json().get("response", "").strip()
+
+    def cache_key(self, user_message: str, session_id: Optional[str] = None) -> tuple:
+        """
+        回答缓存键：规范化的问题 + 上下文中最新分析记录的ID + 会话记忆的摘要值
+
+        没有会话记忆的提问（例如新会话的第一个问题）在不同会话之间共享缓存
+
+        Args:
+            user_message (str): 用户的问题
+            session_id (str): 聊天会话ID
+
+        Returns:
+            tuple: 缓存键
+        """
+        _, _, newest_record_id = self.context_window.snapshot()
+        return self.answer_cache.make_key(user_message, newest_record_id, self.memory.digest(session_id))
+
+    def stream_answer(self, user_message: str, session_id: Optional[str] = None) -> Iterator[str]:
+        """
+        逐token产生回答：命中缓存时直接回放，相同问题正在生成时跟随该生成，
+        否则在后台线程中启动新的生成
+
+        关闭该生成器即取消订阅，最后一个订阅者离开时生成会被取消
+
+        Args:
+            user_message (str): 用户的问题
+            session_id (str): 聊天会话ID
+
+        Yields:
+            str: 回答的token文本
+        """
+        entry, is_new = self.answer_cache.acquire(self.cache_key(user_message, session_id))
+        try:
+            if is_new:
+                threading.Thread(target=self._generate_into, args=(entry, user_message, session_id),
+                                 daemon=True).start()
+
+            index = 0
+            while True:
+                tokens, done, error = entry.wait(index, timeout=self.timeout)
+                index += len(tokens)
+                yield from tokens
+                if error is not None:
+                    raise RuntimeError(error)
+                if done:
+                    return
+        finally:
+            self.answer_cache.release(entry)
+
+    def _generate_into(self, entry: AnswerEntry, user_message: str, session_id: Optional[str] = None) -> None:
+        """
+        调用vLLM生成回答并写入缓存条目（在后台线程中运行）
+
+        Args:
+            entry (AnswerEntry): 缓存条目
+            user_message (str): 用户的问题
+            session_id (str): 聊天会话ID
+        """
+        tokens = None
+        try:
+            tokens = self.stream_tokens(self.build_prompt(user_message, session_id))
+            for token in tokens:
+                if entry.cancelled.is_set():
+                    return
+                entry.append(token)
+            self.answer_cache.finish(entry)
+        except Exception as e:
+            logger.error(f"生成回答时出错: {e}")
+            self.answer_cache.fail(entry, str(e))
+        finally:
+            if tokens is not None:
+                tokens.close()
+
+    def parse_stream_line(self, line) -> tuple:
+        """
+        解析Ollama流式响应中的一行（NDJSON），最后一行中的耗时统计会被记录
+
+        Args:
+            line (bytes or str): 一行JSON数据
+
+        Returns:
+            tuple: (token文本, 是否结束)
+        """
+        chunk = json.loads(line)
+        if chunk.get("error"):
+            raise RuntimeError(chunk["error"])
+        if chunk.get("done"):
+            self.record_timings(chunk)
+        return chunk.get("response", ""), bool(chunk.get("done"))
+
+    def stream_tokens(self, prompt: str) -> Iterator[str]:
+        """
+        流式调用vLLM，逐个产生生成的token
+
+        关闭该生成器（例如浏览器断开连接）时会同时关闭到vLLM的连接，
+        Ollama检测到连接断开后会停止生成，不再浪费GPU时间
+
+        Args:
+            prompt (str): 完整的提示
+
+        Yields:
+            str: 生成的token文本
+        """
+        import requests
+        response = requests.post(self.ollama_url, json=self.build_request(prompt, stream=True),
+                                 stream=True, timeout=self.timeout)
+        try:
+            if response.status_code != 200:
+                raise RuntimeError(self.parse_response(response.status_code, None))
+
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                token, done = self.parse_stream_line(line)
+                if token:
+                    yield token
+                if done:
+                    break
+        finally:
+            response.close()
+
+    @staticmethod
+    def format_stream_event(event: str, data: dict) -> str:
+        """
+        将流式聊天事件格式化为SSE文本帧
+
+        Args:
+            event (str): 事件类型 "token"、"done" 或 "error"
+            data (dict): 事件数据
+
+        Returns:
+            str: SSE格式的文本
+        """
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def save_chat_record(self, user_message: str, response_text: str, session_id: Optional[str] = None) -> None:
+        """
+        将对话记录放入数据库写入队列（不阻塞请求），提交后加入该会话的对话记忆
+
+        Args:
+            user_message (str): 用户消息
+            response_text (str): 助手回答
+            session_id (str): 聊天会话ID
+        """
+        # 创建新的聊天记录
+        chat_record = ChatRecord(
+            session_id=session_id,
+            user_message=user_message,
+            assistant_response=response_text
+        )
+
+        def on_saved(done):
+            if done.exception() is not None:
+                logger.error(f"保存聊天记录到数据库时出错: {done.exception()}")
+                return
+            logger.info(f"聊天记录已保存到数据库，ID: {done.result()}")
+            self.memory.add_turn(session_id, done.result(), user_message, response_text)
+
+        db_writer.submit(chat_record).add_done_callback(on_saved)
@@ -5,7 +5,7 @@
 该模块负责管理应用程序的配置
 """
 
-from typing import Union
+from typing import Optional, Union
 
 
 class AppConfig:
@@ -20,6 +20,12 @@ class AppConfig:
         self.description_interval: int = 5
         self.model_name: str = "gemma3:4b"
         self.video_source: Union[int, str] = 0
+        self.camera_id: str = "default"
+        # 传感器触发的立即分析之间的最小间隔（秒）
+        self.trigger_min_interval: float = 10.0
+        
+        # 数据保留配置（0表示不清理）
+        self.retention_days: int = 30
         
         # vLLM配置
         self.vllm_url: str = "http://localhost:11434/v1/completions"
@@ -30,6 +36,10 @@ class AppConfig:
         self.rs485_baud: int = 9600
         self.lux_sensor_addr: int = 0x0B
         self.light_control_addr: int = 0x01
+        # RS485设备登记表JSON文件（为None时只轮询光照传感器）
+        self.rs485_devices_path: Optional[str] = None
+        # 是否使用异步Modbus客户端
+        self.rs485_async: bool = False
 
 
 class RS485Config:
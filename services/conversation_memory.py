@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+会话记忆模块
+
+该模块基于ChatRecord为每个聊天会话维护有界的对话记忆：
+- 最近几轮对话原样保留
+- 更早的对话在后台线程中折叠为滚动摘要（保存在chat_summaries表中）
+- 加入提示的记忆文本有固定的token预算，不随对话变长而增长
+"""
+
+import hashlib
+import logging
+import queue
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Callable, Optional
+
+from models.database import ChatRecord, ChatSummary, get_db
+from models.db_writer import db_writer
+
+logger = logging.getLogger("ConversationMemory")
+
+# 估算token数时每个token对应的字符数
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的token数"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """
+    将文本截断到指定的token预算内
+
+    Args:
+        text (str): 原文本
+        tokens (int): token预算
+
+    Returns:
+        str: 截断后的文本
+    """
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:max(0, limit - 3)] + "..."
+
+
+class SessionMemory:
+    """单个会话的记忆"""
+
+    def __init__(self, summary: str = "", summarized_upto: int = 0):
+        """
+        初始化会话记忆
+
+        Args:
+            summary (str): 较早对话的滚动摘要
+            summarized_upto (int): 摘要已包含的最后一条聊天记录ID
+        """
+        self.summary = summary
+        self.summarized_upto = summarized_upto
+        self.turns: deque = deque()  # (记录ID, 用户消息, 助手回答)
+
+
+class ConversationMemory:
+    """会话记忆管理类"""
+
+    def __init__(self, summarize_fn: Optional[Callable[[str], str]] = None,
+                 recent_turns: int = 4, summary_tokens: int = 200,
+                 recent_tokens: int = 600, max_sessions: int = 256):
+        """
+        初始化会话记忆
+
+        Args:
+            summarize_fn (callable): 根据提示生成摘要的函数，为None时不生成摘要（只保留最近几轮）
+            recent_turns (int): 原样保留的最近对话轮数
+            summary_tokens (int): 摘要的token预算
+            recent_tokens (int): 最近对话的token预算
+            max_sessions (int): 内存中保留的会话数量（按LRU淘汰，需要时再从数据库加载）
+        """
+        self.summarize_fn = summarize_fn
+        self.recent_turns = recent_turns
+        self.summary_tokens = summary_tokens
+        self.recent_tokens = recent_tokens
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, SessionMemory]" = OrderedDict()
+        self.lock = threading.Lock()
+
+        # 后台摘要线程，同一会话同时只排队一次
+        self.summary_queue: queue.Queue = queue.Queue()
+        self.pending = set()
+        self.summary_thread: Optional[threading.Thread] = None
+
+    def _load_session(self, session_id: str) -> SessionMemory:
+        """从数据库加载会话的摘要和尚未摘要的最近对话"""
+        memory = SessionMemory()
+        try:
+            # 获取数据库会话
+            db_gen = get_db()
+            db = next(db_gen)
+
+            summary = db.query(ChatSummary).filter(ChatSummary.session_id == session_id).first()
+            if summary is not None:
+                memory.summary = summary.summary or ""
+                memory.summarized_upto = summary.last_record_id or 0
+
+            records = (db.query(ChatRecord)
+                       .filter(ChatRecord.session_id == session_id, ChatRecord.id > memory.summarized_upto)
+                       .order_by(ChatRecord.id.desc())
+                       .limit(self.recent_turns * 2)
+                       .all())
+            for record in reversed(records):
+                memory.turns.append((record.id, record.user_message or "", record.assistant_response or ""))
+
+            # 关闭数据库会话
+            try:
+                next(db_gen)
+            except StopIteration:
+                pass
+        except Exception as e:
+            logger.error(f"加载会话记忆时出错: {e}")
+        return memory
+
+    def _get_session(self, session_id: str) -> SessionMemory:
+        """获取会话记忆（不在内存中时从数据库加载）"""
+        with self.lock:
+            memory = self.sessions.get(session_id)
+            if memory is not None:
+                self.sessions.move_to_end(session_id)
+                return memory
+
+        memory = self._load_session(session_id)
+        with self.lock:
+            # 加载期间可能已被其他线程加载
+            existing = self.sessions.get(session_id)
+            if existing is not None:
+                return existing
+            self.sessions[session_id] = memory
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        if len(memory.turns) > self.recent_turns:
+            self._schedule_summary(session_id)
+        return memory
+
+    def add_turn(self, session_id: Optional[str], record_id: int, user_message: str, assistant_response: str) -> None:
+        """
+        记录一轮新的对话，超过保留轮数时在后台更新摘要
+
+        Args:
+            session_id (str): 会话ID
+            record_id (int): 聊天记录ID
+            user_message (str): 用户消息
+            assistant_response (str): 助手回答
+        """
+        if not session_id:
+            return
+        memory = self._get_session(session_id)
+        with self.lock:
+            if any(turn[0] == record_id for turn in memory.turns):
+                return
+            memory.turns.append((record_id, user_message, assistant_response))
+            needs_summary = len(memory.turns) > self.recent_turns
+        if needs_summary:
+            self._schedule_summary(session_id)
+
+    def build_section(self, session_id: Optional[str]) -> str:
+        """
+        构造加入提示的会话记忆文本（摘要 + 最近几轮对话），总长度不超过token预算
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            str: 会话记忆文本，没有记忆时为空字符串
+        """
+        if not session_id:
+            return ""
+        memory = self._get_session(session_id)
+        with self.lock:
+            summary = memory.summary
+            turns = list(memory.turns)[-self.recent_turns:]
+
+        # 从最新的一轮开始，直到用完预算
+        budget = self.recent_tokens
+        recent = []
+        for _, user_message, assistant_response in reversed(turns):
+            turn = f"User: {user_message}\nAssistant: {assistant_response}"
+            if estimate_tokens(turn) > budget:
+                if not recent:
+                    recent.append(truncate_to_tokens(turn, budget))
+                break
+            recent.append(turn)
+            budget -= estimate_tokens(turn)
+        recent.reverse()
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier conversation:\n{truncate_to_tokens(summary, self.summary_tokens)}")
+        if recent:
+            parts.append("Recent conversation:\n" + "\n".join(recent))
+        return "\n".join(parts)
+
+    def digest(self, session_id: Optional[str]) -> str:
+        """
+        会话记忆的摘要值（用于回答缓存键，记忆变化时缓存键随之变化）
+
+        Args:
+            session_id (str): 会话ID
+
+        Returns:
+            str: 记忆内容的哈希值，没有记忆时为空字符串
+        """
+        section = self.build_section(session_id)
+        if not section:
+            return ""
+        return hashlib.sha1(section.encode('utf-8')).hexdigest()[:16]
+
+    def _schedule_summary(self, session_id: str) -> None:
+        """把会话加入后台摘要队列"""
+        if self.summarize_fn is None:
+            return
+        with self.lock:
+            if session_id in self.pending:
+                return
+            self.pending.add(session_id)
+            if self.summary_thread is None or not self.summary_thread.is_alive():
+                self.summary_thread = threading.Thread(target=self._summary_loop, daemon=True)
+                self.summary_thread.start()
+        self.summary_queue.put(session_id)
+
+    def _summary_loop(self) -> None:
+        """后台摘要线程"""
+        while True:
+            session_id = self.summary_queue.get()
+            with self.lock:
+                self.pending.discard(session_id)
+            try:
+                self._update_summary(session_id)
+            except Exception as e:
+                logger.error(f"更新会话摘要时出错: {e}")
+
+    def _update_summary(self, session_id: str) -> None:
+        """把超出保留轮数的较早对话折叠进滚动摘要"""
+        memory = self._get_session(session_id)
+        with self.lock:
+            fold = list(memory.turns)[:-self.recent_turns]
+            summary = memory.summary
+        if not fold:
+            return
+
+        conversation = "\n".join(f"User: {user_message}\nAssistant: {assistant_response}"
+                                 for _, user_message, assistant_response in fold)
+        words = self.summary_tokens * 3 // 4
+        prompt = f"""Update the summary of a conversation between a user and a security monitoring assistant.
+
+Current summary:
+{summary or '(empty)'}
+
+New conversation turns:
+{conversation}
+
+Write the updated summary in at most {words} words. Keep facts, names, times and open questions the user may refer back to. Output only the summary."""
+        new_summary = truncate_to_tokens(self.summarize_fn(prompt).strip(), self.summary_tokens)
+        last_record_id = fold[-1][0]
+
+        # 通过写入队列保存到数据库（按会话ID合并为一行）
+        db_writer.submit(ChatSummary(
+            session_id=session_id,
+            summary=new_summary,
+            last_record_id=last_record_id,
+            updated_at=datetime.utcnow()
+        ), merge=True).result(timeout=30)
+
+        with self.lock:
+            memory.summary = new_summary
+            memory.summarized_upto = last_record_id
+            while memory.turns and memory.turns[0][0] <= last_record_id:
+                memory.turns.popleft()
+        logger.info(f"会话 {session_id} 的摘要已更新（包含到聊天记录 {last_record_id}）")
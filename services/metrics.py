@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+运行指标模块
+
+该模块提供一个线程安全的进程内指标登记表（计数器、瞬时值和耗时统计），
+各服务在关键路径上记录指标，Web UI通过 /metrics 路由以JSON格式返回
+"""
+
+import threading
+from collections import deque
+from typing import Dict
+
+
+class MetricsRegistry:
+    """指标登记类"""
+
+    def __init__(self, window: int = 1000):
+        """
+        初始化指标登记表
+
+        Args:
+            window (int): 每个统计项保留的最近样本数量（用于计算分位数）
+        """
+        self.window = window
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.samples: Dict[str, deque] = {}
+        self.totals: Dict[str, list] = {}
+        self.lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """
+        增加计数器
+
+        Args:
+            name (str): 指标名称
+            value (float): 增加的数值
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """
+        设置瞬时值（例如队列长度）
+
+        Args:
+            name (str): 指标名称
+            value (float): 当前数值
+        """
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        记录一个样本（例如耗时、token数）
+
+        Args:
+            name (str): 指标名称
+            value (float): 样本数值
+        """
+        with self.lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.window)
+                self.totals[name] = [0, 0.0]
+            self.samples[name].append(value)
+            self.totals[name][0] += 1
+            self.totals[name][1] += value
+
+    def snapshot(self) -> dict:
+        """
+        获取所有指标的当前值
+
+        Returns:
+            dict: 包含 counters、gauges 和 summaries（count、mean、p50、p95、last）的字典
+        """
+        with self.lock:
+            summaries = {}
+            for name, values in self.samples.items():
+                ordered = sorted(values)
+                count, total = self.totals[name]
+                summaries[name] = {
+                    'count': count,
+                    'mean': total / count,
+                    'p50': ordered[len(ordered) // 2],
+                    'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                    'last': values[-1],
+                }
+            return {
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'summaries': summaries,
+            }
+
+
+# 进程内共享的指标登记表
+metrics = MetricsRegistry()
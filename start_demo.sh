@@ -18,7 +18,9 @@ LIGHT_CONTROL_ADDR=${LIGHT_CONTROL_ADDR:-0x01}
 DESCRIPTION_INTERVAL=${DESCRIPTION_INTERVAL:-10}
 MODEL=${MODEL:-gemma3:4b}
 VIDEO_SOURCE=${VIDEO_SOURCE:-0}
+CAMERA_ID=${CAMERA_ID:-default}
 VLLM_URL=${VLLM_URL:-http://localhost:11434/v1/completions}
+WEB_SERVER=${WEB_SERVER:-flask}
 
 # 显示使用说明
 usage() {
@@ -37,13 +39,15 @@ usage() {
     echo "  --description-interval SECONDS 分析间隔 (默认: 10)"
     echo "  --model MODEL            Ollama模型名称 (默认: gemma3:4b)"
     echo "  --video-source SOURCE    视频源 (默认: 0)"
+    echo "  --camera-id ID           摄像头标识 (默认: default)"
     echo "  --vllm-url URL           vLLM API URL (默认: http://localhost:11434/v1/completions)"
+    echo "  --web-server MODE        Web服务模式: flask 或 async (默认: flask)"
     echo "  --no-rs485               禁用RS485设备支持"
     echo "  --help                   显示此帮助信息"
     echo ""
     echo "环境变量:"
     echo "  PORT, HOST, WEB_PORT, CHART_PORT, RS485_PORT, RS485_BAUD, LUX_SENSOR_ADDR, LIGHT_CONTROL_ADDR"
-    echo "  DESCRIPTION_INTERVAL, MODEL, VIDEO_SOURCE, VLLM_URL"
+    echo "  DESCRIPTION_INTERVAL, MODEL, VIDEO_SOURCE, CAMERA_ID, VLLM_URL, WEB_SERVER"
     echo ""
     echo "示例:"
     echo "  $0"
@@ -102,10 +106,18 @@ while [[ $# -gt 0 ]]; do
             VIDEO_SOURCE="$2"
             shift 2
             ;;
+        --camera-id)
+            CAMERA_ID="$2"
+            shift 2
+            ;;
         --vllm-url)
             VLLM_URL="$2"
             shift 2
             ;;
+        --web-server)
+            WEB_SERVER="$2"
+            shift 2
+            ;;
         --no-rs485)
             ENABLE_RS485=false
             shift
@@ -124,7 +136,7 @@ echo "Starting VLM Demo System..."
 
 # 启动Web UI (从指定端口接收数据，在指定Web端口显示UI)
 echo "Starting Web UI..."
-python3 web_ui.py --port $PORT --host $HOST --web-port $WEB_PORT --chart-port $CHART_PORT &
+python3 web_ui.py --port $PORT --host $HOST --web-port $WEB_PORT --chart-port $CHART_PORT --server $WEB_SERVER --model $MODEL &
 WEB_UI_PID=$!
 
 # 等待几秒确保Web UI启动
@@ -151,6 +163,7 @@ if [ "$ENABLE_RS485" = true ]; then
         --description-interval $DESCRIPTION_INTERVAL \
         --model $MODEL \
         --video-source $VIDEO_SOURCE \
+        --camera-id $CAMERA_ID \
         --vllm-url $VLLM_URL &
 else
     echo "Starting without RS485 support..."
@@ -160,6 +173,7 @@ else
         --description-interval $DESCRIPTION_INTERVAL \
         --model $MODEL \
         --video-source $VIDEO_SOURCE \
+        --camera-id $CAMERA_ID \
         --vllm-url $VLLM_URL &
 fi
 
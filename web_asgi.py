@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+VLM Demo Web UI 异步服务模式
+
+该模块把Web UI包装为ASGI应用：长连接的MJPEG视频流、SSE事件推送和
+对vLLM的请求都以协程方式处理，一个进程即可承载大量并发观看者和聊天用户；
+其余的普通路由仍交给原有的Flask应用处理
+
+依赖 uvicorn、httpx 和 asgiref（pip install "vlm-demo[async]"）
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Optional
+from urllib.parse import parse_qs
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+
+from models.event_broadcaster import EventBroadcaster
+
+logger = logging.getLogger("VLMWebAsync")
+
+
+def _mjpeg_part(jpeg):
+    """将JPEG数据包装为multipart MJPEG的一部分"""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+
+
+class AsyncWebApp:
+    """异步Web应用类（ASGI）"""
+
+    def __init__(self, flask_app, receiver, chat_service, frame_interval: float = 0.033,
+                 heartbeat_interval: float = 15):
+        """
+        初始化异步Web应用
+
+        Args:
+            flask_app: 处理其余路由的Flask应用
+            receiver (UnifiedReceiver): 统一接收器
+            chat_service (ChatService): 聊天服务
+            frame_interval (float): 检查新视频帧的间隔（秒）
+            heartbeat_interval (float): SSE心跳间隔（秒）
+        """
+        self.wsgi_app = WsgiToAsgi(flask_app)
+        self.receiver = receiver
+        self.chat_service = chat_service
+        self.frame_interval = frame_interval
+        self.heartbeat_interval = heartbeat_interval
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self.frame_pump_task: Optional[asyncio.Task] = None
+
+        # 新视频帧和新事件的通知信号，每次触发后替换为新的Event
+        self.frame_signal: Optional[asyncio.Event] = None
+        self.event_signal: Optional[asyncio.Event] = None
+
+    async def __call__(self, scope, receive, send):
+        """ASGI入口"""
+        if scope['type'] == 'lifespan':
+            await self._handle_lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http':
+            path = scope['path']
+            method = scope['method']
+            if path == '/video_feed' and method == 'GET':
+                await self.video_feed(scope, receive, send)
+                return
+            if path == '/events' and method == 'GET':
+                await self.events(scope, receive, send)
+                return
+            if path == '/chat' and method == 'POST':
+                await self.chat(scope, receive, send)
+                return
+
+        await self.wsgi_app(scope, receive, send)
+
+    async def _handle_lifespan(self, receive, send):
+        """处理服务器启动和关闭"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self):
+        """创建共享的HTTP客户端和通知信号"""
+        self.loop = asyncio.get_running_loop()
+        self.http_client = httpx.AsyncClient(timeout=self.chat_service.timeout)
+        self.frame_signal = asyncio.Event()
+        self.event_signal = asyncio.Event()
+
+        # 接收线程发布事件时唤醒事件循环
+        self.receiver.broadcaster.add_listener(
+            lambda event_id: self.loop.call_soon_threadsafe(self._notify_events)
+        )
+        # 所有观看者共用一个任务检查新帧，而不是每个连接各自轮询
+        self.frame_pump_task = asyncio.create_task(self._frame_pump())
+        logger.info("Async web app started")
+
+    async def shutdown(self):
+        """关闭HTTP客户端和后台任务"""
+        if self.frame_pump_task:
+            self.frame_pump_task.cancel()
+        if self.http_client:
+            await self.http_client.aclose()
+        logger.info("Async web app stopped")
+
+    def _notify_events(self):
+        """唤醒所有等待新事件的SSE连接"""
+        signal, self.event_signal = self.event_signal, asyncio.Event()
+        signal.set()
+
+    async def _frame_pump(self):
+        """检查是否有新视频帧，有则唤醒所有观看者"""
+        last_seq = -1
+        while True:
+            seq, jpeg = self.receiver.get_frame_jpeg()
+            if jpeg is not None and seq != last_seq:
+                last_seq = seq
+                signal, self.frame_signal = self.frame_signal, asyncio.Event()
+                signal.set()
+            await asyncio.sleep(self.frame_interval)
+
+    @staticmethod
+    def _watch_disconnect(receive) -> asyncio.Event:
+        """
+        在后台等待客户端断开连接
+
+        Returns:
+            asyncio.Event: 客户端断开时被设置
+        """
+        disconnected = asyncio.Event()
+
+        async def watch():
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    disconnected.set()
+                    return
+
+        disconnected.task = asyncio.create_task(watch())
+        return disconnected
+
+    @staticmethod
+    async def _wait_any(signal: asyncio.Event, disconnected: asyncio.Event, timeout: float):
+        """等待信号、客户端断开或超时，以先发生者为准"""
+        waiters = [asyncio.create_task(signal.wait()), asyncio.create_task(disconnected.wait())]
+        try:
+            await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    @staticmethod
+    async def _send_json(send, data, status=200):
+        """发送JSON响应"""
+        body = json.dumps(data).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'),
+                        (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def video_feed(self, scope, receive, send):
+        """视频流路由（MJPEG）"""
+        disconnected = self._watch_disconnect(receive)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+                        (b'cache-control', b'no-cache')]
+        })
+
+        last_seq = -1
+        try:
+            while not disconnected.is_set():
+                signal = self.frame_signal
+                seq, jpeg = self.receiver.get_frame_jpeg()
+                if jpeg is not None and seq != last_seq:
+                    last_seq = seq
+                    await send({'type': 'http.response.body', 'body': _mjpeg_part(jpeg), 'more_body': True})
+                # 慢速客户端会直接跳到最新帧，不会积压
+                await self._wait_any(signal, disconnected, timeout=1.0)
+        except OSError:
+            pass
+        finally:
+            disconnected.task.cancel()
+
+    async def events(self, scope, receive, send):
+        """SSE事件推送路由"""
+        headers = dict(scope['headers'])
+        query = parse_qs(scope.get('query_string', b'').decode())
+        last_event_id = headers.get(b'last-event-id', b'').decode() or query.get('last_event_id', [None])[0]
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            last_event_id = None
+
+        broadcaster = self.receiver.broadcaster
+        disconnected = self._watch_disconnect(receive)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream'),
+                        (b'cache-control', b'no-cache'),
+                        (b'x-accel-buffering', b'no')]
+        })
+
+        try:
+            await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+
+            # 先补发错过的事件（新连接则发送当前快照）
+            events, cursor = broadcaster.get_events_since(last_event_id)
+            if events or cursor != last_event_id:
+                chunk = EventBroadcaster.format_sse(events, cursor)
+                await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+
+            while not disconnected.is_set():
+                # 先取信号再检查事件，避免错过两次检查之间发布的事件
+                signal = self.event_signal
+                events, cursor = broadcaster.get_events_since(cursor)
+                if not events:
+                    await self._wait_any(signal, disconnected, timeout=self.heartbeat_interval)
+                    if disconnected.is_set():
+                        break
+                    events, cursor = broadcaster.get_events_since(cursor)
+
+                if events:
+                    chunk = EventBroadcaster.format_sse(events, cursor)
+                else:
+                    # 心跳注释，保持连接
+                    chunk = ': keep-alive\n\n'
+                await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        except OSError:
+            pass
+        finally:
+            disconnected.task.cancel()
+
+    async def chat(self, scope, receive, send):
+        """与vLLM对话的路由"""
+        body = b''
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        try:
+            data = json.loads(body)
+            if not isinstance(data, dict):
+                raise ValueError("JSON body must be an object")
+        except ValueError as e:
+            logger.error(f"Error parsing JSON data: {e}")
+            await self._send_json(send, {'error': f'Error parsing JSON data: {e}'}, status=400)
+            return
+
+        user_message = data.get('message', '')
+        session_id = self.chat_service.normalize_session_id(data.get('session_id'))
+        if data.get('stream'):
+            await self.chat_stream(user_message, session_id, receive, send)
+            return
+
+        try:
+            # 等待vLLM响应期间不占用线程
+            response_text = ''.join([token async for token in self._answer_tokens(user_message, session_id)]).strip()
+
+            self.chat_service.save_chat_record(user_message, response_text, session_id)
+        except Exception as e:
+            logger.error(f"Chat error: {e}")
+            await self._send_json(send, {'error': str(e)}, status=500)
+            return
+
+        await self._send_json(send, {
+            'response': response_text,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+    async def _answer_tokens(self, user_message, session_id=None):
+        """
+        逐token产生回答：命中回答缓存时直接回放，相同问题正在生成时跟随该生成，
+        否则启动新的生成任务；退出（包括被取消）时取消订阅
+
+        Args:
+            user_message (str): 用户消息
+            session_id (str): 聊天会话ID
+
+        Yields:
+            str: 回答的token文本
+        """
+        answer_cache = self.chat_service.answer_cache
+        # 首次访问某个会话时需要从数据库加载记忆，放到线程池中执行
+        key = await asyncio.to_thread(self.chat_service.cache_key, user_message, session_id)
+        entry, is_new = answer_cache.acquire(key)
+        wakeup = asyncio.Event()
+
+        def notify():
+            self.loop.call_soon_threadsafe(wakeup.set)
+
+        entry.add_listener(notify)
+        try:
+            if is_new:
+                # 生成任务不属于任何一个连接，所有订阅者都断开后才会被取消
+                task = asyncio.create_task(self._generate_into(entry, user_message, session_id))
+                entry.on_cancel = lambda: self.loop.call_soon_threadsafe(task.cancel)
+
+            index = 0
+            while True:
+                wakeup.clear()
+                tokens, done, error = entry.read(index)
+                index += len(tokens)
+                for token in tokens:
+                    yield token
+                if error is not None:
+                    raise RuntimeError(error)
+                if done:
+                    return
+                await wakeup.wait()
+        finally:
+            entry.remove_listener(notify)
+            answer_cache.release(entry)
+
+    async def _generate_into(self, entry, user_message, session_id=None):
+        """
+        流式调用vLLM生成回答并写入缓存条目
+
+        任务被取消时退出httpx的流式上下文会关闭到vLLM的连接，Ollama随之停止生成
+
+        Args:
+            entry (AnswerEntry): 回答缓存条目
+            user_message (str): 用户消息
+            session_id (str): 聊天会话ID
+        """
+        answer_cache = self.chat_service.answer_cache
+        try:
+            # 查询数据库为阻塞操作，放到线程池中执行
+            prompt = await asyncio.to_thread(self.chat_service.build_prompt, user_message, session_id)
+            vllm_data = self.chat_service.build_request(prompt, stream=True)
+            async with self.http_client.stream('POST', self.chat_service.ollama_url, json=vllm_data) as response:
+                if response.status_code != 200:
+                    raise RuntimeError(self.chat_service.parse_response(response.status_code, None))
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    token, done = self.chat_service.parse_stream_line(line)
+                    if token:
+                        entry.append(token)
+                    if done:
+                        break
+            answer_cache.finish(entry)
+        except asyncio.CancelledError:
+            logger.info("Chat generation cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Chat generation error: {e}")
+            answer_cache.fail(entry, str(e))
+
+    async def chat_stream(self, user_message, session_id, receive, send):
+        """
+        流式聊天响应（SSE格式）
+
+        客户端断开时取消转发任务并取消订阅，没有其他请求在等待同一回答时生成任务会被取消；
+        只有完整生成的回答才会保存为聊天记录
+        """
+        disconnected = self._watch_disconnect(receive)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream'),
+                        (b'cache-control', b'no-cache'),
+                        (b'x-accel-buffering', b'no')]
+        })
+
+        async def send_event(event, data, more_body=True):
+            chunk = self.chat_service.format_stream_event(event, data).encode('utf-8')
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+
+        async def relay():
+            parts = []
+            async for token in self._answer_tokens(user_message, session_id):
+                parts.append(token)
+                await send_event('token', {'token': token})
+
+            response_text = ''.join(parts).strip()
+            self.chat_service.save_chat_record(user_message, response_text, session_id)
+            await send_event('done', {
+                'response': response_text,
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }, more_body=False)
+
+        relay_task = asyncio.create_task(relay())
+        disconnect_task = asyncio.create_task(disconnected.wait())
+        try:
+            await asyncio.wait([relay_task, disconnect_task], return_when=asyncio.FIRST_COMPLETED)
+            if not relay_task.done():
+                relay_task.cancel()
+                logger.info("Chat stream cancelled by client")
+            elif relay_task.exception() is not None:
+                logger.error(f"Chat stream error: {relay_task.exception()}")
+                await send_event('error', {'error': str(relay_task.exception())}, more_body=False)
+        except OSError:
+            pass
+        finally:
+            disconnect_task.cancel()
+            disconnected.task.cancel()
+
+
+def run_async_server(flask_app, receiver, chat_service, web_port=5001, host='0.0.0.0'):
+    """
+    使用uvicorn运行异步Web服务
+
+    Args:
+        flask_app: Flask应用
+        receiver (UnifiedReceiver): 统一接收器
+        chat_service (ChatService): 聊天服务
+        web_port (int): Web服务端口
+        host (str): 监听地址
+    """
+    import uvicorn
+
+    asgi_app = AsyncWebApp(flask_app, receiver, chat_service)
+    uvicorn.run(asgi_app, host=host, port=web_port, log_level="warning", lifespan="on")
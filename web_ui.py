@@ -5,7 +5,9 @@ VLM Demo Web UI
 该模块实现了Web界面，用于显示视频流、分析结果和与vLLM交互
 """
 
+import atexit
 import cv2
+import signal
 import socket
 import threading
 import time
@@ -13,7 +15,7 @@ import numpy as np
 import base64
 import json
 import argparse
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import Flask, render_template, Response, request, jsonify, send_file
 import os
 import logging
@@ -21,14 +23,34 @@ import logging
 # 导入数据可视化接收器
 from models.data_visualizer_receiver import DataVisualizerReceiver
 
-# 导入数据库相关模块
-from models.database import AnalysisRecord, ChatRecord, get_db
+# 导入事件广播器
+from models.event_broadcaster import EventBroadcaster
+
+# 导入聊天上下文窗口
+from models.chat_context import AnalysisContextWindow
+
+# 导入分析历史查询
+from models.analysis_history import AnalysisHistory, parse_danger, parse_datetime
+
+# 导入事件查询
+from models.incidents import IncidentStore
+
+# 导入汇总统计
+from models.rollups import LuxRollupAccumulator, RollupStats
+
+# 导入传感器时间序列存储
+from models.timeseries_store import TimeSeriesStore
+
+# 导入聊天服务
+from services.chat_service import ChatService
+
+# 导入运行指标
+from services.metrics import metrics
+
+# 导入数据库初始化和写入队列
+from models.database import init_db
+from models.db_writer import db_writer
 
-# 设置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger("VLMWebUI")
 
 class UnifiedReceiver:
@@ -46,20 +68,37 @@ class UnifiedReceiver:
         self.socket = None
         self.running = False
         self.frame = None
+        self.frame_jpeg = None
+        self.frame_seq = 0
         self.frame_lock = threading.Lock()
         self.latest_description = None
         self.description_lock = threading.Lock()
         self.latest_analysis_frame = None
         self.analysis_frame_lock = threading.Lock()
         
+        # 事件广播器：有新数据时推送给SSE连接
+        self.broadcaster = EventBroadcaster()
+        
+        # 聊天上下文窗口：收到新的分析结果时增量更新
+        self.context_window = AnalysisContextWindow()
+        
         # 初始化数据可视化接收器
-        self.chart_receiver = DataVisualizerReceiver(port=chart_port, host=host)
+        self.chart_receiver = DataVisualizerReceiver(
+            port=chart_port, host=host,
+            on_data=lambda packet: self.broadcaster.publish("chart", packet)
+        )
         self.latest_chart_data = None
         self.chart_data_lock = threading.Lock()
         
         # 光照度数据
         self.latest_lux_data = None
         self.lux_data_lock = threading.Lock()
+        # 各RS485设备的最新读数（设备名称 -> 数据）
+        self.latest_sensor_data = {}
+        # 光照度小时/天汇总
+        self.lux_rollups = LuxRollupAccumulator()
+        # 光照度原始读数（按天分区的时间序列文件）
+        self.lux_series = TimeSeriesStore('lux')
         
     def start_receiver(self):
         """启动统一接收器"""
@@ -75,6 +114,9 @@ class UnifiedReceiver:
         
         # 启动数据可视化接收器
         self.chart_receiver.start_receiver()
+
+        # 进程以任何方式正常退出时都保存缓冲的光照度读数
+        atexit.register(self.flush_sensor_data)
         
     def _receive_data(self):
         """在后台线程中接收视频帧和描述信息"""
@@ -100,9 +142,11 @@ class UnifiedReceiver:
                         
                         if frame is not None:
                             frame_count += 1
-                            # 更新当前帧
+                            # 更新当前帧，同时缓存原始JPEG数据供所有观看者复用
                             with self.frame_lock:
                                 self.frame = frame
+                                self.frame_jpeg = image_data
+                                self.frame_seq += 1
                             
                             # 每30帧打印一次信息
                             if frame_count % 30 == 0:
@@ -137,6 +181,11 @@ class UnifiedReceiver:
                                 'text': description,
                                 'timestamp': timestamp
                             }
+                        self.broadcaster.publish("analysis", {
+                            'text': description,
+                            'timestamp': timestamp
+                        })
+                        self.update_context_window(description, timestamp)
                         
                         # 更新分析帧（如果有）
                         if frame_data:
@@ -177,6 +226,10 @@ class UnifiedReceiver:
                                 'text': analysis_data,
                                 'timestamp': timestamp
                             }
+                        self.broadcaster.publish("analysis", {
+                            'text': analysis_data,
+                            'timestamp': timestamp
+                        })
                         logger.info(f"Updated latest_description: {self.latest_description}")
                         
                         # 打印vLLM响应信息
@@ -187,14 +240,42 @@ class UnifiedReceiver:
                         else:
                             logger.info(f"[VLLM RESPONSE {desc_count} from {addr} at {timestamp}] {analysis_data}")
                             
+                elif packet_type == "incident":
+                    # 处理事件更新（分析结果合并到事件后发送，聊天上下文以事件为单位）
+                    incident = packet.get("data")
+                    if isinstance(incident, dict) and incident.get('start_date'):
+                        self.context_window.update_incident(incident)
+                        self.broadcaster.publish("incident", incident)
+                        if incident.get('opened'):
+                            logger.info(f"[INCIDENT from {addr}] {incident.get('camera_id')} "
+                                        f"{'danger' if incident.get('danger') else 'safe'} since {incident['start_date']}")
+                        
                 elif packet_type == "sensor_data":
                     # 处理传感器数据
                     sensor_data = packet.get("data")
                     if sensor_data is not None:
-                        # 更新最新光照度数据
                         with self.lux_data_lock:
-                            self.latest_lux_data = sensor_data
-                        logger.info(f"[SENSOR DATA from {addr}] Lux: {sensor_data.get('lux', 'N/A')} {sensor_data.get('unit', '')}")
+                            self.latest_sensor_data[sensor_data.get('device', 'lux_sensor')] = sensor_data
+                        if 'lux' in sensor_data:
+                            # 更新最新光照度数据
+                            with self.lux_data_lock:
+                                self.latest_lux_data = sensor_data
+                            self.broadcaster.publish("lux", sensor_data)
+                            if sensor_data.get('lux') is not None:
+                                # 传感器只在超出死区或心跳时发送，汇总按附带的原始读数聚合累加（旧版发送端没有stats）
+                                lux_stats = (sensor_data.get('stats') or {}).get('lux')
+                                if lux_stats and lux_stats.get('samples'):
+                                    self.lux_rollups.add_aggregate(lux_stats['mean'], lux_stats['min'], lux_stats['max'],
+                                                                   lux_stats['samples'], sensor_data.get('timestamp'))
+                                else:
+                                    self.lux_rollups.add(sensor_data['lux'], sensor_data.get('timestamp'))
+                                self.lux_series.append(sensor_data.get('timestamp') or time.time(), sensor_data['lux'])
+                            logger.info(f"[SENSOR DATA from {addr}] Lux: {sensor_data.get('lux', 'N/A')} {sensor_data.get('unit', '')}")
+                        else:
+                            self.broadcaster.publish("sensor", sensor_data)
+                            readings = {key: value for key, value in sensor_data.items()
+                                        if key not in ('device', 'address', 'timestamp', 'units', 'stats')}
+                            logger.info(f"[SENSOR DATA from {addr}] {sensor_data.get('device', 'N/A')}: {readings}")
                         
             except json.JSONDecodeError:
                 # 如果不是JSON格式，假设是旧格式的视频帧
@@ -207,6 +288,8 @@ class UnifiedReceiver:
                         # 更新当前帧
                         with self.frame_lock:
                             self.frame = frame
+                            self.frame_jpeg = bytes(data)
+                            self.frame_seq += 1
                         
                         # 每30帧打印一次信息
                         if frame_count % 30 == 0:
@@ -216,11 +299,37 @@ class UnifiedReceiver:
             except Exception as e:
                 logger.error(f"Error receiving data: {e}")
                 
+    def update_context_window(self, analysis, timestamp):
+        """
+        将收到的分析结果追加到聊天上下文窗口（只用于不发送事件更新的旧格式分析结果）
+        
+        Args:
+            analysis: 分析结果（包含description和danger的字典）
+            timestamp (str): 分析时间
+        """
+        if isinstance(analysis, dict) and 'description' in analysis:
+            self.context_window.add(
+                analysis.get('id'),
+                timestamp,
+                analysis['description'],
+                bool(analysis.get('danger'))
+            )
+            
     def get_frame(self):
         """获取当前帧"""
         with self.frame_lock:
             return self.frame.copy() if self.frame is not None else None
             
+    def get_frame_jpeg(self):
+        """
+        获取当前帧的JPEG数据
+        
+        Returns:
+            tuple: (帧序号, JPEG字节数据)，没有帧时JPEG数据为None
+        """
+        with self.frame_lock:
+            return self.frame_seq, self.frame_jpeg
+            
     def get_latest_description(self):
         """获取最新描述"""
         with self.description_lock:
@@ -247,12 +356,30 @@ class UnifiedReceiver:
         # 从数据可视化接收器获取最新数据
         chart_data = self.chart_receiver.get_latest_data()
         return chart_data
+    
+    def get_chart_series(self, names=None, since=None, points=None, window=None):
+        """
+        获取图表序列的历史读数
+        
+        Args:
+            names (list): 序列名称，为None时返回所有序列
+            since (float): 只返回时间戳大于since的读数
+            points (int): 每个序列最多返回的点数
+            window (float): 只返回最近window秒的读数
+        """
+        start = time.time() - window if window else None
+        return self.chart_receiver.query_series(names, since=since, start=start, points=points)
             
     def get_latest_lux_data(self):
         """获取最新的光照度数据"""
         with self.lux_data_lock:
             return self.latest_lux_data.copy() if self.latest_lux_data else None
             
+    def get_latest_sensor_data(self):
+        """获取各RS485设备的最新读数"""
+        with self.lux_data_lock:
+            return {name: data.copy() for name, data in self.latest_sensor_data.items()}
+            
     def stop_receiver(self):
         """停止统一接收器"""
         self.running = False
@@ -260,29 +387,43 @@ class UnifiedReceiver:
             self.socket.close()
         # 停止数据可视化接收器
         self.chart_receiver.stop_receiver()
+        self.flush_sensor_data()
         logger.info("Unified receiver stopped")
 
+    def flush_sensor_data(self):
+        """保存尚未写入的光照度汇总和读数"""
+        self.lux_rollups.flush()
+        self.lux_series.flush()
+
 
 # Flask应用
 app = Flask(__name__)
 unified_receiver = None
+chat_service = ChatService()
+analysis_history = AnalysisHistory()
+incident_store = IncidentStore()
+rollup_stats = RollupStats()
+
+# SSE心跳间隔（秒）
+SSE_HEARTBEAT_INTERVAL = 15
+
+
+def format_mjpeg_part(jpeg):
+    """将JPEG数据包装为multipart MJPEG的一部分"""
+    return (b'--frame\r\n'
+            b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
 
 
 def generate_frames():
     """生成视频帧用于网页流传输"""
+    last_seq = -1
     while True:
         if unified_receiver:
-            frame = unified_receiver.get_frame()
-            if frame is not None:
-                try:
-                    # 将帧编码为JPEG格式
-                    ret, buffer = cv2.imencode('.jpg', frame)
-                    if ret:
-                        # 将帧作为字节流返回
-                        yield (b'--frame\r\n'
-                               b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-                except Exception as e:
-                    logger.error(f"Error encoding frame: {e}")
+            # 直接复用接收到的JPEG数据，只在有新帧时发送，避免每个观看者重复编码
+            seq, jpeg = unified_receiver.get_frame_jpeg()
+            if jpeg is not None and seq != last_seq:
+                last_seq = seq
+                yield format_mjpeg_part(jpeg)
         # 控制帧率
         time.sleep(0.033)  # 约30 FPS
 
@@ -300,6 +441,52 @@ def video_feed():
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 
+def generate_events(last_event_id):
+    """
+    生成SSE事件流
+
+    Args:
+        last_event_id (int): 客户端最后收到的事件ID，None表示新连接
+    """
+    broadcaster = unified_receiver.broadcaster
+    # 告诉浏览器断线后3秒重连
+    yield "retry: 3000\n\n"
+    
+    # 先补发错过的事件（新连接则发送当前快照）
+    events, cursor = broadcaster.get_events_since(last_event_id)
+    if events or cursor != last_event_id:
+        yield EventBroadcaster.format_sse(events, cursor)
+    
+    while True:
+        events, cursor = broadcaster.wait_for_events(cursor, timeout=SSE_HEARTBEAT_INTERVAL)
+        if events:
+            yield EventBroadcaster.format_sse(events, cursor)
+        else:
+            # 心跳注释，保持连接并及时发现断开的客户端
+            yield ": keep-alive\n\n"
+
+
+@app.route('/events')
+def events():
+    """SSE事件推送路由（分析结果、光照度和图表数据）"""
+    if not unified_receiver:
+        return Response('', status=503)
+    
+    # 浏览器自动重连时会带上Last-Event-ID请求头
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    return Response(generate_events(last_event_id),
+                    mimetype='text/event-stream',
+                    headers={
+                        'Cache-Control': 'no-cache',
+                        'X-Accel-Buffering': 'no'
+                    })
+
+
 @app.route('/latest_description')
 def latest_description():
     """获取最新描述的路由"""
@@ -321,11 +508,27 @@ def latest_analysis_frame():
 
 @app.route('/latest_chart_data')
 def latest_chart_data():
-    """获取最新图表数据的路由"""
-    if unified_receiver:
-        chart_data = unified_receiver.get_latest_chart_data()
+    """
+    获取最新图表数据的路由
+
+    带以下任一查询参数时同时返回各序列的历史读数（series字段）:
+    series（逗号分隔的序列名称，默认全部）、since（只返回该时间戳之后的读数，用于增量更新）、
+    points（每个序列最多返回的点数，LTTB降采样，默认500）、window（最近多少秒，默认全部保留的读数）
+    """
+    if not unified_receiver:
+        return jsonify({'chart_data': None})
+    chart_data = unified_receiver.get_latest_chart_data()
+    if not any(key in request.args for key in ('series', 'since', 'points', 'window')):
         return jsonify({'chart_data': chart_data})
-    return jsonify({'chart_data': None})
+    try:
+        names = [name for name in request.args.get('series', '').split(',') if name] or None
+        since = float(request.args['since']) if request.args.get('since') else None
+        points = max(2, min(int(request.args.get('points', 500)), 5000))
+        window = float(request.args['window']) if request.args.get('window') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    series = unified_receiver.get_chart_series(names, since=since, points=points, window=window)
+    return jsonify({'chart_data': chart_data, 'series': series})
 
 
 @app.route('/latest_lux_data')
@@ -337,6 +540,140 @@ def latest_lux_data():
     return jsonify({'lux_data': None})
 
 
+@app.route('/latest_sensor_data')
+def latest_sensor_data():
+    """获取各RS485设备最新读数的路由"""
+    if unified_receiver:
+        return jsonify({'sensors': unified_receiver.get_latest_sensor_data()})
+    return jsonify({'sensors': {}})
+
+
+@app.route('/analyses')
+def analyses():
+    """
+    分页浏览分析历史的路由
+
+    查询参数: start、end（时间范围）、danger（true/false）、camera、cursor（上一页返回的next_cursor）、limit
+    """
+    try:
+        result = analysis_history.query(
+            start=parse_datetime(request.args.get('start')),
+            end=parse_datetime(request.args.get('end')),
+            danger=parse_danger(request.args.get('danger')),
+            camera_id=request.args.get('camera') or None,
+            cursor=request.args.get('cursor') or None,
+            limit=int(request.args.get('limit', 50))
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error querying analysis history: {e}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify(result)
+
+
+@app.route('/analyses/summary')
+def analyses_summary():
+    """分析记录统计的路由（读取计数表，不扫描记录表）"""
+    try:
+        return jsonify(analysis_history.summary(camera_id=request.args.get('camera') or None))
+    except Exception as e:
+        logger.error(f"Error reading analysis summary: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/incidents')
+def incidents():
+    """
+    分页浏览事件（连续、结论相同的分析记录合并而成）的路由
+
+    查询参数: start、end（时间范围）、danger（true/false）、camera、cursor（上一页返回的next_cursor）、limit
+    """
+    try:
+        result = incident_store.query(
+            start=parse_datetime(request.args.get('start')),
+            end=parse_datetime(request.args.get('end')),
+            danger=parse_danger(request.args.get('danger')),
+            camera_id=request.args.get('camera') or None,
+            cursor=request.args.get('cursor') or None,
+            limit=int(request.args.get('limit', 50))
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error querying incidents: {e}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify(result)
+
+
+@app.route('/incidents/<int:incident_id>/frame')
+def incident_frame(incident_id):
+    """获取事件代表帧图像的路由"""
+    try:
+        path = incident_store.frame_path(incident_id)
+    except Exception as e:
+        logger.error(f"Error serving incident frame: {e}")
+        return jsonify({'error': str(e)}), 500
+    if path is None:
+        return jsonify({'error': 'Frame not found'}), 404
+    return send_file(path, mimetype='image/jpeg')
+
+
+@app.route('/stats')
+def stats():
+    """
+    按小时/天的统计路由（只读取汇总表）
+
+    查询参数: bucket（hour/day）、start、end（时间范围）、camera
+    """
+    try:
+        result = rollup_stats.query(
+            bucket=request.args.get('bucket', 'hour'),
+            start=parse_datetime(request.args.get('start')),
+            end=parse_datetime(request.args.get('end')),
+            camera_id=request.args.get('camera') or None
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error reading rollup stats: {e}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify(result)
+
+
+@app.route('/sensor_history')
+def sensor_history():
+    """
+    光照度历史曲线的路由（按时间分桶降采样）
+
+    查询参数: start、end（时间范围，默认最近1小时）、points（最多返回的点数，默认500）
+    """
+    if not unified_receiver:
+        return jsonify({'error': 'Receiver not started'}), 503
+    try:
+        end = parse_datetime(request.args.get('end')) or datetime.now()
+        start = parse_datetime(request.args.get('start')) or end - timedelta(hours=1)
+        points = max(1, min(int(request.args.get('points', 500)), 5000))
+        if start >= end:
+            raise ValueError("start must be earlier than end")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        series = unified_receiver.lux_series.downsample(start, end, max_points=points)
+    except Exception as e:
+        logger.error(f"Error reading sensor history: {e}")
+        return jsonify({'error': str(e)}), 500
+    series.update({'series': 'lux', 'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+                   'end': end.strftime('%Y-%m-%d %H:%M:%S')})
+    return jsonify(series)
+
+
+@app.route('/metrics')
+def metrics_view():
+    """获取运行指标（聊天预填充耗时等）的路由"""
+    return jsonify(metrics.snapshot())
+
+
 @app.route('/analysis_frame_image')
 def analysis_frame_image():
     """获取最新分析帧图像的路由"""
@@ -351,6 +688,42 @@ def analysis_frame_image():
         return Response('', mimetype='image/jpeg')
 
 
+def generate_chat_stream(user_message, session_id=None):
+    """
+    生成流式聊天响应（SSE格式）
+
+    客户端断开时Werkzeug会关闭该生成器并取消订阅，没有其他请求在等待同一回答时
+    会关闭到vLLM的连接以停止生成；只有完整生成的回答才会保存为聊天记录
+
+    Args:
+        user_message (str): 用户消息
+        session_id (str): 聊天会话ID
+    """
+    tokens = None
+    try:
+        tokens = chat_service.stream_answer(user_message, session_id)
+        parts = []
+        for token in tokens:
+            parts.append(token)
+            yield ChatService.format_stream_event('token', {'token': token})
+        
+        response_text = ''.join(parts).strip()
+        chat_service.save_chat_record(user_message, response_text, session_id)
+        yield ChatService.format_stream_event('done', {
+            'response': response_text,
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+    except GeneratorExit:
+        logger.info("Chat stream cancelled by client")
+        raise
+    except Exception as e:
+        logger.error(f"Chat stream error: {e}")
+        yield ChatService.format_stream_event('error', {'error': str(e)})
+    finally:
+        if tokens is not None:
+            tokens.close()
+
+
 @app.route('/chat', methods=['POST'])
 def chat():
     """与vLLM对话的路由"""
@@ -370,95 +743,22 @@ def chat():
             return jsonify({'error': f'Error parsing JSON data: {e}'}), 400
             
         user_message = data.get('message', '')
+        session_id = ChatService.normalize_session_id(data.get('session_id'))
         
-        # 从数据库获取最近的20条分析记录作为上下文
-        context = ""
-        try:
-            # 获取数据库会话
-            db_gen = get_db()
-            db = next(db_gen)
-            
-            # 查询最近的20条记录
-            records = db.query(AnalysisRecord).order_by(AnalysisRecord.date.desc()).limit(20).all()
-            
-            # 构造上下文字符串
-            for record in reversed(records):  # 按时间顺序排列
-                context += f"""
-                **time**: {record.date.strftime('%Y-%m-%d %H:%M:%S')}
-                **danger**: {'yes' if record.danger else 'no'}
-                **description**: {record.description}
-                """
-            
-            # 关闭数据库会话
-            try:
-                next(db_gen)
-            except StopIteration:
-                pass
-                
-        except Exception as e:
-            logger.error(f"从数据库获取历史记录时出错: {e}")
+        # 浏览器请求流式响应时，逐token推送回答
+        if data.get('stream'):
+            return Response(generate_chat_stream(user_message, session_id),
+                            mimetype='text/event-stream',
+                            headers={
+                                'Cache-Control': 'no-cache',
+                                'X-Accel-Buffering': 'no'
+                            })
         
-        # 如果没有历史数据，提供一个默认的提示
-        if not context:
-            context = "No previous analysis data available."
-        
-        # 构造一个详细的提示，指导vLLM如何使用历史数据回答问题
-        full_prompt = f"""You are an intelligent security monitoring assistant. Please provide an answer based on the following historical data and the user's question.
-
-Historical Data:
-{context}
-
-User Question:
-{user_message}
-
-Please provide an accurate and helpful answer based on the historical data. If the question cannot be answered with the provided data, please state so clearly."""
-
-        # 准备发送给vLLM的数据
-        vllm_data = {
-            "model": "gemma3:4b",  # 根据实际模型名称调整
-            "prompt": full_prompt,
-            "stream": False,
-            "max_tokens": 500,
-            "temperature": 0
-        }
-        
-        # 发送请求到vLLM
-        import requests
-        response = requests.post("http://localhost:11434/api/generate", json=vllm_data, timeout=30)
-        
-        if response.status_code == 200:
-            response_data = response.json()
-            response_text = response_data.get("response", "").strip()
-        else:
-            response_text = f"Error: vLLM request failed with status {response.status_code}"
+        # 基于最近的分析记录向vLLM提问
+        response_text = chat_service.generate(user_message, session_id)
         
         # 将对话记录保存到数据库
-        try:
-            # 获取数据库会话
-            db_gen = get_db()
-            db = next(db_gen)
-            
-            # 创建新的聊天记录
-            chat_record = ChatRecord(
-                user_message=user_message,
-                assistant_response=response_text
-            )
-            
-            # 添加到数据库
-            db.add(chat_record)
-            db.commit()
-            db.refresh(chat_record)
-            
-            logger.info(f"聊天记录已保存到数据库，ID: {chat_record.id}")
-            
-            # 关闭数据库会话
-            try:
-                next(db_gen)
-            except StopIteration:
-                pass
-                
-        except Exception as e:
-            logger.error(f"保存聊天记录到数据库时出错: {e}")
+        chat_service.save_chat_record(user_message, response_text, session_id)
         
         return jsonify({
             'response': response_text,
@@ -469,39 +769,80 @@ Please provide an accurate and helpful answer based on the historical data. If t
         return jsonify({'error': str(e)}), 500
 
 
-def start_web_ui(port=5000, host='localhost', web_port=5001, chart_port=5002):
-    """启动Web UI服务器"""
-    global unified_receiver
+def _handle_sigterm(signum, frame):
+    """收到SIGTERM（systemd或容器停止）时按正常退出处理，执行start_web_ui的清理"""
+    raise SystemExit(0)
+
+
+def start_web_ui(port=5000, host='localhost', web_port=5001, chart_port=5002, server='flask',
+                 ollama_url="http://localhost:11434/api/generate", model_name="gemma3:4b"):
+    """
+    启动Web UI服务器
+    
+    Args:
+        server (str): "flask"使用Flask开发服务器（每个连接一个线程），
+                      "async"使用ASGI异步服务器（视频流、SSE和vLLM调用均为协程）
+    """
+    global unified_receiver, chat_service
     
-    # 初始化统一接收器
+    # 建表和迁移（导入模块时不访问数据库）
+    init_db()
+    
+    # 初始化统一接收器，并从数据库加载一次聊天上下文，之后随收到的分析结果增量更新
     unified_receiver = UnifiedReceiver(port=port, host=host, chart_port=chart_port)
+    unified_receiver.context_window.load_from_db()
     unified_receiver.start_receiver()
     
-    logger.info(f"Starting web server on http://localhost:{web_port}")
+    # 初始化聊天服务
+    chat_service = ChatService(ollama_url=ollama_url, model_name=model_name,
+                               context_window=unified_receiver.context_window)
+    
+    logger.info(f"Starting {server} web server on http://localhost:{web_port}")
     logger.info("Press Ctrl+C to stop")
+
+    # 默认的SIGTERM处理会直接结束进程，缓冲的光照度读数和写入队列中的记录会丢失
+    signal.signal(signal.SIGTERM, _handle_sigterm)
     
     try:
-        # 启动Flask应用
-        app.run(host='0.0.0.0', port=web_port, debug=False, threaded=True)
+        if server == 'async':
+            # 异步服务依赖为可选依赖，仅在使用时导入
+            from web_asgi import run_async_server
+            run_async_server(app, unified_receiver, chat_service, web_port=web_port)
+        else:
+            # 启动Flask应用
+            app.run(host='0.0.0.0', port=web_port, debug=False, threaded=True)
     except KeyboardInterrupt:
         logger.info("\nStopping web server...")
     finally:
         unified_receiver.stop_receiver()
+        # 写完数据库写入队列中的聊天记录
+        db_writer.stop()
 
 
 def main():
     """主函数"""
+    # 设置日志
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
     # 设置命令行参数
     parser = argparse.ArgumentParser(description="VLM Demo Web UI")
     parser.add_argument("--port", type=int, default=5000, help="UDP port for receiving data (default: 5000)")
     parser.add_argument("--host", type=str, default="localhost", help="Host for UDP receiving (default: localhost)")
     parser.add_argument("--web-port", type=int, default=5001, help="Port for web server (default: 5001)")
     parser.add_argument("--chart-port", type=int, default=5002, help="Port for chart data receiving (default: 5002)")
+    parser.add_argument("--server", type=str, choices=["flask", "async"], default="flask",
+                        help="Web server mode: flask (threaded dev server) or async (ASGI via uvicorn) (default: flask)")
+    parser.add_argument("--ollama-url", type=str, default="http://localhost:11434/api/generate",
+                        help="Ollama generate API URL used by chat (default: http://localhost:11434/api/generate)")
+    parser.add_argument("--model", type=str, default="gemma3:4b", help="Model name used by chat (default: gemma3:4b)")
     
     args = parser.parse_args()
     
-    start_web_ui(port=args.port, host=args.host, web_port=args.web_port, chart_port=args.chart_port)
+    start_web_ui(port=args.port, host=args.host, web_port=args.web_port, chart_port=args.chart_port,
+                 server=args.server, ollama_url=args.ollama_url, model_name=args.model)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()